@@ -4,9 +4,10 @@ from flask import Flask, redirect, url_for, jsonify
 from dotenv import load_dotenv
 from sqlalchemy import text
 from werkzeug.middleware.proxy_fix import ProxyFix
-from app.scheduler import start_notification_scheduler 
+from app.scheduler import start_notification_scheduler, get_scheduler_status
 from .config import Config
 from app.db.db import Base, engine
+from app.db.migrations import run_migrations
 
 load_dotenv()
 
@@ -52,6 +53,15 @@ def create_app():
     app.register_blueprint(instructor_bp)  
     app.register_blueprint(admin_success_return_bp)
     app.register_blueprint(notifications_bp)
+
+    # ----- Images -----
+    from app.services.image_pipeline import register_image_commands
+    from app.services.image_resolver import ImageResolver
+    from app.services.image_store import init_image_store
+    app.jinja_env.filters["image_url"] = ImageResolver.variant_url  # {{ path|image_url('thumb') }}
+    app.jinja_env.filters["image_src"] = ImageResolver.to_static_url  # ต้นฉบับ (ผ่าน storage)
+    register_image_commands(app)
+    init_image_store(app)  # Cache-Control: immutable + flask images-gc
     # ----- DB bootstrap -----
     with app.app_context():
         from app.db import models  # noqa: F401 (ensure tables discovered)
@@ -62,6 +72,7 @@ def create_app():
                     conn.execute(text("SELECT pg_advisory_lock(987654321)"))
                     locked = True
                 Base.metadata.create_all(bind=conn)
+                run_migrations(conn)
             finally:
                 if locked:
                     conn.execute(text("SELECT pg_advisory_unlock(987654321)"))
@@ -69,7 +80,12 @@ def create_app():
     # ----- Health check -----
     @app.get("/health")
     def health():
-        return jsonify(ok=True), 200
+        # 🗳️ แสดง leader ของ scheduler + อายุ lease (ไม่ให้ health ล้มเพราะ DB)
+        try:
+            scheduler = get_scheduler_status()
+        except Exception as e:
+            scheduler = {"error": str(e)}
+        return jsonify(ok=True, scheduler=scheduler), 200
 
     # ----- Root redirect (เลือกหน้าที่มีอยู่จริง) -----
     @app.get("/")
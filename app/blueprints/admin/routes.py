@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, session  # ✅ เพิ่ม session
+from flask import Blueprint, abort, render_template, request, flash, redirect, url_for, session  # ✅ เพิ่ม session
 from sqlalchemy import text  
 from app.db.db import SessionLocal
 from app.repositories.user_repository import UserRepository
@@ -13,6 +13,7 @@ from app.db.db import engine
 from app.repositories.history_repository import RentHistoryRepository
 from app.services.history_service import BorrowHistoryService
 from app.controllers.admin_history_controller import AdminHistoryController
+from app.services.history_export_service import HistoryExportService
 
 
 # ==============================
@@ -117,10 +118,6 @@ def _hist_svc():
     """Service layer สำหรับดึงประวัติยืม-คืน"""
     return BorrowHistoryService(RentHistoryRepository(SessionLocal()))
 
-def _user_repo():
-    return UserRepository(SessionLocal())
-
-
 @admin_history_bp.get("/", endpoint="index")
 @staff_required
 def admin_history_index():
@@ -128,39 +125,21 @@ def admin_history_index():
     แสดงประวัติการยืม-คืนของผู้ใช้ทุกคน (สำหรับแอดมิน/เจ้าหน้าที่)
     URL: /admin/history/
     """
-    repo = _user_repo()
-    svc = _hist_svc()
-
-    # ดึง user ทั้งหมด (เฉพาะคอลัมน์ที่ต้องใช้)
-    users = repo.session.execute(
-        text("SELECT user_id, name, email, student_id, employee_id FROM users")
-    ).fetchall()
-
-    all_items = []
-    for u in users:
-        u = dict(u._mapping)
-        histories = svc.get_for_user(u["user_id"], returned_only=False)
-        for h in histories:
-            h.update({
-                "user_name": u["name"],
-                "student_id": u["student_id"],
-                "employee_id": u["employee_id"],
-            })
-            all_items.append(h)
-
-    # เรียงจากล่าสุด
-    all_items.sort(key=lambda x: x.get("start_date") or "", reverse=True)
+    try:
+        page = _hist_svc().admin_page(cursor=request.args.get("cursor"))
+    except ValueError:
+        abort(400)
 
-    # ใช้ template เดิมที่คุณมีอยู่แล้ว
-    return render_template("pages_history/admin_all_history.html", items=all_items)
+    # ✅ query เดียวต่อหน้า (join users / equipments / status) แทนการวน query ทีละ user
+    return render_template("pages_history/admin_all_history.html", items=page.items, page=page)
 
 
 # ใช้ factory/guard เดิมของคุณ
 AdminHistoryController(
     bp=admin_history_bp,
     hist_svc_factory=_hist_svc,
-    user_repo_factory=_user_repo,
     staff_guard=staff_required,
+    export_svc_factory=HistoryExportService,
 )
 
 
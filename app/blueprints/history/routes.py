@@ -1,5 +1,5 @@
 from __future__ import annotations
-from flask import render_template, session, redirect, url_for, current_app
+from flask import abort, render_template, request, session, redirect, url_for, current_app
 
 from . import history_bp
 from app.db.db import SessionLocal
@@ -22,6 +22,9 @@ def my_borrow_history():
         current_app.logger.warning("User not found for session email: %s", email)
         return redirect(url_for("auth.logout_action"))
 
-    items = _svc().get_for_user(user["user_id"])
-    return render_template("pages_history/my_history.html", items=items)
+    try:
+        page = _svc().page_for_user(user["user_id"], cursor=request.args.get("cursor"))
+    except ValueError:
+        abort(400)
+    return render_template("pages_history/my_history.html", items=page.items, page=page)
 
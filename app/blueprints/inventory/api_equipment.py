@@ -1,20 +1,55 @@
 from flask.views import MethodView
-from flask import Blueprint, request, Response
+from dataclasses import asdict
+from flask import Blueprint, request, Response, session
 from app.db.models import Equipment
 from app.db.db import SessionLocal
+from app.repositories.equipment_group_repository import EquipmentGroupRepository
+from app.repositories.equipment_search_repository import EquipmentSearchRepository
+from app.services.equipment_bulk_service import EquipmentBulkService
+from app.services.equipment_service import EquipmentService
+from app.utils.decorators import staff_required
+import csv
 import json
 
 api_equipment_bp = Blueprint("api_equipment", __name__, url_prefix="/api/equipments")
 
 class EquipmentAPI(MethodView):
     def get(self):
-        db = SessionLocal()
-        equipments = db.query(Equipment).all()
-        result = [
-            {"id": e.equipment_id, "name": e.name, "status": e.status}
-            for e in equipments
-        ]
-        return Response(json.dumps(result, ensure_ascii=False), mimetype='application/json')
+        """
+        GET /api/equipments/?limit=100&cursor=&status=&category=&fields=id,name,code
+        - format=ndjson (หรือ Accept: application/x-ndjson) → stream ทุกแถว 1 บรรทัดต่อ 1 อุปกรณ์
+        - ส่ง If-None-Match ที่ตรงกับ ETag เดิม → 304 (ข้อมูลไม่เปลี่ยน)
+        """
+        svc = EquipmentService()
+        try:
+            fields = svc.parse_api_fields(request.args.get("fields"))
+            status = request.args.get("status", "").strip()
+            category = request.args.get("category", "").strip()
+            cursor = request.args.get("cursor")
+            limit = request.args.get("limit", 100, type=int)
+            ndjson = (request.args.get("format") == "ndjson"
+                      or request.accept_mimetypes.best == "application/x-ndjson")
+
+            etag = svc.catalog_etag(fields, status, category, cursor, None if ndjson else limit,
+                                    "ndjson" if ndjson else "json")
+            if request.if_none_match.contains_weak(etag):
+                resp = Response(status=304)
+            elif ndjson:
+                lines = (json.dumps(row, ensure_ascii=False) + "\n"
+                         for row in svc.api_stream(fields, status, category))
+                resp = Response(lines, mimetype="application/x-ndjson")
+            else:
+                items, next_cursor = svc.api_page(fields, status, category, cursor=cursor, limit=limit)
+                resp = Response(json.dumps({"items": items, "next_cursor": next_cursor}, ensure_ascii=False),
+                                mimetype='application/json')
+        except ValueError as e:
+            return Response(json.dumps({"error": str(e)}, ensure_ascii=False),
+                            mimetype='application/json', status=400)
+        finally:
+            svc.repo.close()
+        resp.set_etag(etag, weak=True)
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
 
     def post(self):
         db = SessionLocal()
@@ -25,6 +60,8 @@ class EquipmentAPI(MethodView):
             status=data.get("status", "available")
         )
         db.add(eq)
+        EquipmentGroupRepository(db).refresh([eq.name])
+        EquipmentSearchRepository(db).index([eq])
         db.commit()
         db.refresh(eq)
         return Response(
@@ -41,8 +78,11 @@ class EquipmentAPI(MethodView):
                             mimetype='application/json', status=404)
 
         data = request.get_json()
+        old_name = eq.name
         for key, value in data.items():
             setattr(eq, key, value)
+        EquipmentGroupRepository(db).refresh([old_name, eq.name])
+        EquipmentSearchRepository(db).index([eq])
         db.commit()
         db.refresh(eq)
         return Response(json.dumps({"message": "อัปเดตข้อมูลสำเร็จ"}, ensure_ascii=False),
@@ -56,6 +96,8 @@ class EquipmentAPI(MethodView):
                             mimetype='application/json', status=404)
 
         db.delete(eq)
+        EquipmentGroupRepository(db).refresh([eq.name])
+        EquipmentSearchRepository(db).remove([equipment_id])
         db.commit()
         return Response(json.dumps({"message": "ลบอุปกรณ์เรียบร้อยแล้ว"}, ensure_ascii=False),
                         mimetype='application/json')
@@ -65,3 +107,131 @@ api_equipment_bp.add_url_rule("/", view_func=EquipmentAPI.as_view("equipment_api
 
 # ✅ Register route สำหรับ PUT / DELETE (ต้องมี parameter id)
 api_equipment_bp.add_url_rule("/<int:equipment_id>", view_func=EquipmentAPI.as_view("equipment_api_detail"), methods=["PUT", "DELETE"])
+
+
+# ✅ นำเข้าอุปกรณ์ทีละมาก ๆ (CSV / JSON Lines) — แถวที่ผิดถูกข้ามและรายงานกลับ
+@api_equipment_bp.post("/import")
+@staff_required
+def equipment_import():
+    """
+    POST /api/equipments/import?format=csv|jsonl&dry_run=1
+    - ส่งเป็นไฟล์ (multipart field "file") หรือส่ง body ตรง ๆ ก็ได้
+    - format ไม่ระบุ → เดาจากนามสกุลไฟล์ / Content-Type
+    """
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    fmt = request.args.get("format") or _guess_format(upload.filename if upload else "", request.mimetype)
+    svc = EquipmentBulkService()
+    try:
+        report = svc.import_rows(
+            svc.parse(stream, fmt),
+            actor_id=session.get("user_id"),
+            dry_run=request.args.get("dry_run", "").lower() in ("1", "true", "yes"),
+        )
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return Response(json.dumps({"error": f"อ่านไฟล์ไม่สำเร็จ: {e}"}, ensure_ascii=False),
+                        mimetype='application/json', status=400)
+    finally:
+        svc.repo.close()
+    return Response(json.dumps(asdict(report), ensure_ascii=False), mimetype='application/json')
+
+
+# ✅ ส่งออกอุปกรณ์ทั้งหมด (สตรีม — ไฟล์ที่ได้นำกลับเข้า /import ได้เลย)
+@api_equipment_bp.get("/export")
+@staff_required
+def equipment_export():
+    """GET /api/equipments/export?format=csv|jsonl&status=&category="""
+    fmt = request.args.get("format", "csv")
+    try:
+        lines = EquipmentBulkService.export(fmt, request.args.get("status", "").strip(),
+                                            request.args.get("category", "").strip())
+    except ValueError as e:
+        return Response(json.dumps({"error": str(e)}, ensure_ascii=False),
+                        mimetype='application/json', status=400)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(lines, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=equipments.{fmt}"})
+
+
+def _guess_format(filename: str, mimetype: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or mimetype in ("application/x-ndjson", "application/jsonl"):
+        return "jsonl"
+    return "csv"
+
+
+# ✅ ค้นหาแบบจัดอันดับ (FTS5 / pg_trgm) + แบ่งหน้า
+@api_equipment_bp.get("/search")
+def equipment_search():
+    """GET /api/equipments/search?q=...&category=...&page=1&per_page=20"""
+    svc = EquipmentService()
+    try:
+        page = request.args.get("page", 1, type=int)
+        per_page = request.args.get("per_page", 20, type=int)
+        items, total = svc.search(
+            request.args.get("q", ""),
+            category=request.args.get("category", ""),
+            page=page,
+            per_page=per_page,
+        )
+        result = {
+            "items": [
+                {"id": e.equipment_id, "name": e.name, "code": e.code, "brand": e.brand,
+                 "category": e.category, "status": e.status}
+                for e in items
+            ],
+            "total": total,
+            "page": max(page, 1),
+        }
+    finally:
+        svc.repo.close()
+    return Response(json.dumps(result, ensure_ascii=False), mimetype='application/json')
+
+
+# ✅ autocomplete ชื่อ/รหัสอุปกรณ์ตาม prefix
+@api_equipment_bp.get("/suggest")
+def equipment_suggest():
+    """GET /api/equipments/suggest?q=...&limit=10"""
+    svc = EquipmentService()
+    try:
+        result = svc.suggest(request.args.get("q", ""), limit=request.args.get("limit", 10, type=int))
+    finally:
+        svc.repo.close()
+    return Response(json.dumps(result, ensure_ascii=False), mimetype='application/json')
+
+
+# ✅ timeline การเคลื่อนไหวของอุปกรณ์ (แบ่งหน้าแบบ cursor)
+@api_equipment_bp.get("/<int:equipment_id>/movements")
+@staff_required
+def equipment_movements(equipment_id):
+    """GET /api/equipments/<id>/movements?limit=20&cursor=...&event_type=updated"""
+    svc = EquipmentService()
+    try:
+        items, next_cursor = svc.movement_timeline(
+            equipment_id,
+            limit=request.args.get("limit", 20, type=int),
+            cursor=request.args.get("cursor"),
+            event_type=request.args.get("event_type"),
+        )
+    except ValueError as e:
+        return Response(json.dumps({"error": str(e)}, ensure_ascii=False),
+                        mimetype='application/json', status=400)
+    finally:
+        svc.repo.close()
+
+    result = {
+        "items": [
+            {
+                "id": m.movement_id,
+                "event_type": m.event_type,
+                "actor_id": m.actor_id,
+                "actor_name": m.actor_name,
+                "history": m.history,
+                "changes": m.changes,
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+            }
+            for m in items
+        ],
+        "next_cursor": next_cursor,
+    }
+    return Response(json.dumps(result, ensure_ascii=False, default=str), mimetype='application/json')
@@ -99,8 +99,16 @@ def lend_submit():
 def admin_equipment_list():
     q = request.args.get("q", "").strip()
     category = request.args.get("category", "").strip()
-    items = _equip_svc().list(q=q, category=category)
-    return render_template("pages_inventory/admin_equipment_list.html", items=items)
+    try:
+        page = _equip_svc().list_page(
+            q=q, category=category,
+            cursor=request.args.get("cursor"),
+            direction=request.args.get("dir", "next"),
+        )
+    except ValueError:
+        abort(400)
+    return render_template("pages_inventory/admin_equipment_list.html", items=page.items, page=page,
+                           q=q, category=category)
 
 @inventory_bp.route("/admin/equipments/<int:eid>", methods=["GET"], endpoint="admin_equipment_detail")
 @staff_required
@@ -198,6 +206,7 @@ def toggle_teacher_approval(eid):
         flash("❌ ไม่พบอุปกรณ์", "error")
     else:
         eq.confirm = not eq.confirm
+        svc.repo.refresh_groups(eq.name)
         svc.repo.commit()
         flash(f"{'เปิด' if eq.confirm else 'ปิด'}โหมดให้อาจารย์อนุมัติสำเร็จ", "success")
     return redirect(url_for("inventory.admin_equipment_list"))
@@ -206,10 +215,7 @@ def toggle_teacher_approval(eid):
 def equipment_detail(eid):
     from app.services import lend_device_service
 
-    svc = lend_device_service.get_grouped_equipments_separated()
-    all_items = svc["available"] + svc["unavailable"]
-
-    item = next((i for i in all_items if i["equipment_id"] == eid), None)
+    item = lend_device_service.get_equipment_group_detail(eid)
     if not item:
         abort(404)
 
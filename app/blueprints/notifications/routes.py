@@ -1,6 +1,13 @@
-from flask import Blueprint, jsonify, session
+import json
+import queue
+import time
+from flask import Blueprint, Response, jsonify, request, session, stream_with_context
+from app.config import Config
 from app.db.db import SessionLocal
 from app.db.models import Notification
+from app.repositories.notification_repository import NotificationRepository
+from app.services.notification_hub import notification_hub, notification_to_event
+from app.services.unread_count_cache import unread_counts
 
 notifications_bp = Blueprint("notifications", __name__, url_prefix="/api/notifications")
 
@@ -12,26 +19,89 @@ def get_unread_notifications():
         return jsonify([])
 
     db = SessionLocal()
-    notifs = (
-        db.query(Notification)
-        .filter(Notification.user_id == user_id)
-        .filter(Notification.status == "unread")
-        .order_by(Notification.created_at.desc())
-        .limit(10)
-        .all()
-    )
+    try:
+        notifs = NotificationRepository(db).unread_for_user(user_id, limit=10)
+        return jsonify([notification_to_event(n) for n in notifs])
+    finally:
+        db.close()
+
+
+@notifications_bp.get("/unread/count")
+def get_unread_count():
+    """🔢 จำนวนแจ้งเตือนที่ยังไม่อ่าน (จาก cache — นับจาก DB เฉพาะตอน cache ว่าง/หมดอายุ)"""
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"count": 0})
+    return jsonify({"count": unread_counts.get(user_id, _count_unread)})
+
+
+def _count_unread(user_id) -> int:
+    db = SessionLocal()
+    try:
+        return NotificationRepository(db).count_unread(user_id)
+    finally:
+        db.close()
+
+
+def _parse_last_id(value):
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
 
-    result = [
-        {
-            "id": n.notification_id,
-            "template": n.template,
-            "message": n.payload.get("message") if isinstance(n.payload, dict) else n.payload,
-            "created_at": n.created_at.strftime("%Y-%m-%d %H:%M"),
-        }
-        for n in notifs
-    ]
-    db.close()
-    return jsonify(result)
+
+@notifications_bp.get("/stream")
+def stream_notifications():
+    """
+    📡 Server-Sent Events: push แจ้งเตือนใหม่ของผู้ใช้ปัจจุบันทันทีที่ถูกสร้าง
+    - เชื่อมต่อครั้งแรก → ส่งแจ้งเตือนที่ยังไม่อ่านล่าสุดก่อน แล้วรอ event ใหม่
+    - reconnect (Last-Event-ID หรือ ?last_id=) → ส่งเฉพาะที่ใหม่กว่า id นั้น
+    - เปิดได้นานสุด NOTIFY_STREAM_MAX_SECONDS แล้วปิดเอง → browser reconnect ตาม retry (worker ไม่ถูกถือไว้ตลอด)
+    - subscriber ของ process เต็ม → 204 ให้หน้าเว็บถอยไปใช้ /unread แบบ poll
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        return Response(status=204)  # EventSource จะหยุด reconnect เอง
+
+    last_id = _parse_last_id(request.headers.get("Last-Event-ID") or request.args.get("last_id"))
+    # subscribe ก่อนอ่าน backlog → event ที่เกิดระหว่างนี้ไม่หลุด (ตัดซ้ำด้วย id)
+    q = notification_hub.subscribe(user_id)
+    if q is None:
+        return Response(status=204)  # EventSource ปิดถาวร → notifications.js ถอยไป poll
+
+    def generate():
+        sent = last_id or 0
+        deadline = time.monotonic() + Config.NOTIFY_STREAM_MAX_SECONDS
+        try:
+            yield "retry: 3000\n\n"
+            for event in notification_hub.backlog(user_id, after_id=last_id):
+                sent = max(sent, event["id"])
+                yield _sse(event)
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break  # ครบอายุ → จบ response, EventSource reconnect พร้อม Last-Event-ID
+                try:
+                    event = q.get(timeout=min(Config.NOTIFY_STREAM_KEEPALIVE, remaining))
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if event["id"] <= sent:
+                    continue
+                sent = event["id"]
+                yield _sse(event)
+        finally:
+            notification_hub.unsubscribe(user_id, q)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @notifications_bp.post("/dismiss/<int:notif_id>")
@@ -41,8 +111,11 @@ def dismiss_notification(notif_id):
     try:
         notif = db.query(Notification).filter(Notification.notification_id == notif_id).first()
         if notif:
+            was_unread = notif.status == "unread"
             notif.status = "read"
             db.commit()
+            if was_unread:
+                unread_counts.adjust(notif.user_id, -1)
             return jsonify({"ok": True})
         return jsonify({"error": "Notification not found"}), 404
     except Exception as e:
@@ -52,3 +125,33 @@ def dismiss_notification(notif_id):
     finally:
         db.close()
 
+
+@notifications_bp.post("/dismiss-all")
+def dismiss_all_notifications():
+    """
+    ❌ ปิดแจ้งเตือนของผู้ใช้ปัจจุบันทีเดียว (UPDATE เดียว)
+    - ไม่ส่งอะไร → ทุกรายการที่ยังไม่อ่าน
+    - up_to_id   → เฉพาะ id <= ค่านี้ (รายการที่ผู้ใช้เห็นแล้ว)
+    """
+    user_id = session.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    body = request.get_json(silent=True) or {}
+    up_to_id = _parse_last_id(body.get("up_to_id", request.form.get("up_to_id")))
+
+    db = SessionLocal()
+    try:
+        dismissed = NotificationRepository(db).mark_read(user_id, up_to_id=up_to_id)
+        db.commit()
+        if up_to_id is None:
+            unread_counts.set(user_id, 0)
+        else:
+            unread_counts.adjust(user_id, -dismissed)
+        return jsonify({"ok": True, "dismissed": dismissed})
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR dismiss_all_notifications] {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        db.close()
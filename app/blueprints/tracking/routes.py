@@ -38,18 +38,14 @@ def confirm_return(rent_id):
 @tracking_bp.get("/lend_detial")
 def lend_detial():
     rent_id = request.args.get("rent_id", type=int)
-    service = TrackStatusUserService()
-    rents = service.get_user_track_status()
-    rent = next((r for r in rents if r["rent_id"] == rent_id), None)
+    rent = TrackStatusUserService().get_user_rent(rent_id)
     return render_template("tracking/lend_detial.html", rent=rent)
 
 # หน้าเพิ่มเวลาการยืม
 @tracking_bp.get("/add_time")
 def add_time():
     rent_id = request.args.get("rent_id", type=int)
-    service = TrackStatusUserService()
-    rents = service.get_user_track_status()
-    rent = next((r for r in rents if r["rent_id"] == rent_id), None)
+    rent = TrackStatusUserService().get_user_rent(rent_id)
     return render_template("tracking/add_time.html", rent=rent)
 
 
@@ -5,3 +5,68 @@ class Config:
     DATA_DIR = "data"
     ALLOWED_IMAGE_EXT = {"jpg","jpeg","png","gif","webp"}
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), "static", "uploads", "equipment")
+
+    # ----- Equipment catalog -----
+    EQUIPMENT_GROUP_CACHE_SIZE = int(os.getenv("EQUIPMENT_GROUP_CACHE_SIZE", "2000"))  # จำนวนกลุ่มใน cache
+    EQUIPMENT_GROUP_CACHE_TTL = float(os.getenv("EQUIPMENT_GROUP_CACHE_TTL", "30"))
+    EQUIPMENT_COVER_CACHE_SIZE = int(os.getenv("EQUIPMENT_COVER_CACHE_SIZE", "20000"))  # รูปปกต่อ equipment_id
+    EQUIPMENT_COVER_CACHE_TTL = float(os.getenv("EQUIPMENT_COVER_CACHE_TTL", "300"))
+    EQUIPMENT_PAGE_SIZE = int(os.getenv("EQUIPMENT_PAGE_SIZE", "24"))       # จำนวนอุปกรณ์ต่อหน้า (admin)
+    EQUIPMENT_COUNT_CAP = int(os.getenv("EQUIPMENT_COUNT_CAP", "10000"))    # นับจำนวนทั้งหมดไม่เกินนี้ (เกิน → "10000+")
+    EQUIPMENT_IMPORT_MAX_ROWS = int(os.getenv("EQUIPMENT_IMPORT_MAX_ROWS", "20000"))  # แถวสูงสุดต่อไฟล์นำเข้า
+    EQUIPMENT_IMPORT_BATCH = int(os.getenv("EQUIPMENT_IMPORT_BATCH", "1000"))         # แถวต่อ INSERT หลายแถว
+
+    # ----- Borrow history -----
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))         # แถวต่อหน้า (หน้าประวัติของ admin)
+    HISTORY_EXPORT_CHUNK = int(os.getenv("HISTORY_EXPORT_CHUNK", "1000"))  # แถวต่อ fetch / ต่อก้อนที่ส่งออก (CSV/XLSX)
+
+    # ----- Equipment images -----
+    IMAGE_VARIANTS = {"thumb": 160, "card": 480, "large": 1280}          # ชื่อขนาด → ด้านยาวสุด (px)
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))                 # thread ประมวลผลรูปเบื้องหลัง
+    IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+    IMAGE_EXISTS_CACHE_TTL = float(os.getenv("IMAGE_EXISTS_CACHE_TTL", "60"))  # จำผลเช็คไฟล์ variant (วินาที)
+    IMAGE_GC_GRACE_SECONDS = int(os.getenv("IMAGE_GC_GRACE_SECONDS", "3600"))  # ไม่ลบไฟล์ที่ไม่มีแถวอ้างถ้าใหม่กว่านี้
+
+    # ----- Upload storage (local = static/ ของแอป, s3 = bucket แบบ S3 / MinIO) -----
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+    STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "")        # CDN / bucket สาธารณะ → URL ตรง ไม่ต้อง presign
+    STORAGE_URL_TTL = int(os.getenv("STORAGE_URL_TTL", "3600"))      # อายุ presigned URL (วินาที)
+    S3_ENDPOINT = os.getenv("S3_ENDPOINT", "")                       # เช่น http://minio:9000
+    S3_BUCKET = os.getenv("S3_BUCKET", "")
+    S3_REGION = os.getenv("S3_REGION", "us-east-1")
+    S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
+    S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
+
+    # ----- Notification stream (SSE กระดิ่งแจ้งเตือน) -----
+    NOTIFY_STREAM_POLL_SECONDS = float(os.getenv("NOTIFY_STREAM_POLL_SECONDS", "5"))  # tail แถวจาก process อื่น
+    NOTIFY_STREAM_KEEPALIVE = int(os.getenv("NOTIFY_STREAM_KEEPALIVE", "15"))         # comment กัน proxy ตัด
+    NOTIFY_STREAM_MAX_SECONDS = int(os.getenv("NOTIFY_STREAM_MAX_SECONDS", "300"))    # ปิด stream แล้วให้ client reconnect
+    NOTIFY_STREAM_MAX_SUBSCRIBERS = int(os.getenv("NOTIFY_STREAM_MAX_SUBSCRIBERS", "50"))  # ต่อ process — เกิน → poll
+    NOTIFY_UNREAD_CACHE_SIZE = int(os.getenv("NOTIFY_UNREAD_CACHE_SIZE", "10000"))    # จำนวนผู้ใช้สูงสุดใน cache
+    NOTIFY_UNREAD_CACHE_TTL = float(os.getenv("NOTIFY_UNREAD_CACHE_TTL", "30"))
+
+    # ----- Notification retention (ย่อ/ลบแจ้งเตือนเก่า) -----
+    NOTIFY_RETENTION_DAYS = int(os.getenv("NOTIFY_RETENTION_DAYS", "30"))           # เก็บแถวเต็มไว้กี่วัน
+    NOTIFY_RETENTION_MODE = os.getenv("NOTIFY_RETENTION_MODE", "delete")            # delete / archive
+    NOTIFY_RETENTION_BATCH = int(os.getenv("NOTIFY_RETENTION_BATCH", "1000"))       # แถวต่อ transaction
+    NOTIFY_RETENTION_MAX_BATCHES = int(os.getenv("NOTIFY_RETENTION_MAX_BATCHES", "200"))
+
+    # ----- Notification delivery (ช่องทางส่งออกนอกระบบ) -----
+    # เช่น NOTIFY_CHANNELS="email,webhook" — ว่าง = แจ้งเตือนในระบบ (กระดิ่ง) อย่างเดียว
+    NOTIFY_CHANNELS = [c.strip() for c in os.getenv("NOTIFY_CHANNELS", "").split(",") if c.strip()]
+    NOTIFY_DELIVERY_INTERVAL = int(os.getenv("NOTIFY_DELIVERY_INTERVAL", "10"))
+    NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "200"))
+    NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+
+    SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+    SMTP_USER = os.getenv("SMTP_USER", "")
+    SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+    SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "0") == "1"
+    SMTP_SENDER = os.getenv("SMTP_SENDER", "no-reply@siet.local")
+    SMTP_RATE_PER_SEC = float(os.getenv("SMTP_RATE_PER_SEC", "20"))
+    SMTP_CONCURRENCY = int(os.getenv("SMTP_CONCURRENCY", "4"))
+
+    WEBHOOK_URL = os.getenv("NOTIFY_WEBHOOK_URL", "")
+    WEBHOOK_RATE_PER_SEC = float(os.getenv("WEBHOOK_RATE_PER_SEC", "50"))
+    WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
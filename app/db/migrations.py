@@ -1,4 +1,4 @@
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 from app.db.db import engine
 
 
@@ -44,4 +44,389 @@ def ensure_equipment_name_column(backfill: bool = True):
         raise
 
 
-__all__ = ["ensure_equipment_name_column"]
+
+# ---------------------------------------------------------------------------
+# ✅ migrations ที่รันตอนสตาร์ตแอป (ใน create_app ภายใต้ advisory lock เดียวกับ create_all)
+# ทุกฟังก์ชันต้อง idempotent: รันซ้ำได้โดยไม่เปลี่ยนอะไร
+# ---------------------------------------------------------------------------
+def _columns(conn, table: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn, table: str) -> dict:
+    """ชื่อ index -> รายชื่อคอลัมน์"""
+    return {i["name"]: list(i["column_names"]) for i in inspect(conn).get_indexes(table)}
+
+
+def _has_index(conn, name: str) -> bool:
+    """เช็คจาก catalog ตรง ๆ — inspect() ข้าม expression index (เช่น lower(col)) บน SQLite"""
+    if conn.dialect.name == "postgresql":
+        sql = "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+    else:
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+    return conn.execute(text(sql), {"name": name}).first() is not None
+
+
+def ensure_notification_dedup_key(conn) -> bool:
+    """Ensure notifications has real `rent_id` / `dedup_day` columns + unique dedup index.
+
+    Older databases kept rent_id only inside the JSON payload, so the dedup
+    check could not use any index. When the columns are missing they are
+    added and backfilled from payload / created_at. Rows that would collide
+    on (user_id, rent_id, template, channel, dedup_day) keep the oldest one as
+    the key holder; the others get dedup_day = NULL (kept, but outside the index).
+    An index created before `channel` joined the key is dropped and rebuilt.
+    """
+    changed = False
+    cols = _columns(conn, "notifications")
+    if "rent_id" not in cols or "dedup_day" not in cols:
+        if "rent_id" not in cols:
+            conn.execute(text("ALTER TABLE notifications ADD COLUMN rent_id INTEGER REFERENCES rent_returns(rent_id)"))
+        if "dedup_day" not in cols:
+            conn.execute(text("ALTER TABLE notifications ADD COLUMN dedup_day DATE"))
+
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(
+                """
+                UPDATE notifications n
+                SET rent_id = r.rent_id
+                FROM rent_returns r
+                WHERE n.rent_id IS NULL
+                  AND n.payload IS NOT NULL
+                  AND r.rent_id = NULLIF(n.payload::jsonb ->> 'rent_id', '')::int
+                """
+            ))
+            conn.execute(text(
+                "UPDATE notifications SET dedup_day = created_at::date "
+                "WHERE dedup_day IS NULL AND created_at IS NOT NULL"
+            ))
+        else:
+            conn.execute(text(
+                """
+                UPDATE notifications
+                SET rent_id = CAST(json_extract(payload, '$.rent_id') AS INTEGER)
+                WHERE rent_id IS NULL AND json_valid(payload)
+                """
+            ))
+            conn.execute(text(
+                "UPDATE notifications SET dedup_day = date(created_at) "
+                "WHERE dedup_day IS NULL AND created_at IS NOT NULL"
+            ))
+
+        # ✅ แถวซ้ำจากยุค check-then-insert: เก็บแถวแรกไว้เป็นเจ้าของคีย์
+        conn.execute(text(
+            """
+            UPDATE notifications
+            SET dedup_day = NULL
+            WHERE rent_id IS NOT NULL
+              AND dedup_day IS NOT NULL
+              AND notification_id NOT IN (
+                  SELECT keep_id FROM (
+                      SELECT MIN(notification_id) AS keep_id
+                      FROM notifications
+                      WHERE rent_id IS NOT NULL AND dedup_day IS NOT NULL
+                      GROUP BY user_id, rent_id, template, channel, dedup_day
+                  ) AS keepers
+              )
+            """
+        ))
+        changed = True
+
+    key = ["user_id", "rent_id", "template", "channel", "dedup_day"]
+    existing = _indexes(conn, "notifications").get("uq_notifications_dedup")
+    if existing is not None and existing != key:
+        conn.execute(text("DROP INDEX uq_notifications_dedup"))
+        existing = None
+    if existing is None:
+        conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_dedup "
+            "ON notifications (user_id, rent_id, template, channel, dedup_day)"
+        ))
+        changed = True
+    return changed
+
+
+def ensure_notification_delivery_columns(conn) -> bool:
+    """Ensure the outbox columns used by the delivery worker exist on notifications."""
+    changed = False
+    cols = _columns(conn, "notifications")
+    for name, ddl in (
+        ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+        ("claim_token", "VARCHAR"),
+        ("claimed_at", "TIMESTAMP"),
+        ("delivered_at", "TIMESTAMP"),
+        ("last_error", "TEXT"),
+    ):
+        if name not in cols:
+            conn.execute(text(f"ALTER TABLE notifications ADD COLUMN {name} {ddl}"))
+            changed = True
+
+    if "ix_notifications_outbox" not in _indexes(conn, "notifications"):
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_notifications_outbox ON notifications (status, send_at)"
+        ))
+        changed = True
+    return changed
+
+
+def ensure_equipment_deleted_at(conn) -> bool:
+    """Ensure equipments has an indexed `deleted_at` soft-delete column.
+
+    Soft-deleted equipment used to be recognised only by a stock_movements row
+    whose history contains "[DELETED]". When the column is missing it is added
+    and backfilled once from that history (earliest matching movement wins).
+    """
+    changed = False
+    if "deleted_at" not in _columns(conn, "equipments"):
+        conn.execute(text("ALTER TABLE equipments ADD COLUMN deleted_at TIMESTAMP"))
+        like = "ILIKE" if conn.dialect.name == "postgresql" else "LIKE"  # LIKE ของ SQLite ไม่สนตัวพิมพ์อยู่แล้ว
+        conn.execute(text(
+            f"""
+            UPDATE equipments
+            SET deleted_at = COALESCE((
+                SELECT MIN(m.created_at) FROM stock_movements m
+                WHERE m.equipment_id = equipments.equipment_id
+                  AND m.history {like} '%[DELETED]%'
+            ), CURRENT_TIMESTAMP)
+            WHERE deleted_at IS NULL
+              AND EXISTS (
+                SELECT 1 FROM stock_movements m
+                WHERE m.equipment_id = equipments.equipment_id
+                  AND m.history {like} '%[DELETED]%'
+              )
+            """
+        ))
+        changed = True
+
+    if "ix_equipments_deleted_at" not in _indexes(conn, "equipments"):
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_equipments_deleted_at ON equipments (deleted_at)"))
+        changed = True
+    return changed
+
+
+def ensure_stock_movement_events(conn) -> bool:
+    """Ensure stock_movements has typed `event_type` / JSON `changes` columns + timeline indexes.
+
+    Older rows only carried a free-text history such as "[UPDATED] ...". When
+    the columns are missing they are added and event_type is backfilled once
+    from that prefix ("other" when no known prefix is present).
+    """
+    changed = False
+    cols = _columns(conn, "stock_movements")
+    if "event_type" not in cols:
+        conn.execute(text("ALTER TABLE stock_movements ADD COLUMN event_type VARCHAR(20) NOT NULL DEFAULT 'other'"))
+        for prefix, event in (("[ADDED]", "added"), ("[UPDATED]", "updated"), ("[DELETED]", "deleted")):
+            conn.execute(
+                text("UPDATE stock_movements SET event_type = :event WHERE history LIKE :prefix"),
+                {"event": event, "prefix": prefix + "%"},
+            )
+        changed = True
+    if "changes" not in cols:
+        conn.execute(text("ALTER TABLE stock_movements ADD COLUMN changes JSON"))
+        changed = True
+
+    existing = _indexes(conn, "stock_movements")
+    for name, columns in (
+        ("ix_stock_movements_equipment_created", "equipment_id, created_at"),
+        ("ix_stock_movements_event_created", "event_type, created_at"),
+    ):
+        if name not in existing:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON stock_movements ({columns})"))
+            changed = True
+    return changed
+
+
+def ensure_equipment_groups(conn) -> bool:
+    """Build the equipment_groups aggregate once when it is empty but equipment exists.
+
+    After that the table is maintained by every write path (create / update /
+    delete / lend / return) through EquipmentGroupRepository.refresh.
+    """
+    from sqlalchemy.orm import Session
+    from app.repositories.equipment_group_repository import EquipmentGroupRepository
+
+    if conn.execute(text("SELECT 1 FROM equipment_groups LIMIT 1")).first():
+        return False
+    if not conn.execute(text("SELECT 1 FROM equipments WHERE deleted_at IS NULL LIMIT 1")).first():
+        return False
+    db = Session(bind=conn)
+    try:
+        EquipmentGroupRepository(db).rebuild_all()
+    finally:
+        db.close()
+    return True
+
+
+def ensure_equipment_list_indexes(conn) -> bool:
+    """Add the (created_at, equipment_id) keyset indexes used by the admin equipment list.
+
+    Keyset paging needs a non-NULL sort key, so legacy rows without created_at
+    get the time of their first stock movement (or now) first.
+
+    SQLite stores timestamps as text and the cursor compares them as strings, so
+    every value must use the ORM's 'YYYY-MM-DD HH:MM:SS.ffffff' layout; values
+    written by CURRENT_TIMESTAMP ('YYYY-MM-DD HH:MM:SS') are padded to match.
+    """
+    cols = _columns(conn, "equipments")
+    if "created_at" not in cols:
+        return False
+    sqlite = conn.dialect.name == "sqlite"
+    now = "strftime('%Y-%m-%d %H:%M:%S.000000', 'now')" if sqlite else "CURRENT_TIMESTAMP"
+    res = conn.execute(text(
+        "UPDATE equipments SET created_at = COALESCE("
+        "(SELECT MIN(sm.created_at) FROM stock_movements sm WHERE sm.equipment_id = equipments.equipment_id), "
+        f"{now}) WHERE created_at IS NULL"
+    ))
+    changed = bool(res.rowcount and res.rowcount > 0)
+    if sqlite:
+        res = conn.execute(text(
+            "UPDATE equipments SET created_at = created_at || '.000000' WHERE length(created_at) = 19"
+        ))
+        changed = changed or bool(res.rowcount and res.rowcount > 0)
+
+    existing = _indexes(conn, "equipments")
+    for name, columns in (
+        ("ix_equipments_created", "created_at, equipment_id"),
+        ("ix_equipments_category_created", "category, created_at, equipment_id"),
+    ):
+        if name not in existing:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON equipments ({columns})"))
+            changed = True
+    return changed
+
+
+def ensure_equipment_updated_at(conn) -> bool:
+    """Ensure equipments has an indexed `updated_at` column (version key for the API ETag).
+
+    Existing rows start from their created_at; from then on the ORM bumps it on
+    every update (including soft-delete).
+    """
+    changed = False
+    if "updated_at" not in _columns(conn, "equipments"):
+        conn.execute(text("ALTER TABLE equipments ADD COLUMN updated_at TIMESTAMP"))
+        conn.execute(text("UPDATE equipments SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+        changed = True
+    if "ix_equipments_updated_at" not in _indexes(conn, "equipments"):
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_equipments_updated_at ON equipments (updated_at)"))
+        changed = True
+    return changed
+
+
+def ensure_equipment_cover_image(conn) -> bool:
+    """Ensure equipments has the denormalized `cover_image` column (path of its first image).
+
+    Backfilled once from equipment_images (lowest equipment_image_id per equipment);
+    afterwards EquipmentRepository.refresh_cover keeps it in step with image writes.
+    """
+    if "cover_image" in _columns(conn, "equipments"):
+        return False
+    conn.execute(text("ALTER TABLE equipments ADD COLUMN cover_image VARCHAR"))
+    conn.execute(text(
+        "UPDATE equipments SET cover_image = ("
+        " SELECT i.image_path FROM equipment_images i"
+        " WHERE i.equipment_id = equipments.equipment_id"
+        " ORDER BY i.equipment_image_id LIMIT 1)"
+    ))
+    return True
+
+
+def ensure_image_path_indexes(conn) -> bool:
+    """Index image_path on both image tables (reference counts of content-addressed files)."""
+    changed = False
+    for table in ("equipment_images", "item_broke_images"):
+        name = f"ix_{table}_image_path"
+        if name not in _indexes(conn, table):
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} (image_path)"))
+            changed = True
+    return changed
+
+
+def ensure_rent_history_indexes(conn) -> bool:
+    """Index rent_returns for the history pages (newest first, keyset on start_date + rent_id).
+
+    The per-user page filters on user_id first, so it gets its own composite index.
+    The track-status pages look up one user's loans by status / not-yet-returned.
+    """
+    changed = False
+    existing = _indexes(conn, "rent_returns")
+    for name, cols in (
+        ("ix_rent_returns_start", "start_date, rent_id"),
+        ("ix_rent_returns_user_start", "user_id, start_date, rent_id"),
+        ("ix_rent_returns_user_status", "user_id, status_id, return_date"),
+    ):
+        if name not in existing:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON rent_returns ({cols})"))
+            changed = True
+    return changed
+
+
+def ensure_user_identity_indexes(conn) -> bool:
+    """Index lower(student_id) / lower(employee_id) for the admin history prefix search.
+
+    The search is a range (>= 'abc' AND < 'abd'), which only equals a prefix
+    match under byte-wise ordering. On Postgres the indexes are therefore built
+    with COLLATE "C" (matching models.lower_bytewise); older indexes created
+    with the database collation are rebuilt.
+    """
+    pg = conn.dialect.name == "postgresql"
+    changed = False
+    for column in ("student_id", "employee_id"):
+        name = f"ix_users_{column}_lower"
+        if pg and _has_index(conn, name):
+            indexdef = conn.execute(
+                text("SELECT indexdef FROM pg_indexes WHERE indexname = :name"), {"name": name}
+            ).scalar() or ""
+            if 'COLLATE "C"' in indexdef:
+                continue
+            conn.execute(text(f"DROP INDEX {name}"))
+        elif _has_index(conn, name):
+            continue
+        key = f'lower({column}) COLLATE "C"' if pg else f"lower({column})"
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON users ({key})"))
+        changed = True
+    return changed
+
+
+def ensure_equipment_search_index(conn) -> bool:
+    """Create the catalog search index (FTS5 trigram on SQLite, pg_trgm GIN on Postgres).
+
+    The SQLite table is filled from the current catalog when it is created; after
+    that EquipmentSearchRepository.index / remove keep it in step with writes.
+    """
+    from app.repositories.equipment_search_repository import EquipmentSearchRepository
+
+    return EquipmentSearchRepository.ensure_index(conn)
+
+
+def run_migrations(conn) -> None:
+    """รัน migrations ทั้งหมดตามลำดับ (เรียกหลัง create_all)"""
+    ensure_notification_dedup_key(conn)
+    ensure_notification_delivery_columns(conn)
+    ensure_equipment_deleted_at(conn)
+    ensure_equipment_cover_image(conn)  # ก่อน groups: refresh กลุ่มอ่าน cover_image
+    ensure_stock_movement_events(conn)
+    ensure_equipment_groups(conn)
+    ensure_equipment_search_index(conn)
+    ensure_equipment_list_indexes(conn)
+    ensure_equipment_updated_at(conn)
+    ensure_image_path_indexes(conn)
+    ensure_rent_history_indexes(conn)
+    ensure_user_identity_indexes(conn)
+
+
+__all__ = [
+    "ensure_equipment_cover_image",
+    "ensure_equipment_deleted_at",
+    "ensure_equipment_groups",
+    "ensure_equipment_list_indexes",
+    "ensure_equipment_name_column",
+    "ensure_equipment_search_index",
+    "ensure_equipment_updated_at",
+    "ensure_image_path_indexes",
+    "ensure_notification_dedup_key",
+    "ensure_notification_delivery_columns",
+    "ensure_rent_history_indexes",
+    "ensure_stock_movement_events",
+    "ensure_user_identity_indexes",
+    "run_migrations",
+]
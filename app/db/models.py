@@ -1,12 +1,36 @@
+import enum
 from datetime import datetime
 from sqlalchemy import (
     Column, Integer, String, Text, Boolean, Date, DateTime,
-    ForeignKey, JSON
+    ForeignKey, JSON, Index, Enum
 )
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql.functions import FunctionElement
 from app.db.db import Base
 
 
+class lower_bytewise(FunctionElement):
+    """
+    lower(col) ที่เทียบลำดับแบบ byte-wise — ใช้ทั้งใน index และเงื่อนไข prefix (>= x AND < x')
+    - SQLite เทียบ byte-wise อยู่แล้ว → lower(col)
+    - Postgres collation ของฐานข้อมูล (เช่น en_US.UTF-8) ข้ามเครื่องหมายวรรคตอน → lower(col) COLLATE "C"
+    """
+    type = String()
+    name = "lower_bytewise"
+    inherit_cache = True
+
+
+@compiles(lower_bytewise)
+def _lower_bytewise(element, compiler, **kw):
+    return f"lower({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(lower_bytewise, "postgresql")
+def _lower_bytewise_pg(element, compiler, **kw):
+    return f'lower({compiler.process(element.clauses, **kw)}) COLLATE "C"'
+
+
 # ---------- users ----------
 class User(Base):
     __tablename__ = "users"
@@ -36,6 +60,12 @@ class User(Base):
     audits_made        = relationship("UserAudit",back_populates="actor",foreign_keys="UserAudit.actor_id",cascade="all, delete-orphan")
     audits_received    = relationship("UserAudit",back_populates="target_user",foreign_keys="UserAudit.user_id",cascade="all, delete-orphan")
 
+    # ✅ ค้นหา "รหัสขึ้นต้นด้วย" แบบไม่สนตัวพิมพ์ในหน้าประวัติ admin (lower(col) >= x AND < x')
+    __table_args__ = (
+        Index("ix_users_student_id_lower", lower_bytewise(student_id)),
+        Index("ix_users_employee_id_lower", lower_bytewise(employee_id)),
+    )
+
 # ---------- equipments ----------
 class Equipment(Base):
     __tablename__ = "equipments"
@@ -50,12 +80,44 @@ class Equipment(Base):
     buy_date     = Column(Date)
     status       = Column(String)
     created_at   = Column(DateTime, default=datetime.utcnow)
+    updated_at   = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # ✅ ใช้ทำ ETag ของ /api/equipments
+    cover_image  = Column(String)  # ✅ path รูปแรก (equipment_image_id น้อยสุด) — EquipmentRepository.refresh_cover ดูแล
+    deleted_at   = Column(DateTime, index=True)  # ✅ soft-delete: NULL = ยังใช้งาน (เดิมค้น "[DELETED]" จาก stock_movements)
 
     equipment_images = relationship("EquipmentImage", back_populates="equipment")
     stock_movements  = relationship("StockMovement", back_populates="equipment")
     rent_returns     = relationship("RentReturn", back_populates="equipment")
     images           = relationship("EquipmentImage",back_populates="equipment",cascade="all, delete-orphan",lazy="selectin",passive_deletes=True,overlaps="equipment_images",) # - overlaps = "equipment_images" เพื่อป้องกัน SQLAlchemy เตือนว่ามีการซ้อน relationship เนื่องจากมีทั้ง 'equipment_images' และ 'images' ที่อ้างอิง column เดียวกัน (equipment_id)
 
+    # ✅ keyset pagination ของหน้ารายการ admin (ใหม่ → เก่า ทั้งหมด / ตามหมวด)
+    __table_args__ = (
+        Index("ix_equipments_created", "created_at", "equipment_id"),
+        Index("ix_equipments_category_created", "category", "created_at", "equipment_id"),
+    )
+
+
+
+# ---------- equipment_groups ----------
+class EquipmentGroup(Base):
+    """
+    สรุปอุปกรณ์ที่ชื่อเดียวกัน (1 การ์ดในหน้า lend_device) — อัปเดตใน transaction เดียวกับการเปลี่ยนอุปกรณ์
+    ข้อมูลทั่วไป (category/brand/...) มาจากชิ้นแรกของกลุ่ม (equipment_id น้อยสุด)
+    """
+    __tablename__ = "equipment_groups"
+
+    name            = Column(String, primary_key=True)
+    equipment_id    = Column(Integer, nullable=False, index=True)   # ชิ้นตัวแทนของกลุ่ม
+    category        = Column(String)
+    brand           = Column(String)
+    detail          = Column(Text)
+    buy_date        = Column(Date)
+    confirm         = Column(Boolean, default=False)
+    status          = Column(String)
+    total           = Column(Integer, nullable=False, default=0)   # ทุกชิ้นที่ยังไม่ถูกลบ
+    available       = Column(Integer, nullable=False, default=0)   # ชิ้นที่พร้อมให้ยืม
+    available_codes = Column(JSON, nullable=False, default=list)
+    cover_image     = Column(String)
+    updated_at      = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 # ---------- equipment_images ----------
@@ -64,7 +126,7 @@ class EquipmentImage(Base):
 
     equipment_image_id = Column(Integer, primary_key=True, autoincrement=True)
     equipment_id       = Column(Integer, ForeignKey("equipments.equipment_id"), nullable=False)
-    image_path         = Column(String, nullable=False)
+    image_path         = Column(String, nullable=False, index=True)  # ✅ นับ reference ของไฟล์ (ImageStore)
     description        = Column(Text)
     created_at         = Column(DateTime, default=datetime.utcnow)
 
@@ -72,18 +134,37 @@ class EquipmentImage(Base):
 
 
 # ---------- stock_movements ----------
+class MovementEvent(str, enum.Enum):
+    """ประเภทเหตุการณ์ของ stock_movements (เดิมต้องแยกจาก prefix ของข้อความ history)"""
+    ADDED   = "added"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    OTHER   = "other"     # แถวเก่าที่ไม่มี prefix ที่รู้จัก
+
+
 class StockMovement(Base):
     __tablename__ = "stock_movements"
 
     movement_id  = Column(Integer, primary_key=True, autoincrement=True)
     equipment_id = Column(Integer, ForeignKey("equipments.equipment_id"), nullable=False)
-    history      = Column(Text, nullable=False)
+    history      = Column(Text, nullable=False)     # ข้อความสำหรับแสดงผล (คงไว้ตามเดิม)
     actor_id     = Column(Integer, ForeignKey("users.user_id"), nullable=False)
     created_at   = Column(DateTime, default=datetime.utcnow)
+    event_type   = Column(
+        Enum(MovementEvent, native_enum=False, length=20, values_callable=lambda e: [m.value for m in e]),
+        nullable=False, default=MovementEvent.OTHER,
+    )
+    changes      = Column(JSON)                      # {"field": [ค่าเดิม, ค่าใหม่], ...}
 
     equipment = relationship("Equipment", back_populates="stock_movements")
     actor     = relationship("User", back_populates="stock_movements")
 
+    # ✅ timeline ต่ออุปกรณ์ / audit ตามประเภทเหตุการณ์ → range scan บน index
+    __table_args__ = (
+        Index("ix_stock_movements_equipment_created", "equipment_id", "created_at"),
+        Index("ix_stock_movements_event_created", "event_type", "created_at"),
+    )
+
 
 # ---------- status_rents ----------
 class StatusRent(Base):
@@ -120,6 +201,14 @@ class RentReturn(Base):
     item_brokes = relationship("ItemBroke", back_populates="rent_return")
     renewals = relationship("Renewal", back_populates="rent_return")
 
+    # ✅ หน้าประวัติ แบบ keyset: ทุกคน (start_date, rent_id) / ของฉัน (user_id, start_date, rent_id)
+    # ✅ หน้าติดตามสถานะ: รายการของผู้ใช้ตามสถานะ / ที่ยังไม่คืน (user_id, status_id, return_date)
+    __table_args__ = (
+        Index("ix_rent_returns_start", "start_date", "rent_id"),
+        Index("ix_rent_returns_user_start", "user_id", "start_date", "rent_id"),
+        Index("ix_rent_returns_user_status", "user_id", "status_id", "return_date"),
+    )
+
 
 
 
@@ -147,7 +236,7 @@ class ItemBrokeImage(Base):
 
     item_broke_image_id = Column(Integer, primary_key=True, autoincrement=True)
     item_broke_id       = Column(Integer, ForeignKey("item_brokes.item_broke_id"), nullable=False)
-    image_path          = Column(String, nullable=False)
+    image_path          = Column(String, nullable=False, index=True)
     created_at          = Column(DateTime, default=datetime.utcnow)
 
     item_broke = relationship("ItemBroke", back_populates="item_broke_images")
@@ -165,9 +254,80 @@ class Notification(Base):
     send_at         = Column(DateTime, nullable=False)
     status          = Column(String, nullable=False, default="scheduled")
     created_at      = Column(DateTime, default=datetime.utcnow)
+    rent_id         = Column(Integer, ForeignKey("rent_returns.rent_id"))  # ✅ คีย์ dedup (เดิมอยู่ใน payload)
+    dedup_day       = Column(Date)                                         # ✅ วันที่ (เวลาไทย) ของแจ้งเตือน
+
+    # ----- สำหรับช่องทางส่งออก (email/webhook): scheduled → sending → sent / failed -----
+    attempts        = Column(Integer, nullable=False, default=0)
+    claim_token     = Column(String)     # worker ที่ claim แถวนี้ไว้
+    claimed_at      = Column(DateTime)
+    delivered_at    = Column(DateTime)
+    last_error      = Column(Text)
 
     user = relationship("User", back_populates="notifications")
 
+    # ✅ 1 แจ้งเตือนต่อ (ผู้ใช้, รายการยืม, template, ช่องทาง, วัน) — ให้ DB กันซ้ำเอง
+    __table_args__ = (
+        Index("uq_notifications_dedup", "user_id", "rent_id", "template", "channel", "dedup_day", unique=True),
+        Index("ix_notifications_outbox", "status", "send_at"),
+    )
+
+
+# ---------- notification_daily_summaries ----------
+class NotificationDailySummary(Base):
+    """สรุปแจ้งเตือนเก่าที่อ่าน/ส่งแล้ว ต่อ (ผู้ใช้, วัน, ช่องทาง, template) — แทนแถวเดิมที่ถูกลบ"""
+    __tablename__ = "notification_daily_summaries"
+
+    user_id  = Column(Integer, ForeignKey("users.user_id"), primary_key=True)
+    day      = Column(Date, primary_key=True)       # วันที่ (เวลาไทย) ของแจ้งเตือน
+    channel  = Column(String, primary_key=True)
+    template = Column(String, primary_key=True)
+    count    = Column(Integer, nullable=False, default=0)
+    first_at = Column(DateTime)
+    last_at  = Column(DateTime)
+
+
+# ---------- notifications_archive ----------
+class NotificationArchive(Base):
+    """สำเนาแจ้งเตือนที่ถูกย้ายออกจากตารางหลัก (ใช้เมื่อ NOTIFY_RETENTION_MODE=archive)"""
+    __tablename__ = "notifications_archive"
+
+    notification_id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id         = Column(Integer, nullable=False, index=True)
+    channel         = Column(String, nullable=False)
+    template        = Column(String)
+    payload         = Column(JSON)
+    send_at         = Column(DateTime)
+    status          = Column(String)
+    created_at      = Column(DateTime)
+    rent_id         = Column(Integer)
+    delivered_at    = Column(DateTime)
+    archived_at     = Column(DateTime, default=datetime.utcnow)
+
+
+# ---------- notification_timers ----------
+class NotificationTimer(Base):
+    """คิวเวลาปลุก scheduler ต่อรายการยืม (due-24h / due-1h / due) แทนการ poll ทุก 30 วินาที"""
+    __tablename__ = "notification_timers"
+
+    timer_id   = Column(Integer, primary_key=True, autoincrement=True)
+    rent_id    = Column(Integer, ForeignKey("rent_returns.rent_id"), nullable=False, index=True)
+    kind       = Column(String, nullable=False)                  # due_tomorrow / due_now / overdue
+    fire_at    = Column(DateTime, nullable=False, index=True)    # เวลาไทย (naive) เหมือน due_date
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ---------- scheduler_leases ----------
+class SchedulerLease(Base):
+    """lease ของงานเบื้องหลัง: มีผู้ถือ (process) ได้ครั้งละ 1 ราย ต่อชื่องาน"""
+    __tablename__ = "scheduler_leases"
+
+    name        = Column(String, primary_key=True)           # เช่น notification_scheduler
+    holder      = Column(String, nullable=False)             # host:pid:token ของ process ที่เป็น leader
+    acquired_at = Column(DateTime, nullable=False)           # เริ่มเป็น leader เมื่อไร (UTC)
+    renewed_at  = Column(DateTime, nullable=False)           # heartbeat ล่าสุด (UTC)
+    expires_at  = Column(DateTime, nullable=False)           # หมดอายุ → process อื่นแย่งได้
+
 
 # ---------- renewals ----------
 class Renewal(Base):
@@ -0,0 +1,102 @@
+# app/repositories/equipment_group_repository.py
+from typing import Iterable, List, Optional
+from sqlalchemy import delete, select
+from app.config import Config
+from app.db.models import Equipment, EquipmentGroup
+from app.utils.ttl_cache import TTLCache
+
+# ✅ cache รายละเอียดต่อกลุ่ม (key = ชื่อกลุ่ม, value = dict) — ล้างทุกครั้งที่ refresh กลุ่มนั้น
+group_detail_cache = TTLCache(max_entries=Config.EQUIPMENT_GROUP_CACHE_SIZE,
+                              ttl_seconds=Config.EQUIPMENT_GROUP_CACHE_TTL)
+
+
+class EquipmentGroupRepository:
+    """
+    ✅ ดูแลตารางสรุป equipment_groups (จำนวนพร้อมใช้ / ทั้งหมด / รหัสที่ว่าง / รูปปก ต่อชื่ออุปกรณ์)
+    - write path เรียก refresh(ชื่อที่เกี่ยวข้อง) ก่อน commit → สรุปเปลี่ยนพร้อมข้อมูลจริงเสมอ
+    - คำนวณใหม่เฉพาะกลุ่มที่แตะ (O(ชิ้นในกลุ่ม)) ไม่ใช่ทั้งตาราง
+    """
+
+    AVAILABLE_STATUSES = ("available", "พร้อมใช้งาน")
+    PLACEHOLDER_IMAGE = "images/placeholder.png"
+
+    def __init__(self, db):
+        self.db = db
+
+    def list_all(self) -> List[EquipmentGroup]:
+        """อ่านทุกกลุ่มด้วย query เดียว (เรียงตามชิ้นตัวแทน เหมือนลำดับเดิมของหน้า catalog)"""
+        return self.db.query(EquipmentGroup).order_by(EquipmentGroup.equipment_id).all()
+
+    def group_name_of(self, equipment_id: int) -> Optional[str]:
+        """ชื่อกลุ่มของอุปกรณ์ชิ้นนี้ (lookup ตาม PK; ถูกลบแล้ว → None)"""
+        return self.db.execute(
+            select(Equipment.name).where(Equipment.equipment_id == equipment_id, Equipment.deleted_at.is_(None))
+        ).scalar()
+
+    def get(self, name: str) -> Optional[EquipmentGroup]:
+        return self.db.get(EquipmentGroup, name)
+
+    def refresh(self, names: Iterable[str]) -> None:
+        """คำนวณสรุปใหม่ของกลุ่มที่ระบุ (ไม่ commit — อยู่ใน transaction ของผู้เรียก)"""
+        names = sorted({n for n in names if n})
+        if not names:
+            return
+        # ล้าง cache ทั้งตอนนี้และหลัง commit (กันผู้อ่านที่โหลดค่าเดิมเข้า cache ระหว่างรอ commit)
+        group_detail_cache.invalidate_after_commit(self.db, names)
+        self.db.flush()
+
+        if (self.db.bind and self.db.bind.dialect.name) == "postgresql":
+            # 🔒 ล็อกแถวสรุปก่อนอ่านอุปกรณ์ → transaction ที่แตะกลุ่มเดียวกันต่อคิวกัน (ค่าไม่ทับกันผิด)
+            self.db.execute(
+                select(EquipmentGroup.name).where(EquipmentGroup.name.in_(names))
+                .order_by(EquipmentGroup.name).with_for_update()
+            )
+
+        E = Equipment
+        items = self.db.execute(
+            select(E.equipment_id, E.name, E.code, E.status, E.category, E.brand,
+                   E.detail, E.buy_date, E.confirm, E.cover_image)
+            .where(E.name.in_(names), E.deleted_at.is_(None))
+            .order_by(E.equipment_id)
+        ).all()
+
+        groups = {}
+        for it in items:
+            g = groups.get(it.name)
+            if g is None:
+                g = groups[it.name] = {
+                    "name": it.name,
+                    "equipment_id": it.equipment_id,
+                    "category": it.category,
+                    "brand": it.brand,
+                    "detail": it.detail,
+                    "buy_date": it.buy_date,
+                    "confirm": bool(it.confirm),
+                    "status": str(it.status or "").lower(),
+                    "total": 0,
+                    "available": 0,
+                    "available_codes": [],
+                    "cover_image": it.cover_image or self.PLACEHOLDER_IMAGE,
+                }
+            g["total"] += 1
+            if str(it.status or "").lower() in self.AVAILABLE_STATUSES:
+                g["available"] += 1
+                if it.code:
+                    g["available_codes"].append(it.code)
+
+        for g in groups.values():
+            self.db.merge(EquipmentGroup(**g))
+
+        gone = [n for n in names if n not in groups]
+        if gone:
+            self.db.execute(delete(EquipmentGroup).where(EquipmentGroup.name.in_(gone)))
+
+    def rebuild_all(self) -> int:
+        """สร้างสรุปใหม่ทั้งตาราง (ครั้งแรก / ซ่อมข้อมูล) คืนจำนวนกลุ่ม"""
+        self.db.execute(delete(EquipmentGroup))
+        names = [n for (n,) in self.db.execute(
+            select(Equipment.name).where(Equipment.deleted_at.is_(None)).distinct()
+        )]
+        self.refresh(names)
+        self.db.flush()
+        return len(names)
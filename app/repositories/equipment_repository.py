@@ -1,9 +1,18 @@
 # app/repositories/equipment_repository.py
-from typing import List, Optional
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy.sql import exists, and_
+from typing import List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import and_, func, insert, or_, select, tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from app.config import Config
 from app.db.db import SessionLocal
-from app.db.models import Equipment, EquipmentImage, StockMovement
+from app.db.models import Equipment, EquipmentImage, MovementEvent, StockMovement, User
+from app.repositories.equipment_group_repository import EquipmentGroupRepository
+from app.repositories.equipment_search_repository import EquipmentSearchRepository
+from app.utils.ttl_cache import TTLCache
+
+# ✅ cache path รูปปกต่ออุปกรณ์ (key = equipment_id, value = Equipment.cover_image หรือ None)
+cover_image_cache = TTLCache(max_entries=Config.EQUIPMENT_COVER_CACHE_SIZE,
+                             ttl_seconds=Config.EQUIPMENT_COVER_CACHE_TTL)
 
 # รองรับชื่อความสัมพันธ์รูปทั้งสองแบบ
 IMAGES_REL = getattr(Equipment, "images", None) or getattr(Equipment, "equipment_images")
@@ -14,38 +23,128 @@ class EquipmentRepository:
 
     # ---------- Query ----------
     def list(self, q: str = "", category: str = "") -> List[Equipment]:
+        if q:
+            # ✅ มีคำค้น → ใช้ดัชนีค้นหา (เรียงตามความเกี่ยวข้อง) แทน ILIKE สแกนทั้งตาราง
+            return self.search(q, category=category, per_page=None)[0]
         query = (
             self.db.query(Equipment)
             .options(joinedload(IMAGES_REL))  # preload ความสัมพันธ์รูป
-            .filter(
-                # กรองออกอุปกรณ์ที่มี movement [DELETED] (soft-delete แบบไม่แตะ schema)
-                ~exists().where(
-                    and_(
-                        StockMovement.equipment_id == Equipment.equipment_id,
-                        StockMovement.history.ilike("%[DELETED]%"),
-                    )
-                )
-            )
+            .filter(Equipment.deleted_at.is_(None))  # กรองอุปกรณ์ที่ถูก soft-delete (index บน deleted_at)
         )
-        if q:
-            like = f"%{q}%"
-            query = query.filter((Equipment.name.ilike(like)) | (Equipment.code.ilike(like)))
         if category:
             query = query.filter(Equipment.category == category)
         return query.order_by(Equipment.created_at.desc()).all()
 
+    def search(self, q: str, category: str = "", page: int = 1,
+               per_page: Optional[int] = 20) -> Tuple[List[Equipment], int]:
+        """ค้นหาแบบจัดอันดับ + แบ่งหน้า คืน (อุปกรณ์ของหน้านี้ตามอันดับ, จำนวนที่พบทั้งหมด)"""
+        offset = (max(page, 1) - 1) * per_page if per_page else 0
+        ids, total = EquipmentSearchRepository(self.db).search(q, limit=per_page, offset=offset, category=category)
+        if not ids:
+            return [], total
+        rows = (
+            self.db.query(Equipment)
+            .options(joinedload(IMAGES_REL))
+            .filter(Equipment.equipment_id.in_(ids), Equipment.deleted_at.is_(None))
+            .all()
+        )
+        by_id = {e.equipment_id: e for e in rows}
+        return [by_id[i] for i in ids if i in by_id], total
+
+    def list_page(
+        self,
+        q: str = "",
+        category: str = "",
+        limit: int = 24,
+        after: Optional[tuple] = None,
+        before: Optional[tuple] = None,
+    ) -> List[Equipment]:
+        """
+        ✅ รายการแบบ keyset เรียง (created_at, equipment_id) ใหม่ → เก่า
+        - after  = key ของแถวสุดท้ายในหน้าปัจจุบัน → หน้าที่เก่ากว่า
+        - before = key ของแถวแรกในหน้าปัจจุบัน   → หน้าที่ใหม่กว่า
+        - อ่านครั้งละ limit แถว (รูปโหลดด้วย selectin แยก query) → หน่วยความจำต่อ request คงที่
+        """
+        E = Equipment
+        key = tuple_(E.created_at, E.equipment_id)
+        query = self.db.query(E).options(selectinload(IMAGES_REL)).filter(*self._list_filters(q, category))
+        if before is not None:
+            rows = query.filter(key > tuple_(*before)).order_by(E.created_at, E.equipment_id).limit(limit).all()
+            return rows[::-1]
+        if after is not None:
+            query = query.filter(key < tuple_(*after))
+        return query.order_by(E.created_at.desc(), E.equipment_id.desc()).limit(limit).all()
+
+    def count_capped(self, q: str = "", category: str = "", cap: int = 10_000) -> Tuple[int, bool]:
+        """นับจำนวนที่ตรงเงื่อนไขแต่ไม่เกิน cap คืน (จำนวน, เกิน cap หรือไม่)"""
+        sub = select(Equipment.equipment_id).where(*self._list_filters(q, category)).limit(cap + 1).subquery()
+        n = self.db.execute(select(func.count()).select_from(sub)).scalar() or 0
+        return min(n, cap), n > cap
+
+    def api_rows(
+        self,
+        columns: List[str],
+        status: str = "",
+        category: str = "",
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        stream: bool = False,
+    ):
+        """
+        ✅ แถวสำหรับ API (เฉพาะคอลัมน์ที่ขอ) เรียงตาม equipment_id — คืน iterator ของ mapping
+        - after_id = cursor (id สุดท้ายของหน้าก่อน) → keyset บน PK
+        - stream=True → server-side cursor ดึงทีละชุด (yield_per) ไม่โหลดทั้งตารางเข้าหน่วยความจำ
+        """
+        E = Equipment
+        stmt = (
+            select(*[getattr(E, c).label(c) for c in columns])
+            .where(*self._api_filters(status, category))
+            .order_by(E.equipment_id)
+        )
+        if after_id is not None:
+            stmt = stmt.where(E.equipment_id > after_id)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        if stream:
+            stmt = stmt.execution_options(stream_results=True, yield_per=500)
+        return self.db.execute(stmt).mappings()
+
+    def catalog_version(self, status: str = "", category: str = "") -> tuple:
+        """(จำนวน, id สูงสุด, updated_at ล่าสุด) ของชุดที่กรอง — เปลี่ยนเมื่อเพิ่ม/แก้/ลบ"""
+        E = Equipment
+        return tuple(self.db.execute(
+            select(func.count(), func.max(E.equipment_id), func.max(E.updated_at))
+            .where(*self._api_filters(status, category))
+        ).one())
+
+    @staticmethod
+    def _api_filters(status: str, category: str) -> list:
+        conds = [Equipment.deleted_at.is_(None)]
+        if status:
+            conds.append(Equipment.status == status)
+        if category:
+            conds.append(Equipment.category == category)
+        return conds
+
+    def _list_filters(self, q: str, category: str) -> list:
+        conds = [Equipment.deleted_at.is_(None)]
+        if category:
+            conds.append(Equipment.category == category)
+        match = EquipmentSearchRepository(self.db).match_clause(q)
+        if match is not None:
+            conds.append(match)
+        return conds
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        return EquipmentSearchRepository(self.db).suggest(prefix, limit)
+
     def get(self, equipment_id: int) -> Optional[Equipment]:
         return (
             self.db.query(Equipment)
             .options(joinedload(IMAGES_REL))
             .filter(
                 Equipment.equipment_id == equipment_id,
-                ~exists().where(
-                    and_(
-                        StockMovement.equipment_id == Equipment.equipment_id,
-                        StockMovement.history.ilike("%[DELETED]%"),
-                    )
-                )
+                Equipment.deleted_at.is_(None),
             )
             .first()
         )
@@ -60,7 +159,32 @@ class EquipmentRepository:
             is not None
         )
 
+    def existing_codes(self, codes) -> set:
+        """รหัสที่มีอยู่แล้วในระบบ (รวมที่ถูกลบ เหมือน code_exists) — query เดียวต่อ 5,000 รหัส"""
+        codes = list(dict.fromkeys(c for c in codes if c))
+        found = set()
+        for i in range(0, len(codes), 5000):
+            found.update(self.db.execute(
+                select(Equipment.code).where(Equipment.code.in_(codes[i:i + 5000]))
+            ).scalars())
+        return found
+
     # ---------- Create / Update ----------
+    def bulk_insert_equipments(self, rows: List[dict]) -> List[int]:
+        """insert หลายแถวด้วย multi-row INSERT ... RETURNING คืน equipment_id ตามลำดับ rows (ไม่ commit)"""
+        if not rows:
+            return []
+        E = Equipment.__table__
+        result = self.db.execute(
+            insert(E).returning(E.c.equipment_id, sort_by_parameter_order=True), rows
+        )
+        return list(result.scalars())
+
+    def bulk_add_movements(self, rows: List[dict]) -> None:
+        if rows:
+            self.db.execute(insert(StockMovement.__table__), rows)
+
+
     def add_equipment(self, equipment: Equipment) -> Equipment:
         self.db.add(equipment)
         self.db.flush()  # ให้ได้ equipment_id
@@ -71,18 +195,76 @@ class EquipmentRepository:
         self.db.add(img)
         return img
 
-    def add_movement(self, equipment_id: int, actor_id: Optional[int], history: str) -> StockMovement:
-        mv = StockMovement(equipment_id=equipment_id, actor_id=actor_id, history=history)
+    def add_movement(
+        self,
+        equipment_id: int,
+        actor_id: Optional[int],
+        history: str,
+        event_type: MovementEvent = MovementEvent.OTHER,
+        changes: Optional[dict] = None,
+    ) -> StockMovement:
+        mv = StockMovement(
+            equipment_id=equipment_id, actor_id=actor_id, history=history,
+            event_type=event_type, changes=changes or None,
+        )
         self.db.add(mv)
         return mv
 
-    # เดิมเคยตั้งค่า is_active=False; ตอนนี้ไม่ใช้แล้ว (คง method ไว้แต่ไม่ทำอะไรเพื่อความเข้ากันได้)
+    def list_movements(
+        self,
+        equipment_id: int,
+        limit: int = 20,
+        before: Optional[tuple] = None,
+        event_type: Optional[MovementEvent] = None,
+    ) -> list:
+        """
+        ✅ timeline ของอุปกรณ์ (ใหม่ → เก่า) แบบ keyset
+        - before = (created_at, movement_id) ของแถวสุดท้ายในหน้าก่อน
+        - ใช้ index (equipment_id, created_at) → ไม่ต้อง OFFSET/สแกนทั้งตาราง
+        """
+        M = StockMovement
+        q = (
+            self.db.query(M, User.name.label("actor_name"))
+            .outerjoin(User, User.user_id == M.actor_id)
+            .filter(M.equipment_id == equipment_id)
+        )
+        if event_type is not None:
+            q = q.filter(M.event_type == event_type)
+        if before is not None:
+            created_at, movement_id = before
+            q = q.filter(or_(M.created_at < created_at, and_(M.created_at == created_at, M.movement_id < movement_id)))
+        return q.order_by(M.created_at.desc(), M.movement_id.desc()).limit(limit).all()
+
     def soft_delete_equipment(self, equipment: Equipment):
-        return  # no-op (ไม่แตะ schema)
+        """ทำเครื่องหมายว่าถูกลบ (แถวยังอยู่ เพื่อให้ประวัติการยืม/เคลื่อนไหวอ้างอิงได้)"""
+        if equipment.deleted_at is None:
+            equipment.deleted_at = datetime.utcnow()
+
+    def refresh_groups(self, *names: str) -> None:
+        """อัปเดตตารางสรุป equipment_groups ของชื่อที่เกี่ยวข้อง (ก่อน commit)"""
+        EquipmentGroupRepository(self.db).refresh(names)
+
+    def reindex(self, *equipments: Equipment) -> None:
+        """อัปเดตดัชนีค้นหาของอุปกรณ์ที่เพิ่ม/แก้ไข/ลบ (ก่อน commit)"""
+        EquipmentSearchRepository(self.db).index(equipments)
 
     def delete_image_row(self, image: EquipmentImage):
         self.db.delete(image)
 
+    def refresh_cover(self, equipment: Equipment) -> None:
+        """ตั้ง cover_image = รูปแรกที่เหลืออยู่ (ก่อน commit) หลังเพิ่ม/ลบแถวรูป"""
+        self.db.flush()
+        equipment.cover_image = self.db.execute(
+            select(EquipmentImage.image_path)
+            .where(EquipmentImage.equipment_id == equipment.equipment_id)
+            .order_by(EquipmentImage.equipment_image_id)
+            .limit(1)
+        ).scalar()
+        # expire_on_commit=False → collection รูปบน object เดิมไม่ถูกโหลดใหม่เอง
+        self.db.expire(equipment, ["images", "equipment_images"])
+        # ล้าง cache ทั้งตอนนี้และหลัง commit (เหมือน group_detail_cache)
+        cover_image_cache.invalidate_after_commit(self.db, [equipment.equipment_id])
+
     def commit(self):
         self.db.commit()
 
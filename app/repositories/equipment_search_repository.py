@@ -0,0 +1,212 @@
+# app/repositories/equipment_search_repository.py
+"""
+🔎 ดัชนีค้นหาอุปกรณ์ (name / code / brand / category / detail)
+- SQLite     : ตาราง FTS5 `equipment_search` (tokenizer trigram → ค้นกลางคำภาษาไทยได้) rowid = equipment_id
+               ต้องอัปเดตเองทุกครั้งที่อุปกรณ์เปลี่ยน (index / remove)
+- PostgreSQL : GIN index (pg_trgm) บน expression ของคอลัมน์เหล่านี้ในตาราง equipments → DB อัปเดตเอง
+ทั้งสองแบบ: คำค้นสั้นกว่า 3 ตัวอักษรใช้ trigram ไม่ได้ → กรองด้วย LIKE แทน
+"""
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import and_, literal_column, or_, select, func, text
+from app.db.models import Equipment
+
+FTS_TABLE = "equipment_search"
+FIELDS = ("name", "code", "brand", "category", "detail")
+WEIGHTS = (10.0, 8.0, 3.0, 2.0, 1.0)   # น้ำหนัก bm25 ตามลำดับ FIELDS
+MIN_TRIGRAM = 3
+
+# expression เดียวกับที่ใช้สร้าง GIN index (ต้องตรงตัวอักษร planner ถึงจะใช้ index)
+PG_DOC_SQL = "lower(" + " || ' ' || ".join(f"coalesce({f}, '')" for f in FIELDS) + ")"
+PG_INDEX = "ix_equipments_search_trgm"
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+class EquipmentSearchRepository:
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def _is_pg(self) -> bool:
+        return (self.db.bind and self.db.bind.dialect.name) == "postgresql"
+
+    # ---------- schema (เรียกจาก migrations) ----------
+    @staticmethod
+    def ensure_index(conn) -> bool:
+        """สร้างดัชนีถ้ายังไม่มี + เติมข้อมูลอุปกรณ์ที่มีอยู่ครั้งแรก (idempotent)"""
+        if conn.dialect.name == "postgresql":
+            exists = conn.execute(text("SELECT 1 FROM pg_indexes WHERE indexname = :n"), {"n": PG_INDEX}).first()
+            if exists:
+                return False
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON equipments USING gin (({PG_DOC_SQL}) gin_trgm_ops)"))
+            return True
+
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": FTS_TABLE}
+        ).first()
+        if exists:
+            return False
+        conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({', '.join(FIELDS)}, tokenize='trigram')"))
+        conn.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELDS)}) "
+            f"SELECT equipment_id, {', '.join(FIELDS)} FROM equipments WHERE deleted_at IS NULL"
+        ))
+        return True
+
+    # ---------- write ----------
+    def index(self, equipments: Iterable[Equipment]) -> None:
+        """เพิ่ม/แทนที่เอกสารของอุปกรณ์ (ชิ้นที่ถูกลบแล้วจะถูกเอาออก)"""
+        if self._is_pg:
+            return  # GIN index อัปเดตพร้อมแถวของ equipments อยู่แล้ว
+        equipments = list(equipments)
+        if not equipments:
+            return
+        self.db.flush()
+        self.remove(e.equipment_id for e in equipments)
+        self.index_rows(
+            {"equipment_id": e.equipment_id, **{f: getattr(e, f) for f in FIELDS}}
+            for e in equipments if e.deleted_at is None
+        )
+
+    def index_rows(self, rows: Iterable[dict]) -> None:
+        """เพิ่มเอกสารจาก dict (equipment_id + FIELDS) ของแถวที่เพิ่ง insert — ใช้กับการนำเข้าแบบกลุ่ม"""
+        if self._is_pg:
+            return
+        rows = [{"rowid": r["equipment_id"], **{f: r.get(f) or "" for f in FIELDS}} for r in rows]
+        if rows:
+            self.db.execute(
+                text(f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FIELDS)}) "
+                     f"VALUES (:rowid, {', '.join(':' + f for f in FIELDS)})"),
+                rows,
+            )
+
+    def remove(self, equipment_ids: Iterable[int]) -> None:
+        if self._is_pg:
+            return
+        ids = [int(i) for i in equipment_ids]
+        if ids:
+            self.db.execute(
+                text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({', '.join(str(i) for i in ids)})")
+            )
+
+    # ---------- read ----------
+    def search(self, q: str, limit: Optional[int] = 20, offset: int = 0,
+               category: str = "") -> Tuple[List[int], int]:
+        """
+        ✅ ค้นหาแบบจัดอันดับ คืน (equipment_id ของหน้านี้ตามอันดับ, จำนวนที่พบทั้งหมด)
+        - ทุกคำในคำค้นต้องพบ (AND) ในฟิลด์ใดฟิลด์หนึ่ง
+        """
+        terms = [t for t in (q or "").lower().split() if t]
+        if not terms:
+            return [], 0
+        return (self._search_pg if self._is_pg else self._search_sqlite)(terms, limit, offset, category)
+
+    def match_clause(self, q: str):
+        """
+        เงื่อนไข WHERE บนตาราง equipments: "ตรงกับคำค้น" (ใช้ดัชนีค้นหา)
+        สำหรับ query อื่นที่เรียงลำดับเอง (เช่น รายการแบ่งหน้าแบบ keyset)
+        """
+        terms = [t for t in (q or "").lower().split() if t]
+        if not terms:
+            return None
+        if self._is_pg:
+            doc = literal_column(PG_DOC_SQL)
+            return and_(*[doc.like(f"%{_escape_like(t)}%", escape="\\") for t in terms])
+        cond, params, _ = self._sqlite_cond(terms, "", prefix="fts_")
+        return text(f"equipments.equipment_id IN (SELECT rowid FROM {FTS_TABLE} WHERE {cond})").bindparams(**params)
+
+    @staticmethod
+    def _sqlite_cond(terms, category, prefix=""):
+        """คืน (เงื่อนไขบนตาราง FTS, params, มี MATCH หรือไม่)"""
+        long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM]
+        short_terms = [t for t in terms if len(t) < MIN_TRIGRAM]
+
+        where, params = [], {}
+        if long_terms:
+            where.append(f"{FTS_TABLE} MATCH :{prefix}match")
+            params[f"{prefix}match"] = " AND ".join(_fts_phrase(t) for t in long_terms)
+        for i, t in enumerate(short_terms):
+            where.append("(" + " OR ".join(f"{f} LIKE :{prefix}s{i} ESCAPE '\\'" for f in FIELDS) + ")")
+            params[f"{prefix}s{i}"] = f"%{_escape_like(t)}%"
+        if category:
+            where.append(f"category = :{prefix}category")
+            params[f"{prefix}category"] = category
+        return " AND ".join(where), params, bool(long_terms)
+
+    def _search_sqlite(self, terms, limit, offset, category):
+        cond, params, has_match = self._sqlite_cond(terms, category)
+        total = self.db.execute(text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {cond}"), params).scalar() or 0
+        # bm25 ใช้ได้เฉพาะเมื่อมี MATCH; ไม่มี → เรียงชื่อที่ขึ้นต้นด้วยคำค้นก่อน
+        rank = f"bm25({FTS_TABLE}, {', '.join(map(str, WEIGHTS))}), " if has_match else ""
+        sql = (
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {cond} "
+            f"ORDER BY (name LIKE :prefix ESCAPE '\\') DESC, {rank}rowid"
+        )
+        params["prefix"] = f"{_escape_like(terms[0])}%"
+        if limit is not None:
+            sql += " LIMIT :limit OFFSET :offset"
+            params.update(limit=limit, offset=offset)
+        ids = [r[0] for r in self.db.execute(text(sql), params)]
+        return ids, total
+
+    def _search_pg(self, terms, limit, offset, category):
+        E = Equipment
+        doc = literal_column(PG_DOC_SQL)
+        q = " ".join(terms)
+        conds = [E.deleted_at.is_(None)] + [doc.like(f"%{_escape_like(t)}%", escape="\\") for t in terms]
+        if category:
+            conds.append(E.category == category)
+
+        total = self.db.execute(select(func.count()).select_from(E).where(*conds)).scalar() or 0
+        stmt = (
+            select(E.equipment_id)
+            .where(*conds)
+            .order_by(
+                func.lower(E.name).like(f"{_escape_like(terms[0])}%", escape="\\").desc(),
+                func.word_similarity(q, doc).desc(),
+                E.equipment_id,
+            )
+        )
+        if limit is not None:
+            stmt = stmt.limit(limit).offset(offset)
+        return list(self.db.execute(stmt).scalars()), total
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[dict]:
+        """
+        ⚡ autocomplete: อุปกรณ์ที่ชื่อหรือรหัสขึ้นต้นด้วย prefix
+        - prefix ≥ 3 ตัว: trigram index ตัดผู้สมัครก่อน แล้วค่อยกรอง prefix
+        - เรียงชื่อสั้นก่อนใน DB ก่อน LIMIT → ชื่อที่ตรงที่สุด (เช่น "cam" → "Camera") ไม่หลุด และผลคงที่ทุกครั้ง
+        """
+        prefix = (prefix or "").strip().lower()
+        if not prefix:
+            return []
+        like = f"{_escape_like(prefix)}%"
+
+        if self._is_pg:
+            E = Equipment
+            conds = [E.deleted_at.is_(None),
+                     or_(func.lower(E.name).like(like, escape="\\"), func.lower(E.code).like(like, escape="\\"))]
+            if len(prefix) >= MIN_TRIGRAM:
+                conds.append(literal_column(PG_DOC_SQL).like(f"%{_escape_like(prefix)}%", escape="\\"))
+            rows = self.db.execute(
+                select(E.equipment_id, E.name, E.code).where(*conds)
+                .order_by(func.length(E.name), E.name, E.equipment_id).limit(limit)
+            ).all()
+        else:
+            params = {"like": like, "limit": limit}
+            cond = "(name LIKE :like ESCAPE '\\' OR code LIKE :like ESCAPE '\\')"
+            if len(prefix) >= MIN_TRIGRAM:
+                cond = f"{FTS_TABLE} MATCH :match AND " + cond
+                params["match"] = "{name code}: " + _fts_phrase(prefix)
+            rows = self.db.execute(
+                text(f"SELECT rowid, name, code FROM {FTS_TABLE} WHERE {cond} "
+                     "ORDER BY length(name), name, rowid LIMIT :limit"), params
+            ).all()
+        return [{"equipment_id": r[0], "name": r[1], "code": r[2]} for r in rows]
@@ -2,153 +2,219 @@
 # app/repositories/history_repository.py
 # =============================================
 from __future__ import annotations
-from typing import List, Dict, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, func, or_, select, tuple_
 
 from app.db.db import SessionLocal
-from app.db.models import RentReturn, Equipment, StatusRent, EquipmentImage
+from app.db.models import RentReturn, Equipment, StatusRent, User, lower_bytewise
+
+
+# ✅ identity ตรงกับ user ไม่เกินนี้ → match_identity คืนรายชื่อให้ seek ราย user; มากกว่านี้ → ไล่ตามลำดับ start_date
+_IDENTITY_SEEK_LIMIT = 200
+
+
+def _prefix_range(column, prefix: str):
+    """
+    prefix search แบบใช้ index ได้: lower(col) >= 'abc' AND lower(col) < 'abd'
+    (ตรงกับ expression index lower(student_id) / lower(employee_id) — LIKE 'abc%' ไม่ใช้ index บน SQLite)
+    - ช่วงนี้เท่ากับ "ขึ้นต้นด้วย" เฉพาะเมื่อเทียบแบบ byte-wise → lower_bytewise (COLLATE "C" บน Postgres)
+    """
+    prefix = prefix.lower()
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    key = lower_bytewise(column)
+    return and_(key >= prefix, key < upper)
 
 
 class RentHistoryRepository:
     """
     ชั้น Repository สำหรับอ่านประวัติการยืมคืนของผู้ใช้
+    - ทุกเมธอดสร้าง query จาก _history_stmt ชุดเดียว: กรอง / เรียง / แบ่งหน้า (keyset) ใน SQL ทั้งหมด
     """
 
     def __init__(self, session: Optional[Session] = None):
         self.session: Session = session or SessionLocal()
 
-    # ---------- โค้ดเดิมที่เคยใช้แล้วรูปขึ้น ----------
-    def list_by_user(self, user_id: int, returned_only: bool = True) -> List[Dict]:
+    # ---------- ชั้นสร้าง query กลาง ----------
+    @staticmethod
+    def _order_col(date_field: str = "start_date"):
+        """คอลัมน์ที่ใช้เรียง/แบ่งหน้า — return_date ที่ยังไม่คืนใช้ start_date แทน (เหมือนพฤติกรรมเดิม)"""
+        if date_field == "return_date":
+            return func.coalesce(RentReturn.return_date, RentReturn.start_date)
+        return RentReturn.start_date
+
+    def _history_stmt(self, *, user_id: Optional[int] = None, returned_only: bool = False,
+                      start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      date_field: str = "start_date", identity: str = "",
+                      user_ids: Optional[Sequence[int]] = None, with_people: bool = False):
         """
-        ดึงประวัติการยืมของ user_id
-        ถ้า returned_only=True → แสดงเฉพาะที่คืนแล้ว (return_date != NULL)
+        select ประวัติ + อุปกรณ์ (cover_image) + สถานะ (ยังไม่ order / limit) — สร้าง statement อย่างเดียว ไม่ query
+        - start / end  : ช่วงของ date_field (รวมปลาย)
+        - identity     : student_id หรือ employee_id ที่ขึ้นต้นด้วยข้อความนี้ (ไม่สนตัวพิมพ์)
+        - user_ids     : ผลของ match_identity(identity) ถ้ามี (แทน subquery ของ identity)
+        - with_people  : เพิ่มชื่อผู้ยืม / ผู้รับคืน / อาจารย์ที่รับรอง (หน้า admin)
         """
-        img_subq = (
-            self.session.query(
-                EquipmentImage.equipment_id,
-                func.min(EquipmentImage.equipment_image_id).label("min_id")
-            )
-            .group_by(EquipmentImage.equipment_id)
-            .subquery()
-        )
+        columns = [
+            RentReturn.rent_id,
+            RentReturn.user_id,
+            RentReturn.start_date,
+            RentReturn.due_date,
+            RentReturn.return_date,
+            RentReturn.reason,
+            Equipment.equipment_id,
+            Equipment.name.label("equipment_name"),
+            Equipment.code.label("equipment_code"),
+            Equipment.category,
+            Equipment.cover_image,  # ✅ denormalized: ไม่ต้อง GROUP BY ทั้งตาราง equipment_images
+            StatusRent.name.label("status_name"),
+            StatusRent.color_code.label("status_color"),
+        ]
+        if with_people:
+            borrower, receiver, instructor = aliased(User), aliased(User), aliased(User)
+            columns += [
+                borrower.name.label("user_name"),
+                borrower.student_id,
+                borrower.employee_id,
+                receiver.name.label("receiver_name"),
+                instructor.name.label("instructor_name"),
+            ]
 
         stmt = (
-            select(
-                RentReturn.rent_id,
-                RentReturn.start_date,
-                RentReturn.due_date,
-                RentReturn.return_date,
-                RentReturn.reason,
-                Equipment.equipment_id,
-                Equipment.name.label("equipment_name"),
-                Equipment.code.label("equipment_code"),
-                Equipment.category,
-                StatusRent.name.label("status_name"),
-                StatusRent.color_code.label("status_color"),
-                EquipmentImage.image_path.label("cover_image"),
-            )
+            select(*columns)
             .outerjoin(Equipment, Equipment.equipment_id == RentReturn.equipment_id)
             .outerjoin(StatusRent, StatusRent.status_id == RentReturn.status_id)
-            .outerjoin(img_subq, img_subq.c.equipment_id == Equipment.equipment_id)
-            .outerjoin(EquipmentImage, EquipmentImage.equipment_image_id == img_subq.c.min_id)
-            .where(RentReturn.user_id == user_id)
-            .order_by(RentReturn.start_date.desc())
         )
+        if with_people:
+            stmt = (
+                stmt.join(borrower, borrower.user_id == RentReturn.user_id)
+                .outerjoin(receiver, receiver.user_id == RentReturn.check_by)
+                .outerjoin(instructor, instructor.user_id == RentReturn.teacher_confirmed)
+            )
 
+        if user_id is not None:
+            stmt = stmt.where(RentReturn.user_id == user_id)
         if returned_only:
             stmt = stmt.where(RentReturn.return_date.isnot(None))
-
-        rows = self.session.execute(stmt).all()
-        return [dict(r._mapping) for r in rows]
-
-    # ---------- อินเตอร์เฟซใหม่: ทำงานเทียบเท่าโค้ดเดิม ----------
-    def fetch_for_user(self, user_id: int, f) -> List[Dict]:
+        field_col = RentReturn.return_date if date_field == "return_date" else RentReturn.start_date
+        if start:
+            stmt = stmt.where(field_col >= start)
+        if end:
+            stmt = stmt.where(field_col <= end)
+        if user_ids is not None:
+            # คนไม่มาก (จาก match_identity) → seek ทีละ user บน index (user_id, start_date, rent_id)
+            stmt = stmt.where(RentReturn.user_id.in_(user_ids))
+        elif identity:
+            # prefix กว้าง / ไม่ได้หา user มาก่อน → ไล่ index (start_date, rent_id) ตามลำดับแล้วเช็คว่า user อยู่ในชุด
+            # (+ 0 กันไม่ให้ planner เลือก index ของ user_id แล้วต้อง sort แถวเกือบทั้งตาราง)
+            stmt = stmt.where((RentReturn.user_id + 0).in_(self._identity_users(identity)))
+        return stmt
+
+    @staticmethod
+    def _identity_users(identity: str):
+        """select user_id ที่รหัสขึ้นต้นด้วย identity (index lower(...) บน users)"""
+        return select(User.user_id).where(or_(
+            _prefix_range(User.student_id, identity),
+            _prefix_range(User.employee_id, identity),
+        ))
+
+    def match_identity(self, identity: str, limit: Optional[int] = None) -> Optional[List[int]]:
         """
-        รองรับ HistoryFilter แบบโค้ดใหม่
-        map ไปใช้ list_by_user() เพื่อคงพฤติกรรมเดิมให้รูปขึ้นแน่ๆ
+        user_id ที่รหัสขึ้นต้นด้วย identity — เกิน limit คน (prefix กว้าง) → None ให้ statement ใช้ subquery แทน
         """
-        returned_only = bool(getattr(f, "returned_only", False))
-        rows = self.list_by_user(user_id, returned_only=returned_only)
+        limit = _IDENTITY_SEEK_LIMIT if limit is None else limit
+        ids = self.session.scalars(self._identity_users(identity).limit(limit + 1)).all()
+        return ids if len(ids) <= limit else None
 
-        # กรองช่วงวันที่/เรียงลำดับตาม f ถ้าต้องการ (optional)
-        start_date = getattr(f, "start_date", None)
-        end_date   = getattr(f, "end_date", None)
-        date_field = getattr(f, "date_field", "start_date") or "start_date"
-        order      = (getattr(f, "order", "desc") or "desc").lower()
-
-        if start_date or end_date:
-            def in_range(row_dt):
-                if row_dt is None:
-                    return False
-                ok = True
-                if start_date:
-                    ok = ok and (row_dt >= start_date)
-                if end_date:
-                    ok = ok and (row_dt <= end_date)
-                return ok
+    def _ordered(self, stmt, date_field: str = "start_date", order: str = "desc",
+                 after: Optional[Tuple[datetime, int]] = None, limit: Optional[int] = None):
+        """
+        เรียง (date_field, rent_id) + keyset: after = (ค่าที่ใช้เรียง, rent_id) ของแถวสุดท้ายในหน้าก่อน
+        ผู้ใช้คนเดียว → ใช้ index (user_id, start_date, rent_id) / ทุกคน → (start_date, rent_id)
+        """
+        col = self._order_col(date_field)
+        asc = (order or "desc").lower() == "asc"
+        if after is not None:
+            key = tuple_(col, RentReturn.rent_id)
+            stmt = stmt.where(key > after if asc else key < after)
+        stmt = stmt.order_by(*((col.asc(), RentReturn.rent_id.asc()) if asc
+                               else (col.desc(), RentReturn.rent_id.desc())))
+        return stmt.limit(limit) if limit is not None else stmt
+
+    def _rows(self, stmt, date_field: str = "start_date", order: str = "desc",
+              after: Optional[Tuple[datetime, int]] = None, limit: Optional[int] = None) -> List[Dict]:
+        stmt = self._ordered(stmt, date_field, order, after, limit)
+        return [dict(r._mapping) for r in self.session.execute(stmt)]
+
+    @staticmethod
+    def _filter_args(f) -> Dict:
+        """HistoryFilter (หรือ object ที่มี attribute เดียวกัน) → kwargs ของ _history_stmt"""
+        return {
+            "returned_only": bool(getattr(f, "returned_only", False)),
+            "start": getattr(f, "start_date", None),
+            "end": getattr(f, "end_date", None),
+            "date_field": getattr(f, "date_field", "start_date") or "start_date",
+        }
 
-            key = "start_date" if date_field == "start_date" else "return_date"
-            rows = [r for r in rows if in_range(r.get(key))]
+    # ---------- โค้ดเดิมที่เคยใช้แล้วรูปขึ้น ----------
+    def list_by_user(self, user_id: int, returned_only: bool = True) -> List[Dict]:
+        """
+        ดึงประวัติการยืมของ user_id (ใหม่ → เก่า)
+        ถ้า returned_only=True → แสดงเฉพาะที่คืนแล้ว (return_date != NULL)
+        """
+        return self._rows(self._history_stmt(user_id=user_id, returned_only=returned_only))
 
-        # เรียง
-        key = "start_date" if date_field == "start_date" else "return_date"
-        rows.sort(key=lambda r: (r.get(key) or r.get("start_date") or r.get("return_date")), reverse=(order!="asc"))
-        return rows
+    # ---------- อินเตอร์เฟซใหม่ ----------
+    def fetch_for_user(self, user_id: int, f, after: Optional[Tuple[datetime, int]] = None,
+                       limit: Optional[int] = None) -> List[Dict]:
+        """
+        ประวัติของผู้ใช้คนเดียวตาม HistoryFilter — กรองช่วงวันที่ / เรียง / แบ่งหน้าใน SQL
+        (limit=None → ทั้งหมด)
+        """
+        args = self._filter_args(f)
+        return self._rows(self._history_stmt(user_id=user_id, **args), args["date_field"],
+                          getattr(f, "order", "desc"), after=after, limit=limit)
 
     # ---------- เผื่อมีหน้า all users ใช้งาน ----------
-    def fetch_all(self, f) -> List[Dict]:
+    def fetch_all(self, f, after: Optional[Tuple[datetime, int]] = None,
+                  limit: Optional[int] = None) -> List[Dict]:
         """
-        แบบง่าย: ดึงทุก user (จะไม่มีชื่อผู้ยืม ถ้าต้องการให้เพิ่ม join User เอง)
-        ใช้ pattern เดียวกับ list_by_user แต่ไม่ where user_id
+        แบบง่าย: ดึงทุก user (จะไม่มีชื่อผู้ยืม — หน้า admin ใช้ admin_page)
         """
-        img_subq = (
-            self.session.query(
-                EquipmentImage.equipment_id,
-                func.min(EquipmentImage.equipment_image_id).label("min_id")
-            )
-            .group_by(EquipmentImage.equipment_id)
-            .subquery()
-        )
+        args = self._filter_args(f)
+        return self._rows(self._history_stmt(**args), args["date_field"],
+                          getattr(f, "order", "desc"), after=after, limit=limit)
 
-        stmt = (
-            select(
-                RentReturn.rent_id,
-                RentReturn.user_id,
-                RentReturn.start_date,
-                RentReturn.due_date,
-                RentReturn.return_date,
-                RentReturn.reason,
-                Equipment.equipment_id,
-                Equipment.name.label("equipment_name"),
-                Equipment.code.label("equipment_code"),
-                Equipment.category,
-                StatusRent.name.label("status_name"),
-                StatusRent.color_code.label("status_color"),
-                EquipmentImage.image_path.label("cover_image"),
-            )
-            .outerjoin(Equipment, Equipment.equipment_id == RentReturn.equipment_id)
-            .outerjoin(StatusRent, StatusRent.status_id == RentReturn.status_id)
-            .outerjoin(img_subq, img_subq.c.equipment_id == Equipment.equipment_id)
-            .outerjoin(EquipmentImage, EquipmentImage.equipment_image_id == img_subq.c.min_id)
-        )
+    # ---------- หน้า admin: ประวัติของทุกคนใน query เดียว ----------
+    def admin_stmt(self, start: Optional[datetime] = None, end: Optional[datetime] = None, identity: str = "",
+                   user_ids: Optional[Sequence[int]] = None):
+        """
+        select ประวัติของผู้ใช้ทุกคน + ผู้ยืม / อุปกรณ์ / สถานะ / ผู้รับคืน / อาจารย์ที่รับรอง (ยังไม่ order / limit)
+        - start / end : ช่วงของ start_date (รวมปลาย)
+        - identity    : student_id หรือ employee_id ที่ขึ้นต้นด้วยข้อความนี้ (ไม่สนตัวพิมพ์)
+        - user_ids    : ผลของ match_identity(identity) — ส่งมาเมื่อ prefix แคบ ให้ seek ราย user แทน
+        """
+        return self._history_stmt(start=start, end=end, identity=identity, user_ids=user_ids, with_people=True)
 
-        # filter คืนแล้ว
-        if getattr(f, "returned_only", False):
-            stmt = stmt.where(RentReturn.return_date.isnot(None))
+    def admin_page(self, start: Optional[datetime] = None, end: Optional[datetime] = None, identity: str = "",
+                   after: Optional[Tuple[datetime, int]] = None, limit: int = 50,
+                   user_ids: Optional[Sequence[int]] = None) -> List[Dict]:
+        """
+        ✅ 1 หน้าของประวัติทุกคน (ใหม่ → เก่า) แบบ keyset บน index (start_date, rent_id)
+        - after = (start_date, rent_id) ของแถวสุดท้ายในหน้าก่อน
+        """
+        return self._rows(self.admin_stmt(start, end, identity, user_ids), after=after, limit=limit)
+
+    def admin_iter(self, start: Optional[datetime] = None, end: Optional[datetime] = None, identity: str = "",
+                   after: Optional[Tuple[datetime, int]] = None, limit: Optional[int] = 50,
+                   chunk_size: int = 100, user_ids: Optional[Sequence[int]] = None) -> Iterator[Dict]:
+        """
+        เหมือน admin_page แต่ทยอยคืนทีละแถว — ให้ template / ไฟล์ export stream ได้โดยไม่รอทั้งชุด
+        - server-side cursor (stream_results) ดึงทีละ chunk_size แถว; limit=None → ทุกแถวที่ตรงเงื่อนไข
+        """
+        stmt = self._ordered(self.admin_stmt(start, end, identity, user_ids), after=after, limit=limit)
+        for row in self.session.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size)):
+            yield dict(row._mapping)
 
-        # filter ช่วงวันที่
-        start_date = getattr(f, "start_date", None)
-        end_date   = getattr(f, "end_date", None)
-        field_col  = RentReturn.start_date if getattr(f, "date_field", "start_date") == "start_date" else RentReturn.return_date
-        if start_date:
-            stmt = stmt.where(field_col >= start_date)
-        if end_date:
-            stmt = stmt.where(field_col <= end_date)
-
-        # order
-        order = (getattr(f, "order", "desc") or "desc").lower()
-        stmt = stmt.order_by(field_col.asc() if order == "asc" else field_col.desc())
-
-        rows = self.session.execute(stmt).all()
-        return [dict(r._mapping) for r in rows]
+    def close(self):
+        self.session.close()
@@ -10,33 +10,21 @@ class HomeRepository:
     def get_top_borrowed(self, limit: int = 8):
         """อุปกรณ์ยอดนิยม: เฉพาะที่ status = 'available' + มีรูป"""
         with self._session_factory() as db:
-            # ใช้ subquery เพื่อหาภาพแรกของแต่ละอุปกรณ์
-            subq = (
-                db.query(
-                    M.EquipmentImage.equipment_id,
-                    func.min(M.EquipmentImage.equipment_image_id).label("first_image_id")
-                )
-                .group_by(M.EquipmentImage.equipment_id)
-                .subquery()
-            )
-
             q = (
                 db.query(
                     M.Equipment.equipment_id,
                     M.Equipment.name,
                     M.Equipment.code,
                     func.count(M.RentReturn.rent_id).label("borrow_count"),
-                    M.EquipmentImage.image_path.label("image_path"),
+                    M.Equipment.cover_image.label("image_path"),  # ✅ รูปปกเก็บไว้บน equipments แล้ว
                 )
                 .join(M.RentReturn, M.RentReturn.equipment_id == M.Equipment.equipment_id)
-                .outerjoin(subq, subq.c.equipment_id == M.Equipment.equipment_id)
-                .outerjoin(M.EquipmentImage, M.EquipmentImage.equipment_image_id == subq.c.first_image_id)
                 .filter(func.lower(M.Equipment.status) == "available")  # เฉพาะของที่ว่าง
                 .group_by(
                     M.Equipment.equipment_id,
                     M.Equipment.name,
                     M.Equipment.code,
-                    M.EquipmentImage.image_path
+                    M.Equipment.cover_image,
                 )
                 .order_by(func.count(M.RentReturn.rent_id).desc(), M.Equipment.name.asc())
                 .limit(limit)
@@ -1,8 +1,9 @@
 from sqlalchemy import inspect
 from sqlalchemy.exc import SQLAlchemyError
 from app.db.db import SessionLocal, engine
-from app.db.models import ItemBroke, RentReturn
-from sqlalchemy.orm import joinedload, load_only
+from app.db.models import ItemBroke, ItemBrokeImage, RentReturn
+from app.services.image_store import image_store
+from sqlalchemy.orm import joinedload, load_only, selectinload
 
 class ItemBrokeRepository:
     def __init__(self):
@@ -64,3 +65,42 @@ class ItemBrokeRepository:
         except SQLAlchemyError as e:
             self.db.rollback()
             raise e
+
+    def get(self, item_broke_id: int):
+        return (
+            self.db.query(ItemBroke)
+            .options(
+                selectinload(ItemBroke.item_broke_images),
+                joinedload(ItemBroke.rent_return).joinedload(RentReturn.equipment),
+            )
+            .filter(ItemBroke.item_broke_id == item_broke_id)
+            .first()
+        )
+
+    def create(self, rent_id, type, detail, images=None, equipment_name=None) -> ItemBroke:
+        """บันทึกรายงานของหาย/ชำรุด + รูปหลักฐาน (ไฟล์ไปที่ storage ผ่าน image_store: local / S3)"""
+        try:
+            report = ItemBroke(rent_id=rent_id, type=type, detail=detail, equipment_name=equipment_name)
+            self.db.add(report)
+            self.db.flush()
+            for f in images or []:
+                if f and f.filename:
+                    path = image_store.save(f, folder="uploads/item_broke")
+                    self.db.add(ItemBrokeImage(item_broke_id=report.item_broke_id, image_path=path))
+            self.db.commit()
+            return report
+        except SQLAlchemyError as e:
+            self.db.rollback()
+            raise e
+
+    def update_status(self, item_broke_id: int, status: str) -> bool:
+        report = self.db.get(ItemBroke, item_broke_id)
+        if not report or not status:
+            return False
+        try:
+            report.status = status
+            self.db.commit()
+            return True
+        except SQLAlchemyError:
+            self.db.rollback()
+            return False
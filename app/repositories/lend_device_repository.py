@@ -1,7 +1,7 @@
 from sqlalchemy.orm import joinedload
-from sqlalchemy.sql import exists, and_
 from app.db.db import SessionLocal
-from app.db.models import Equipment, StockMovement
+from app.db.models import Equipment
+from app.repositories.equipment_group_repository import EquipmentGroupRepository, group_detail_cache
 
 class LendDeviceRepository:
     def __init__(self):
@@ -11,14 +11,7 @@ class LendDeviceRepository:
         results = (
             self.db.query(Equipment)
             .options(joinedload(Equipment.equipment_images))
-            .filter(
-                ~exists().where(
-                    and_(
-                        StockMovement.equipment_id == Equipment.equipment_id,
-                        StockMovement.history.ilike("%[DELETED]%")
-                    )
-                )
-            )
+            .filter(Equipment.deleted_at.is_(None))  # ✅ ไม่แสดงอุปกรณ์ที่ถูกลบ
             .all()
         )
 
@@ -41,5 +34,43 @@ class LendDeviceRepository:
             })
         return data
 
+    def get_equipment_groups(self):
+        """✅ สรุปต่อกลุ่มจาก equipment_groups (query เดียว ไม่โหลดทุกชิ้น/ทุกรูป)"""
+        return [self._group_to_item(g) for g in EquipmentGroupRepository(self.db).list_all()]
+
+    def get_equipment_group(self, equipment_id: int):
+        """
+        ✅ กลุ่มของอุปกรณ์ชิ้นเดียว (หน้า detail)
+        - หาชื่อกลุ่มจาก PK แล้วอ่านสรุปของกลุ่มนั้น (ผ่าน cache ต่อกลุ่ม)
+        """
+        groups = EquipmentGroupRepository(self.db)
+        name = groups.group_name_of(equipment_id)
+        if name is None:
+            return None
+
+        def load(key):
+            g = groups.get(key)
+            return self._group_to_item(g) if g else None
+
+        item = group_detail_cache.get(name, load)
+        return dict(item) if item else None
+
+    @staticmethod
+    def _group_to_item(g):
+        return {
+            "equipment_id": g.equipment_id,
+            "name": g.name,
+            "amount": g.available,
+            "total": g.total,
+            "image": g.cover_image,
+            "category": g.category or "",
+            "brand": g.brand or "",
+            "detail": g.detail or "",
+            "buy_date": g.buy_date or "",
+            "confirm": bool(g.confirm),
+            "status": g.status or "",
+            "codes": list(g.available_codes or []),
+        }
+
     def close(self):
         self.db.close()
@@ -1,6 +1,9 @@
 from app.db.db import SessionLocal
 from app.db.models import User,RentReturn, Equipment
 from sqlalchemy.exc import SQLAlchemyError
+from app.repositories.equipment_group_repository import EquipmentGroupRepository
+from app.repositories.notification_timer_repository import NotificationTimerRepository
+from app.scheduler.wakeup import request_wakeup
 
 
 def get_all_users():
@@ -40,16 +43,22 @@ def insert_rent_record(data):
             # ✅ บันทึกข้อมูลการยืม
             rent_record = RentReturn(**data)
             db.add(rent_record)
+            db.flush()  # ให้ได้ rent_id
+
+            # ⏰ ตั้งเวลาปลุกแจ้งเตือน (due-24h / due-1h / due) ใน transaction เดียวกัน
+            next_fire = NotificationTimerRepository(db).schedule_for_rent(rent_record.rent_id, rent_record.due_date)
 
                     # ✅ อัปเดตสถานะอุปกรณ์เป็น unavailable
             equipment = db.query(Equipment).filter(Equipment.equipment_id == data["equipment_id"]).first()
             if equipment:
                 equipment.status = "unavailable"
                 db.add(equipment)
+                EquipmentGroupRepository(db).refresh([equipment.name])
 
             # ✅ Commit การเปลี่ยนแปลง
             db.commit()
             db.close()
+            request_wakeup(next_fire)
 
             print("✅ บันทึกข้อมูลเรียบร้อย และอัปเดตสถานะอุปกรณ์เป็น unavailable")
             return {"status": "success"}
@@ -1,56 +1,261 @@
 # app/repositories/notification_repository.py
-from datetime import datetime, timezone, timedelta, time, date
-from sqlalchemy import func, cast, Integer, and_, select, exists
-from sqlalchemy.dialects.postgresql import JSONB
+from datetime import datetime, timezone, timedelta, date
+from sqlalchemy import func, and_, or_, select, exists, case, update, bindparam
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.db import models as M
 
 
 class NotificationRepository:
+    # คีย์กันซ้ำ ต้องตรงกับ unique index uq_notifications_dedup
+    DEDUP_KEY = ["user_id", "rent_id", "template", "channel", "dedup_day"]
+    IN_APP_CHANNEL = "system"  # แจ้งเตือนบนกระดิ่งในเว็บ (ไม่ต้องส่งออก)
+    BULK_CHUNK = 500  # กันเกินจำนวน bind parameter ต่อ statement (SQLite)
+
     def __init__(self, db):
         # db = SQLAlchemy Session
         self.db = db
 
     def create(self, data):
-        notif = M.Notification(**data)
+        notif = M.Notification(**self._with_dedup_key(data))
         self.db.add(notif)
         self.db.flush()
         return notif
 
-    def exists_today(self, user_id, rent_id, template, day: date | None = None) -> bool:
+    def bulk_create(self, rows: list[dict]) -> int:
+        """
+        ✅ เพิ่มแจ้งเตือนหลายรายการด้วย INSERT แบบ multi-row VALUES
+        - ใช้ ON CONFLICT DO NOTHING บน unique index (user_id, rent_id, template, channel, dedup_day)
+          → ถ้ามี scheduler อีกตัว insert ไปก่อน แถวนั้นจะถูกข้ามโดย DB เอง
+        - คืนจำนวนแถวที่เพิ่มได้จริง
+        """
+        created = 0
+        rows = [self._with_dedup_key(r) for r in rows]
+        for i in range(0, len(rows), self.BULK_CHUNK):
+            stmt = (
+                self._dialect_insert()(M.Notification)
+                .values(rows[i:i + self.BULK_CHUNK])
+                .on_conflict_do_nothing(index_elements=self.DEDUP_KEY)
+            )
+            created += max(self.db.execute(stmt).rowcount or 0, 0)
+        return created
+
+    def _dialect_insert(self):
+        dialect = (self.db.bind and self.db.bind.dialect.name) or ""
+        return pg_insert if dialect == "postgresql" else sqlite_insert
+
+    @staticmethod
+    def _with_dedup_key(data: dict) -> dict:
+        """เติม rent_id / dedup_day จาก payload / created_at ถ้ายังไม่ได้ส่งมา"""
+        data = dict(data)
+        payload = data.get("payload")
+        if data.get("rent_id") is None and isinstance(payload, dict):
+            data["rent_id"] = payload.get("rent_id")
+        if data.get("dedup_day") is None:
+            created_at = data.get("created_at") or data.get("send_at")
+            if created_at is not None:
+                data["dedup_day"] = created_at.date()
+        return data
+
+    def find_due_candidates(self, now: datetime, rent_ids=None) -> list:
+        """
+        ✅ จัดประเภทรายการยืมที่ยังไม่คืนด้วย SQL ครั้งเดียว
+        - overdue      : due_date < now
+        - due_now      : now <= due_date <= now + 1 ชม.
+        - due_tomorrow : now + 1 ชม. < due_date <= now + 24 ชม. (ยกเว้นยืม–คืนวันเดียวกัน)
+        - already_sent : anti-join กับแจ้งเตือนในระบบ (user_id, rent_id, template) ของวันนี้
+        - has_email    : ผู้ใช้มีอีเมล (ไม่ NULL / ไม่ว่าง) → สร้างคิวช่องทาง email ได้
+        - rent_ids     : จำกัดเฉพาะ rent ที่ timer ปลุก (None = ทุกรายการ)
+        """
+        R, E, N, U = M.RentReturn, M.Equipment, M.Notification, M.User
+        in_1h = now + timedelta(hours=1)
+        in_24h = now + timedelta(hours=24)
+
+        template_expr = case(
+            (R.due_date < now, "overdue"),
+            (R.due_date <= in_1h, "due_now"),
+            else_="due_tomorrow",
+        )
+        due = (
+            select(
+                R.rent_id,
+                R.user_id,
+                E.name.label("equipment_name"),
+                template_expr.label("template"),
+                (func.coalesce(func.trim(U.email), "") != "").label("has_email"),
+            )
+            .join(E, E.equipment_id == R.equipment_id)
+            .outerjoin(U, U.user_id == R.user_id)
+            .where(
+                R.return_date.is_(None),
+                R.due_date <= in_24h,
+                # 🧩 ยืมและคืนภายในวันเดียวกัน → ไม่แจ้ง "พรุ่งนี้คืน"
+                or_(R.due_date <= in_1h, func.date(R.start_date) != func.date(R.due_date)),
+            )
+        )
+        if rent_ids is not None:
+            due = due.where(R.rent_id.in_(list(rent_ids)))
+        due = due.subquery("due")
+
+        # ✅ anti-join บนคีย์ dedup (ใช้ unique index uq_notifications_dedup ได้ตรง ๆ)
+        stmt = (
+            select(due, N.notification_id.is_not(None).label("already_sent"))
+            .outerjoin(
+                N,
+                and_(
+                    N.user_id == due.c.user_id,
+                    N.rent_id == due.c.rent_id,
+                    N.template == due.c.template,
+                    N.channel == self.IN_APP_CHANNEL,
+                    N.dedup_day == now.date(),
+                ),
+            )
+            .order_by(due.c.rent_id)
+        )
+        return self.db.execute(stmt).all()
+
+    def exists_today(self, user_id, rent_id, template, day: date | None = None, channel: str = IN_APP_CHANNEL) -> bool:
         """
         ตรวจสอบว่ามีแจ้งเตือน (ของ rent_id เดิม) วันนี้หรือยัง
-        - กรองช่วงเวลาวันนี้ [00:00, 24:00) ตามโซนเวลาไทย
-        - รองรับทั้ง PostgreSQL และ SQLite ในการอ่านค่า rent_id จาก JSON payload
+        - วันนี้ตามโซนเวลาไทย
+        - lookup ตรงบน unique index (user_id, rent_id, template, channel, dedup_day)
         """
         # ใช้โซนเวลาไทยตามเดิม
         THAI_TZ = timezone(timedelta(hours=7))
-        now_th = datetime.now(THAI_TZ)
-        d = day or now_th.date()
+        d = day or datetime.now(THAI_TZ).date()
 
-        # ใช้กรองช่วงเวลา (เลี่ยง func.date(...)) เพื่อให้ใช้ดัชนีได้ดีและไม่เจอปัญหา dialect
-        start = datetime.combine(d, time.min)  # naive
-        end = start + timedelta(days=1)        # [start, end)
-
-        base_filters = [
+        filters = and_(
             M.Notification.user_id == user_id,
+            M.Notification.rent_id == rent_id,
             M.Notification.template == template,
-            M.Notification.created_at >= start,
-            M.Notification.created_at < end,
-        ]
+            M.Notification.channel == channel,
+            M.Notification.dedup_day == d,
+        )
 
-        # ระบุ dialect ปัจจุบันจาก session
-        dialect = (self.db.bind and self.db.bind.dialect.name) or ""
+        # ใช้ EXISTS เร็วและชัดเจนกว่า .first() != None
+        stmt = select(exists().where(filters))
+        return bool(self.db.execute(stmt).scalar())
+
+    # ---------- แจ้งเตือนในระบบ (กระดิ่ง / SSE) ----------
+    def unread_for_user(self, user_id, limit: int = 10, after_id: int | None = None) -> list:
+        """แจ้งเตือนในระบบที่ยังไม่อ่าน (ใหม่ → เก่า); after_id = เฉพาะที่ใหม่กว่า id นั้น"""
+        N = M.Notification
+        q = (
+            self.db.query(N)
+            .filter(N.user_id == user_id, N.channel == self.IN_APP_CHANNEL, N.status == "unread")
+        )
+        if after_id is not None:
+            q = q.filter(N.notification_id > after_id)
+        return q.order_by(N.notification_id.desc()).limit(limit).all()
+
+    def unread_after(self, after_id: int, user_ids, upto: int | None = None) -> list:
+        """แจ้งเตือนในระบบที่ id อยู่ในช่วง (after_id, upto] ของผู้ใช้กลุ่มหนึ่ง (range scan บน PK)"""
+        N = M.Notification
+        q = self.db.query(N).filter(
+            N.notification_id > after_id,
+            N.channel == self.IN_APP_CHANNEL,
+            N.status == "unread",
+            N.user_id.in_(list(user_ids)),
+        )
+        if upto is not None:
+            q = q.filter(N.notification_id <= upto)
+        return q.order_by(N.notification_id).all()
+
+    def count_unread(self, user_id) -> int:
+        N = M.Notification
+        stmt = select(func.count()).where(
+            N.user_id == user_id, N.channel == self.IN_APP_CHANNEL, N.status == "unread"
+        )
+        return self.db.execute(stmt).scalar() or 0
+
+    def mark_read(self, user_id, up_to_id: int | None = None, ids=None) -> int:
+        """
+        ✅ ปิดแจ้งเตือนหลายรายการด้วย UPDATE เดียว คืนจำนวนแถวที่เปลี่ยนจริง
+        - up_to_id : เฉพาะ id <= ค่านี้ (กันปิดแจ้งเตือนที่มาใหม่หลังผู้ใช้เห็นรายการ)
+        - ids      : เฉพาะ id ที่ระบุ
+        """
+        N = M.Notification
+        stmt = (
+            update(N)
+            .where(N.user_id == user_id, N.channel == self.IN_APP_CHANNEL, N.status == "unread")
+            .values(status="read")
+            .execution_options(synchronize_session=False)
+        )
+        if up_to_id is not None:
+            stmt = stmt.where(N.notification_id <= up_to_id)
+        if ids is not None:
+            stmt = stmt.where(N.notification_id.in_(list(ids)))
+        return self.db.execute(stmt).rowcount or 0
+
+    def max_id(self) -> int:
+        return self.db.execute(select(func.max(M.Notification.notification_id))).scalar() or 0
 
-        # สร้าง expression ของ rent_id จาก JSON payload ให้เหมาะกับแต่ละ DB
+    # ---------- outbox (ช่องทางส่งออก email / webhook) ----------
+    def claim_due(self, channels, now: datetime, limit: int, token: str, stale_before: datetime) -> list:
+        """
+        ✅ claim แถวที่ถึงเวลาส่งเป็นชุด แล้วคืนข้อมูลที่ต้องใช้ส่ง (รวมอีเมลผู้ใช้)
+        - PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED → worker หลายตัวไม่แย่งแถวกัน
+        - SQLite: UPDATE ... WHERE id IN (SELECT ... LIMIT n) เดียว (SQLite เขียนทีละ transaction อยู่แล้ว)
+        - แถว 'sending' ที่ค้างเกิน stale_before (worker ตาย) ถูก claim ใหม่ได้
+        """
+        N = M.Notification
+        pick = (
+            select(N.notification_id)
+            .where(
+                N.channel.in_(list(channels)),
+                or_(
+                    and_(N.status == "scheduled", N.send_at <= now),
+                    and_(N.status == "sending", N.claimed_at < stale_before),
+                ),
+            )
+            .order_by(N.send_at)
+            .limit(limit)
+        )
+        dialect = (self.db.bind and self.db.bind.dialect.name) or ""
         if dialect == "postgresql":
-            # payload อาจเป็น TEXT -> cast เป็น JSONB ก่อน แล้วดึง ['rent_id'] เป็น text -> cast เป็น int
-            rent_id_expr = cast(cast(M.Notification.payload, JSONB)["rent_id"].astext, Integer)
-        else:
-            # SQLite (และ MySQL ที่มี json_extract)
-            rent_id_expr = cast(func.json_extract(M.Notification.payload, "$.rent_id"), Integer)
+            pick = pick.with_for_update(skip_locked=True)
 
-        filters = and_(*base_filters, rent_id_expr == rent_id)
+        self.db.execute(
+            update(N)
+            .where(N.notification_id.in_(pick.scalar_subquery()))
+            .values(status="sending", claim_token=token, claimed_at=now, attempts=N.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        return self.db.execute(
+            select(
+                N.notification_id, N.user_id, N.channel, N.template, N.payload,
+                N.send_at, N.attempts, M.User.email, M.User.name.label("user_name"),
+            )
+            .join(M.User, M.User.user_id == N.user_id)
+            .where(N.claim_token == token, N.status == "sending")
+        ).all()
 
-        # ใช้ EXISTS เร็วและชัดเจนกว่า .first() != None
-        stmt = select(exists().where(filters))
-        return bool(self.db.execute(stmt).scalar())
+    def record_deliveries(self, results: list[dict]) -> None:
+        """
+        ✅ เขียนผลการส่งกลับแบบ bulk (executemany ของ UPDATE เดียว)
+        results: [{"notification_id", "status", "send_at", "delivered_at", "last_error"}]
+        """
+        if not results:
+            return
+        t = M.Notification.__table__
+        stmt = (
+            update(t)
+            .where(t.c.notification_id == bindparam("b_id"))
+            .values(
+                status=bindparam("b_status"),
+                send_at=bindparam("b_send_at"),
+                delivered_at=bindparam("b_delivered_at"),
+                last_error=bindparam("b_last_error"),
+                claim_token=None,
+            )
+        )
+        self.db.execute(stmt, [
+            {
+                "b_id": r["notification_id"],
+                "b_status": r["status"],
+                "b_send_at": r["send_at"],
+                "b_delivered_at": r.get("delivered_at"),
+                "b_last_error": r.get("last_error"),
+            }
+            for r in results
+        ])
@@ -0,0 +1,87 @@
+# app/repositories/notification_retention_repository.py
+from datetime import datetime
+from sqlalchemy import Date, case, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.db import models as M
+
+
+class NotificationRetentionRepository:
+    """ย่อแจ้งเตือนเก่าเป็นสรุปรายวัน แล้วลบ/ย้ายแถวเดิม (ทำทีละชุดตาม id ที่เลือกไว้)"""
+
+    # แถวที่ "จบแล้ว": อ่านแล้ว (ในระบบ) / ส่งแล้วหรือส่งไม่สำเร็จถาวร (email/webhook)
+    DONE_STATUSES = ("read", "sent", "failed")
+
+    def __init__(self, db):
+        self.db = db
+
+    @property
+    def _dialect(self) -> str:
+        return (self.db.bind and self.db.bind.dialect.name) or ""
+
+    def _insert(self):
+        return pg_insert if self._dialect == "postgresql" else sqlite_insert
+
+    def pick_batch(self, cutoff: datetime, limit: int) -> list[int]:
+        """
+        ✅ เลือก id ของแถวที่จบแล้วและเก่ากว่า cutoff (เรียงตาม PK → ใช้ index ได้, ชุดถัดไปต่อจากเดิม)
+        - PostgreSQL: FOR UPDATE SKIP LOCKED → ไม่รอแถวที่ transaction อื่นถืออยู่
+        """
+        N = M.Notification
+        stmt = (
+            select(N.notification_id)
+            .where(N.status.in_(self.DONE_STATUSES), N.created_at < cutoff)
+            .order_by(N.notification_id)
+            .limit(limit)
+        )
+        if self._dialect == "postgresql":
+            stmt = stmt.with_for_update(skip_locked=True)
+        return list(self.db.execute(stmt).scalars())
+
+    def summarize(self, ids: list[int]) -> int:
+        """
+        ✅ นับแถวชุดนี้เข้าตารางสรุป (user, day, channel, template) ด้วย INSERT ... SELECT ... GROUP BY เดียว
+        - มีสรุปของวันนั้นอยู่แล้ว → บวก count เพิ่ม (ON CONFLICT DO UPDATE)
+        """
+        N, S = M.Notification, M.NotificationDailySummary
+        created_day = cast(N.created_at, Date) if self._dialect == "postgresql" else func.date(N.created_at)
+        day = func.coalesce(N.dedup_day, created_day)
+        template = func.coalesce(N.template, "")
+
+        agg = (
+            select(
+                N.user_id, day, N.channel, template,
+                func.count(), func.min(N.created_at), func.max(N.created_at),
+            )
+            .where(N.notification_id.in_(ids))
+            .group_by(N.user_id, day, N.channel, template)
+        )
+        stmt = self._insert()(S).from_select(
+            ["user_id", "day", "channel", "template", "count", "first_at", "last_at"], agg
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["user_id", "day", "channel", "template"],
+            set_={
+                "count": S.count + stmt.excluded.count,
+                "first_at": case((stmt.excluded.first_at < S.first_at, stmt.excluded.first_at), else_=S.first_at),
+                "last_at": case((stmt.excluded.last_at > S.last_at, stmt.excluded.last_at), else_=S.last_at),
+            },
+        )
+        self.db.execute(stmt)
+        return len(ids)
+
+    def archive(self, ids: list[int]) -> int:
+        """คัดลอกแถวชุดนี้ไป notifications_archive (รันซ้ำได้: id ที่มีแล้วถูกข้าม)"""
+        N = M.Notification
+        cols = ["notification_id", "user_id", "channel", "template", "payload",
+                "send_at", "status", "created_at", "rent_id", "delivered_at"]
+        stmt = (
+            self._insert()(M.NotificationArchive)
+            .from_select(cols, select(*(getattr(N, c) for c in cols)).where(N.notification_id.in_(ids)))
+            .on_conflict_do_nothing(index_elements=["notification_id"])
+        )
+        return max(self.db.execute(stmt).rowcount or 0, 0)
+
+    def delete(self, ids: list[int]) -> int:
+        N = M.Notification
+        return self.db.execute(delete(N).where(N.notification_id.in_(ids))).rowcount or 0
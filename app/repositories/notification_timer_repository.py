@@ -0,0 +1,86 @@
+# app/repositories/notification_timer_repository.py
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+from sqlalchemy import delete, exists, func, insert, select
+from app.db import models as M
+
+THAI_TZ = timezone(timedelta(hours=7))
+
+
+def _naive_th(dt: datetime) -> datetime:
+    """due_date บางแถวมี tzinfo (เช่นจากการต่ออายุ) → แปลงเป็นเวลาไทยแบบ naive ให้เทียบกันได้"""
+    if dt.tzinfo is not None:
+        return dt.astimezone(THAI_TZ).replace(tzinfo=None)
+    return dt
+
+
+class NotificationTimerRepository:
+    """คิวเวลาปลุกของแจ้งเตือน (ต้องใช้ session เดียวกับ write path เพื่อให้ commit พร้อมกัน)"""
+
+    # (template ที่คาดว่าจะเกิด, เวลาก่อน due) — overdue ปลุกหลัง due 1 วินาที ให้เลยกำหนดแน่นอน
+    OFFSETS = (
+        ("due_tomorrow", timedelta(hours=24)),
+        ("due_now", timedelta(hours=1)),
+        ("overdue", timedelta(seconds=-1)),
+    )
+
+    def __init__(self, db):
+        # db = SQLAlchemy Session
+        self.db = db
+
+    def _rows_for(self, rent_id: int, due_date: datetime, now: datetime) -> list[dict]:
+        due = _naive_th(due_date)
+        rows, seen = [], set()
+        for kind, before in self.OFFSETS:
+            fire_at = max(due - before, now)  # เลยเวลาไปแล้ว → ปลุกทันที
+            if fire_at in seen:
+                continue
+            seen.add(fire_at)
+            rows.append({"rent_id": rent_id, "kind": kind, "fire_at": fire_at, "created_at": datetime.utcnow()})
+        return rows
+
+    def schedule_for_rent(self, rent_id: int, due_date: datetime, now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        ✅ ตั้งเวลาปลุกใหม่ของ rent (ลบของเดิมก่อน) แล้วคืนเวลาปลุกที่เร็วที่สุด
+        ยังไม่ commit — ให้ผู้เรียก commit พร้อมข้อมูลการยืม
+        """
+        now = now or datetime.now(THAI_TZ).replace(tzinfo=None)
+        self.cancel_for_rent(rent_id)
+        rows = self._rows_for(rent_id, due_date, now)
+        self.db.execute(insert(M.NotificationTimer), rows)
+        return min(r["fire_at"] for r in rows)
+
+    def cancel_for_rent(self, rent_id: int) -> None:
+        """ลบเวลาปลุกที่ค้างอยู่ของ rent (เช่น คืนของแล้ว)"""
+        self.db.execute(delete(M.NotificationTimer).where(M.NotificationTimer.rent_id == rent_id))
+
+    def backfill_open_rents(self, now: datetime) -> int:
+        """ตั้งเวลาปลุกให้รายการยืมที่ยังไม่คืนและยังไม่มี timer (ข้อมูลก่อนมีคิวนี้)"""
+        R, T = M.RentReturn, M.NotificationTimer
+        rents = self.db.execute(
+            select(R.rent_id, R.due_date)
+            .where(R.return_date.is_(None), ~exists().where(T.rent_id == R.rent_id))
+        ).all()
+        rows = [row for r in rents for row in self._rows_for(r.rent_id, r.due_date, now)]
+        if rows:
+            self.db.execute(insert(M.NotificationTimer), rows)
+        return len(rents)
+
+    def due(self, now: datetime, limit: int = 500) -> list:
+        """timer ที่ถึงเวลาแล้ว (เรียงตามเวลา)"""
+        T = M.NotificationTimer
+        return self.db.execute(
+            select(T.timer_id, T.rent_id)
+            .where(T.fire_at <= now)
+            .order_by(T.fire_at)
+            .limit(limit)
+        ).all()
+
+    def delete_ids(self, timer_ids: Iterable[int]) -> None:
+        ids = list(timer_ids)
+        if ids:
+            self.db.execute(delete(M.NotificationTimer).where(M.NotificationTimer.timer_id.in_(ids)))
+
+    def next_fire_at(self) -> Optional[datetime]:
+        """เวลาปลุกถัดไป (ใช้ index บน fire_at)"""
+        return self.db.execute(select(func.min(M.NotificationTimer.fire_at))).scalar()
@@ -3,6 +3,8 @@ from sqlalchemy.orm import joinedload
 from app.db.db import SessionLocal
 from app.db.models import RentReturn, Equipment, Renewal
 from zoneinfo import ZoneInfo
+from app.repositories.notification_timer_repository import NotificationTimerRepository
+from app.scheduler.wakeup import request_wakeup
 
 
 def insert_renewal(data):
@@ -166,12 +168,18 @@ def update_renewal_status(renewal_id, new_status, rent_status_id, update_due_dat
 
         # ✅ ดึง rent ที่เกี่ยวข้อง
         rent = db.query(RentReturn).filter(RentReturn.rent_id == renewal.rent_id).first()
+        next_fire = None
         if rent:
             rent.status_id = rent_status_id
             if update_due_date:
                 rent.due_date = renewal.new_due
+                # ⏰ due ใหม่ → ตั้งเวลาปลุกแจ้งเตือนใหม่ (ถ้ายังไม่คืน)
+                if rent.return_date is None:
+                    next_fire = NotificationTimerRepository(db).schedule_for_rent(rent.rent_id, rent.due_date)
 
         db.commit()
+        if next_fire:
+            request_wakeup(next_fire)
         print(f"📝 อัปเดต renewal_id={renewal_id} → {new_status}, RentReturn.status_id={rent_status_id}, approved_by={approved_by}")
         return True
 
@@ -0,0 +1,72 @@
+# app/repositories/scheduler_lease_repository.py
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import and_, case, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.db.models import SchedulerLease
+
+
+class SchedulerLeaseRepository:
+    """อ่าน/เขียน lease ของ scheduler (ใช้ได้ทั้ง SQLite และ PostgreSQL)"""
+
+    def __init__(self, db):
+        # db = SQLAlchemy Session
+        self.db = db
+
+    def _dialect_insert(self):
+        dialect = (self.db.bind and self.db.bind.dialect.name) or ""
+        return pg_insert if dialect == "postgresql" else sqlite_insert
+
+    def try_acquire(self, name: str, holder: str, ttl_seconds: int, now: Optional[datetime] = None) -> bool:
+        """
+        ✅ ขอ/ต่ออายุ lease แบบ atomic
+        - ยังไม่มีแถว → INSERT ... ON CONFLICT DO NOTHING
+        - มีแถวแล้ว → UPDATE เฉพาะเมื่อเราเป็นผู้ถือเดิม หรือ lease เดิมหมดอายุแล้ว
+        คืน True ถ้าหลังคำสั่งนี้เราเป็น leader
+        """
+        now = now or datetime.utcnow()
+        expires = now + timedelta(seconds=ttl_seconds)
+
+        inserted = self.db.execute(
+            self._dialect_insert()(SchedulerLease)
+            .values(name=name, holder=holder, acquired_at=now, renewed_at=now, expires_at=expires)
+            .on_conflict_do_nothing(index_elements=["name"])
+        ).rowcount
+        if inserted:
+            return True
+
+        updated = self.db.execute(
+            update(SchedulerLease)
+            .where(
+                and_(
+                    SchedulerLease.name == name,
+                    or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now),
+                )
+            )
+            .values(
+                # เปลี่ยนมือ → เริ่มนับอายุ lease ใหม่, ต่ออายุ → คง acquired_at เดิม
+                acquired_at=case((SchedulerLease.holder == holder, SchedulerLease.acquired_at), else_=now),
+                holder=holder,
+                renewed_at=now,
+                expires_at=expires,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        return bool(updated)
+
+    def release(self, name: str, holder: str, now: Optional[datetime] = None) -> bool:
+        """ปล่อย lease ทันที (ให้ process อื่นรับช่วงได้โดยไม่ต้องรอหมดอายุ)"""
+        now = now or datetime.utcnow()
+        released = self.db.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name == name, SchedulerLease.holder == holder)
+            .values(expires_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        return bool(released)
+
+    def get(self, name: str) -> Optional[SchedulerLease]:
+        return self.db.execute(
+            select(SchedulerLease).where(SchedulerLease.name == name)
+        ).scalar_one_or_none()
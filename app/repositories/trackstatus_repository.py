@@ -1,110 +1,85 @@
-from sqlalchemy.orm import joinedload
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session, aliased
 from app.db.db import SessionLocal
-from app.db.models import RentReturn, Equipment
+from app.db.models import RentReturn, Equipment, StatusRent, User
+
+
 class TrackStatusRepository:
-    def __init__(self):
-        self.db = SessionLocal()
+    """
+    ข้อมูลหน้าติดตามสถานะของผู้ใช้ที่ล็อกอินอยู่
+    - ทุก query กรอง user_id ใน SQL (index user_id, ...) → เวลาขึ้นกับจำนวนรายการของผู้ใช้คนนั้น ไม่ใช่ทั้งตาราง
+    """
+
+    def __init__(self, session: Optional[Session] = None):
+        self.db = session or SessionLocal()
 
     # ------------------------------------------------------------------
-    # ✅ ของเดิม
+    # ✅ หน้า list/track-status
     # ------------------------------------------------------------------
-    def get_all_rent_returns_with_equipment(self):
-        """ดึงข้อมูล RentReturn ทั้งหมดพร้อมข้อมูลอุปกรณ์และสถานะ"""
-        results = (
-            self.db.query(RentReturn)
-            .options(
-                joinedload(RentReturn.equipment),
-                joinedload(RentReturn.status)
+    def list_active_for_user(self, user_id: int, active_statuses: Iterable[str]) -> List[Dict]:
+        """
+        รายการยืมของ user_id ที่ยังไม่คืน หรือสถานะยังอยู่ในกระบวนการ (ชื่อสถานะไม่สนตัวพิมพ์)
+        """
+        active = [s.lower() for s in active_statuses]
+        stmt = (
+            select(
+                RentReturn.rent_id,
+                RentReturn.start_date,
+                RentReturn.due_date,
+                RentReturn.return_date,
+                Equipment.name.label("equipment_name"),
+                Equipment.code.label("equipment_code"),
+                StatusRent.name.label("status_name"),
+                StatusRent.color_code.label("status_color"),
             )
-            .all()
+            .outerjoin(Equipment, Equipment.equipment_id == RentReturn.equipment_id)
+            .outerjoin(StatusRent, StatusRent.status_id == RentReturn.status_id)
+            .where(
+                RentReturn.user_id == user_id,
+                or_(RentReturn.return_date.is_(None), func.lower(StatusRent.name).in_(active)),
+            )
+            .order_by(RentReturn.rent_id)
         )
-
-        data = []
-        for r in results:
-            data.append({
-                "rent_id": r.rent_id,
-                "equipment_id": r.equipment_id,
-                "user_id": r.user_id,
-                "start_date": r.start_date,
-                "due_date": r.due_date,
-                "teacher_confirmed": r.teacher_confirmed,
-                "reason": r.reason,
-                "return_date": r.return_date,
-                "check_by": r.check_by,
-                "status_id": r.status_id,
-                "created_at": r.created_at,
-
-                "equipment": {
-                    "equipment_id": getattr(r.equipment, "equipment_id", None),
-                    "name": getattr(r.equipment, "name", None),
-                    "code": getattr(r.equipment, "code", None),
-                    "category": getattr(r.equipment, "category", None),
-                    "confirm": getattr(r.equipment, "confirm", None),
-                    "detail": getattr(r.equipment, "detail", None),
-                    "brand": getattr(r.equipment, "brand", None),
-                    "buy_date": getattr(r.equipment, "buy_date", None),
-                    "status": getattr(r.equipment, "status", None),
-                    "created_at": getattr(r.equipment, "created_at", None),
-                },
-
-                "status": {
-                    "status_id": getattr(r.status, "status_id", None),
-                    "name": getattr(r.status, "name", None),
-                    "color_code": getattr(r.status, "color_code", None),
-                }
-            })
-        return data
+        return [dict(r._mapping) for r in self.db.execute(stmt)]
 
     # ------------------------------------------------------------------
-    # ✅ ของใหม่: ใช้ในหน้า lend_detail
+    # ✅ หน้า lend_detail / add_time
     # ------------------------------------------------------------------
-    def get_all_rent_returns_full(self):
-        """ดึงข้อมูล RentReturn พร้อมอุปกรณ์, รูป, สถานะ, วิชา, อาจารย์, ผู้ใช้"""
-        results = (
-            self.db.query(RentReturn)
-            .options(
-                joinedload(RentReturn.equipment)
-                    .joinedload(Equipment.equipment_images),
-                joinedload(RentReturn.status),
-                joinedload(RentReturn.teacher_confirm),
-                joinedload(RentReturn.user),
+    def _detail_stmt(self):
+        """รายการยืม + อุปกรณ์ (cover_image) + สถานะ + อาจารย์ + ผู้ยืม"""
+        borrower, teacher = aliased(User), aliased(User)
+        return (
+            select(
+                RentReturn.rent_id,
+                RentReturn.start_date,
+                RentReturn.due_date,
+                RentReturn.reason,
+                Equipment.name.label("equipment_name"),
+                Equipment.code.label("equipment_code"),
+                Equipment.cover_image.label("image_path"),  # ✅ denormalized: ไม่ต้อง joinedload รูปทั้งหมด
+                StatusRent.name.label("status_name"),
+                StatusRent.color_code.label("status_color"),
+                borrower.name.label("full_name"),
+                borrower.phone.label("phone_number"),
+                teacher.name.label("teacher_name"),
             )
-            .all()
+            .outerjoin(Equipment, Equipment.equipment_id == RentReturn.equipment_id)
+            .outerjoin(StatusRent, StatusRent.status_id == RentReturn.status_id)
+            .outerjoin(borrower, borrower.user_id == RentReturn.user_id)
+            .outerjoin(teacher, teacher.user_id == RentReturn.teacher_confirmed)
         )
 
-        data = []
-        for r in results:
-            image_path = None
-            if r.equipment and r.equipment.equipment_images:
-                image_path = r.equipment.equipment_images[0].image_path
-
-            data.append({
-                "rent_id": r.rent_id,
-                "user_id": r.user_id,
-                "start_date": r.start_date,
-                "due_date": r.due_date,
-                "reason": r.reason,
-
-                "equipment": {
-                    "name": getattr(r.equipment, "name", None),
-                    "code": getattr(r.equipment, "code", None),
-                    "image_path": image_path,
-                },
-                "teacher": {
-                    "name": getattr(r.teacher_confirm, "name", None),
-                },
-                "user": {
-                    "name": getattr(r.user, "name", None),
-                    "phone": getattr(r.user, "phone", None),
-                },
-                "status": {
-                    "name": getattr(r.status, "name", None),
-                    "color_code": getattr(r.status, "color_code", None),
-                },
-            })
-        return data
+    def list_details_for_user(self, user_id: int) -> List[Dict]:
+        """รายละเอียดทุกรายการยืมของ user_id"""
+        stmt = self._detail_stmt().where(RentReturn.user_id == user_id).order_by(RentReturn.rent_id)
+        return [dict(r._mapping) for r in self.db.execute(stmt)]
 
- 
+    def get_detail_for_user(self, user_id: int, rent_id: int) -> Optional[Dict]:
+        """รายละเอียดรายการยืม 1 รายการ (ต้องเป็นของ user_id) — ไม่พบ → None"""
+        stmt = self._detail_stmt().where(RentReturn.rent_id == rent_id, RentReturn.user_id == user_id)
+        row = self.db.execute(stmt).first()
+        return dict(row._mapping) if row else None
 
     def close(self):
         self.db.close()
@@ -3,6 +3,7 @@
 from sqlalchemy.orm import joinedload
 from app.db.db import SessionLocal
 from app.db.models import RentReturn, Equipment
+from app.repositories.notification_timer_repository import NotificationTimerRepository
 from datetime import datetime
 
 class UserReturnRepository:
@@ -35,6 +36,9 @@ class UserReturnRepository:
             rent_return.status_id = 3
             rent_return.return_date = datetime.now()
 
+            # ⏰ มี return_date แล้ว → ไม่ต้องปลุกแจ้งเตือนของรายการนี้อีก
+            NotificationTimerRepository(db).cancel_for_rent(rent_id)
+
             db.add(rent_return)  # << สำคัญ เพื่อให้ session track object
             db.commit()
             db.refresh(rent_return)  # << บังคับ refresh ค่าใหม่จาก DB
@@ -1,3 +1,4 @@
 # app/scheduler/__init__.py
 from .notification_scheduler import start_notification_scheduler as start_notification_scheduler
-__all__ = ["start_notification_scheduler"]
+from .notification_scheduler import get_scheduler_status as get_scheduler_status
+__all__ = ["start_notification_scheduler", "get_scheduler_status"]
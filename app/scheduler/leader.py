@@ -0,0 +1,81 @@
+# app/scheduler/leader.py
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from app.db.db import SessionLocal
+from app.repositories.scheduler_lease_repository import SchedulerLeaseRepository
+
+
+class LeaderLease:
+    """
+    🗳️ เลือก leader ข้าม process/เครื่อง ด้วยแถว lease ในฐานข้อมูล
+    - ทุก worker เรียก heartbeat() เป็นระยะ แต่มีเพียงผู้ถือ lease ที่ยังไม่หมดอายุเท่านั้นที่เป็น leader
+    - ถ้า leader ตาย (ไม่ต่ออายุ) lease จะหมดอายุภายใน ttl แล้ว worker อื่นรับช่วงต่อ
+    """
+
+    def __init__(self, name: str, ttl_seconds: int = 90, session_factory=SessionLocal):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._session_factory = session_factory
+        self._lock = threading.Lock()
+        self._valid_until: Optional[datetime] = None  # เวลาที่ lease ของเราหมดอายุ (มุมมองฝั่งเรา)
+
+    @property
+    def is_leader(self) -> bool:
+        """เป็น leader อยู่ไหม (ไม่แตะ DB) — หมดอายุแล้วถือว่าไม่ใช่"""
+        return self._valid_until is not None and datetime.utcnow() < self._valid_until
+
+    def heartbeat(self) -> bool:
+        """✅ ขอ/ต่ออายุ lease แล้วคืนสถานะ leader ล่าสุด"""
+        with self._lock:
+            now = datetime.utcnow()
+            db = self._session_factory()
+            try:
+                ok = SchedulerLeaseRepository(db).try_acquire(self.name, self.holder, self.ttl_seconds, now=now)
+                db.commit()
+            except Exception:
+                db.rollback()
+                ok = False
+            finally:
+                db.close()
+            self._valid_until = now + timedelta(seconds=self.ttl_seconds) if ok else None
+            return ok
+
+    def release(self) -> None:
+        """ปล่อย lease ตอนปิด process เพื่อให้ worker อื่นรับช่วงได้ทันที"""
+        with self._lock:
+            if self._valid_until is None:
+                return
+            db = self._session_factory()
+            try:
+                SchedulerLeaseRepository(db).release(self.name, self.holder)
+                db.commit()
+            except Exception:
+                db.rollback()
+            finally:
+                db.close()
+                self._valid_until = None
+
+    def status(self) -> dict:
+        """ข้อมูล lease ปัจจุบัน (สำหรับ /health)"""
+        db = self._session_factory()
+        try:
+            lease = SchedulerLeaseRepository(db).get(self.name)
+        finally:
+            db.close()
+
+        now = datetime.utcnow()
+        if not lease:
+            return {"name": self.name, "leader": None, "is_self": False}
+        return {
+            "name": self.name,
+            "leader": lease.holder,
+            "is_self": lease.holder == self.holder,
+            "expired": lease.expires_at < now,
+            "lease_age_seconds": round((now - lease.acquired_at).total_seconds(), 1),
+            "last_heartbeat_seconds": round((now - lease.renewed_at).total_seconds(), 1),
+        }
@@ -2,15 +2,36 @@
 import os
 import threading
 import atexit
+from datetime import timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from app.services.notification_service import NotificationService
+from app.services.notification_delivery_service import NotificationDeliveryService
+from app.services.notification_retention_service import NotificationRetentionService
+from app.scheduler.leader import LeaderLease
+from app.scheduler.wakeup import on_wakeup
 
 
-_scheduler_started = False  # ✅ ป้องกันรันซ้ำหลายรอบ
+_scheduler_started = False  # ✅ ป้องกันรันซ้ำหลายรอบ (ภายใน process เดียว)
+
+# ✅ lease กลางสำหรับทุก worker/replica — มีเพียง leader ที่ประมวลผลแจ้งเตือน
+LEASE_TTL_SECONDS = int(os.getenv("SCHEDULER_LEASE_TTL", "90"))
+HEARTBEAT_SECONDS = max(LEASE_TTL_SECONDS // 3, 5)
+_lease = LeaderLease("notification_scheduler", ttl_seconds=LEASE_TTL_SECONDS)
+
+# ✅ poll สำรอง (อ่านแค่ MIN(fire_at)) เผื่อ timer ถูกเพิ่มจาก process อื่นที่ปลุกเราตรง ๆ ไม่ได้
+SAFETY_POLL_SECONDS = int(os.getenv("NOTIFY_SAFETY_POLL_SECONDS", "60"))
+DRAIN_JOB_ID = "drain_notification_timers"
+
+
+def get_scheduler_status() -> dict:
+    """สถานะ scheduler/leader สำหรับ /health"""
+    status = {"started": _scheduler_started, "holder": _lease.holder}
+    status.update(_lease.status())
+    return status
 
 
 def start_notification_scheduler(app):
-    """⏰ สร้าง Background Scheduler สำหรับตรวจสอบแจ้งเตือนอัตโนมัติ"""
+    """⏰ สร้าง Background Scheduler สำหรับแจ้งเตือนแบบ event-driven (timer queue)"""
     global _scheduler_started
 
     should_start_scheduler = not app.testing and (
@@ -21,28 +42,206 @@ def start_notification_scheduler(app):
         _scheduler_started = True
 
         scheduler = BackgroundScheduler(timezone="Asia/Bangkok", daemon=True)
+        drain_lock = threading.Lock()
+        next_drain = {"at": None}  # เวลาที่ตั้ง drain job ไว้ (เวลาไทย naive)
+
+        def schedule_drain(fire_at=None):
+            """⏰ ตั้ง drain job ให้ตื่นตรงเวลา timer ถัดไป (เลื่อนเข้ามาได้อย่างเดียว)"""
+            if not _lease.is_leader:
+                return
+            with drain_lock:
+                if fire_at is None:
+                    fire_at = NotificationService().next_timer_at()
+                    next_drain["at"] = None  # อ่านจาก DB แล้ว → ใช้ค่าจริงแทนค่าที่จำไว้
+                if fire_at is None:
+                    return
+                if next_drain["at"] is not None and next_drain["at"] <= fire_at:
+                    return
+                # date trigger ที่เลยเวลาไปแล้วจะถูกนับเป็น misfire → ขยับเป็น "ตอนนี้"
+                run_at = max(fire_at, NotificationService._now() + timedelta(milliseconds=200))
+                scheduler.add_job(
+                    func=job_drain_timers,
+                    trigger="date",
+                    run_date=run_at,
+                    id=DRAIN_JOB_ID,
+                    replace_existing=True,
+                    misfire_grace_time=300,
+                )
+                next_drain["at"] = fire_at
 
-        def job_check_due():
-            """🔔 Task ที่รันซ้ำทุกระยะเวลา"""
+        def job_drain_timers():
+            """🔔 ประมวลผล timer ที่ถึงเวลา (เฉพาะ leader) แล้วตั้งเวลาปลุกครั้งถัดไป"""
+            with drain_lock:
+                next_drain["at"] = None
+            if not _lease.is_leader:
+                return
             thread_id = threading.current_thread().ident
             with app.app_context():
-                app.logger.info(f"🔔 Running job_check_due (thread={thread_id})")
-                NotificationService().process_due_notifications()
+                report = NotificationService().process_due_timers()
+                app.logger.info(
+                    "🔔 drain timers (thread=%s): scanned=%s created=%s skipped=%s (%.1f ms)",
+                    thread_id, report.scanned, report.created, report.skipped, report.elapsed_ms,
+                )
+            if report.queued:
+                job_deliver()
+            schedule_drain()
+
+        def job_daily_sweep():
+            """🌅 sweep ทั้งหมดวันละครั้ง (แจ้ง overdue ซ้ำรายวัน + เก็บตกรายการที่ไม่มี timer)"""
+            if not _lease.is_leader:
+                return
+            with app.app_context():
+                report = NotificationService().process_due_notifications()
+                app.logger.info(
+                    "🌅 daily sweep: scanned=%s created=%s skipped=%s (%.1f ms)",
+                    report.scanned, report.created, report.skipped, report.elapsed_ms,
+                )
+
+        retention = NotificationRetentionService.from_config(app.config)
+
+        def job_retention():
+            """🧹 ย่อ/ลบแจ้งเตือนเก่าที่จบแล้ว วันละครั้ง (เฉพาะ leader)"""
+            if not _lease.is_leader:
+                return
+            with app.app_context():
+                report = retention.run()
+                app.logger.info(
+                    "🧹 retention: batches=%s summarized=%s archived=%s deleted=%s (%.1f ms)",
+                    report.batches, report.summarized, report.archived, report.deleted, report.elapsed_ms,
+                )
+
+        def job_image_gc():
+            """🗂 ลบไฟล์รูปที่ไม่มีแถวไหนอ้างแล้ว วันละครั้ง (เฉพาะ leader)"""
+            if not _lease.is_leader:
+                return
+            from app.db.db import SessionLocal
+            from app.services.image_store import image_store
+            with app.app_context():
+                db = SessionLocal()
+                try:
+                    stats = image_store.gc(db, grace_seconds=app.config.get("IMAGE_GC_GRACE_SECONDS", 3600))
+                finally:
+                    db.close()
+                app.logger.info("🗂 image gc: scanned=%s removed=%s bytes=%s",
+                                stats["scanned"], stats["removed"], stats["bytes"])
+
+        # 📤 worker ส่งออก (email/webhook) — เปิดเมื่อมี NOTIFY_CHANNELS เท่านั้น
+        delivery = NotificationDeliveryService.from_config(app.config)
+
+        def job_deliver():
+            """📤 ส่งแถว 'scheduled' ที่ถึงเวลา (เฉพาะ leader)"""
+            if delivery is None or not _lease.is_leader:
+                return
+            with app.app_context():
+                report = delivery.deliver_pending()
+                if report.claimed:
+                    app.logger.info(
+                        "📤 delivery: claimed=%s sent=%s retried=%s failed=%s (%.1f msg/s)",
+                        report.claimed, report.sent, report.retried, report.failed, report.per_second,
+                    )
+
+        def job_lease_heartbeat():
+            """🗳️ ขอ/ต่ออายุ lease — ทุก worker รัน แต่มีผู้ชนะได้คนเดียว"""
+            was_leader = _lease.is_leader
+            is_leader = _lease.heartbeat()
+            if is_leader != was_leader:
+                app.logger.info(
+                    "🗳️ scheduler lease %s: %s",
+                    "acquired" if is_leader else "lost",
+                    _lease.holder,
+                )
+                if is_leader:
+                    # เพิ่งได้เป็น leader → ตั้ง timer ให้รายการเก่า + sweep ครั้งแรก + ตั้ง drain
+                    with app.app_context():
+                        backfilled = NotificationService().backfill_timers()
+                        app.logger.info("⏰ backfilled timers for %s open rents", backfilled)
+                    job_daily_sweep()
+                    schedule_drain()
+
+        def job_safety_poll():
+            """🔁 อ่านเวลาปลุกถัดไปจาก DB (query เดียวบน index) เผื่อ timer จาก process อื่น"""
+            schedule_drain()
 
+        # write path ใน process นี้ปลุก drain ได้ทันที
+        on_wakeup(schedule_drain)
+
+        # ขอ lease ทันทีตอนเริ่ม แล้วต่ออายุเป็นระยะ
+        job_lease_heartbeat()
         scheduler.add_job(
-            func=job_check_due,
+            func=job_lease_heartbeat,
             trigger="interval",
-            seconds=30,  # 🔁 เปลี่ยนรอบเวลาได้ เช่น 180 = 3 นาที
-            id="check_due_notifications",
+            seconds=HEARTBEAT_SECONDS,
+            id="scheduler_lease_heartbeat",
             replace_existing=True,
             coalesce=True,
-            misfire_grace_time=300,
+            max_instances=1,
+        )
+        scheduler.add_job(
+            func=job_safety_poll,
+            trigger="interval",
+            seconds=SAFETY_POLL_SECONDS,
+            id="notification_timer_safety_poll",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
+        scheduler.add_job(
+            func=job_daily_sweep,
+            trigger="cron",
+            hour=0,
+            minute=0,
+            second=5,
+            id="daily_notification_sweep",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=3600,
             max_instances=1,
         )
 
+        scheduler.add_job(
+            func=job_retention,
+            trigger="cron",
+            hour=3,
+            minute=30,
+            id="notification_retention",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=3600,
+            max_instances=1,
+        )
+        scheduler.add_job(
+            func=job_image_gc,
+            trigger="cron",
+            hour=4,
+            minute=0,
+            id="image_gc",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=3600,
+            max_instances=1,
+        )
+
+        if delivery is not None:
+            scheduler.add_job(
+                func=job_deliver,
+                trigger="interval",
+                seconds=app.config.get("NOTIFY_DELIVERY_INTERVAL", 10),
+                id="deliver_notifications",
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1,
+            )
+
         scheduler.start()
-        atexit.register(lambda: scheduler.shutdown(wait=False))
-        app.logger.info("✅ Scheduler started: ตรวจสอบแจ้งเตือนทุก 30 วินาที")
+
+        def _shutdown():
+            scheduler.shutdown(wait=False)
+            if delivery is not None:
+                delivery.close()
+            _lease.release()
+
+        atexit.register(_shutdown)
+        app.logger.info("✅ Scheduler started: แจ้งเตือนตาม timer queue (leader=%s)", _lease.is_leader)
 
     else:
         app.logger.info("⏩ Scheduler already running, skip duplicate start")
@@ -0,0 +1,23 @@
+# app/scheduler/wakeup.py
+"""
+⏰ ช่องทางเบา ๆ ให้ write path (ยืม/คืน/ต่ออายุ) ปลุก scheduler ใน process เดียวกันได้ทันที
+- ไม่มี listener (เช่น ตอนเทส หรือ process ที่ไม่ได้รัน scheduler) → ไม่ทำอะไร
+- process อื่นจะเห็น timer ใหม่จากการ poll สำรองของ scheduler เอง
+"""
+from datetime import datetime
+from typing import Callable, List, Optional
+
+_listeners: List[Callable[[Optional[datetime]], None]] = []
+
+
+def on_wakeup(callback: Callable[[Optional[datetime]], None]) -> None:
+    _listeners.append(callback)
+
+
+def request_wakeup(fire_at: Optional[datetime] = None) -> None:
+    """แจ้ง scheduler ว่ามี timer ใหม่ (fire_at = เวลาปลุกที่เร็วที่สุดของรายการนั้น)"""
+    for cb in list(_listeners):
+        try:
+            cb(fire_at)
+        except Exception as e:
+            print(f"[WARN] wakeup listener failed: {e}")
@@ -2,6 +2,8 @@ from datetime import datetime
 from flask import session
 from app.repositories.admin_return_repository import AdminReturnRepository
 from app.db.models import Equipment
+from app.repositories.equipment_group_repository import EquipmentGroupRepository
+from app.repositories.notification_timer_repository import NotificationTimerRepository
 
 class AdminReturnService:
     """Business Logic สำหรับการคืนอุปกรณ์"""
@@ -58,6 +60,12 @@ class AdminReturnService:
         equipment.status = "available"
         print(f"🟢 DEBUG | RentID: {rent_id} | Equipment: {equipment.name} -> {equipment.status}")
 
+        # ⏰ คืนแล้ว → ยกเลิกเวลาปลุกแจ้งเตือนที่ค้างอยู่
+        NotificationTimerRepository(self.repo.db).cancel_for_rent(rent.rent_id)
+
+        # ✅ อุปกรณ์กลับมาพร้อมใช้ → อัปเดตสรุปของกลุ่ม
+        EquipmentGroupRepository(self.repo.db).refresh([equipment.name])
+
         # ✅ commit จริงใน session เดียวกัน
         self.repo.commit()
         self.repo.close()
@@ -0,0 +1,184 @@
+# app/services/equipment_bulk_service.py
+import csv
+import io
+import json
+from datetime import date, datetime
+from time import perf_counter
+from typing import Iterable, Iterator, List, Optional
+from app.config import Config
+from app.db.models import MovementEvent, User
+from app.repositories.equipment_repository import EquipmentRepository
+from app.repositories.equipment_search_repository import EquipmentSearchRepository
+from app.services.equipment_service import EquipmentService, TRACKED_FIELDS
+from app.services.schemas import ImportReportDTO
+
+# คอลัมน์ของไฟล์นำเข้า/ส่งออก (ไฟล์ที่ export ได้นำกลับเข้ามาได้ทันที)
+COLUMNS = ("name", "code", "category", "brand", "detail", "buy_date", "status", "confirm")
+TRUE_VALUES = {"1", "true", "yes", "y", "on", "ใช่"}
+
+
+class EquipmentBulkService:
+    """
+    📦 นำเข้า / ส่งออกอุปกรณ์ทีละมาก ๆ (CSV หรือ JSON Lines)
+    - ตรวจรหัสซ้ำกับของเดิมด้วย query เดียว + ซ้ำกันเองในไฟล์
+    - insert อุปกรณ์และ stock_movements แบบหลายแถวต่อคำสั่ง ใน transaction เดียว
+    - แถวที่ผิดไม่ถูกบันทึก แต่ไม่ทำให้แถวอื่นล้ม → คืนรายงานรายแถว
+    """
+
+    FORMATS = ("csv", "jsonl")
+
+    def __init__(self, repo: Optional[EquipmentRepository] = None,
+                 max_rows: int = Config.EQUIPMENT_IMPORT_MAX_ROWS, batch_size: int = Config.EQUIPMENT_IMPORT_BATCH):
+        self.repo = repo or EquipmentRepository()
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+
+    # ---------- Parse ----------
+    def parse(self, stream, fmt: str) -> Iterator[dict]:
+        """stream (bytes หรือ text) → dict ต่อแถว"""
+        if fmt not in self.FORMATS:
+            raise ValueError(f"รองรับเฉพาะ {' / '.join(self.FORMATS)} (ได้ {fmt!r})")
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig") if not isinstance(stream, io.TextIOBase) else stream
+        if fmt == "csv":
+            for row in csv.DictReader(text_stream):
+                yield {k.strip().lower(): v for k, v in row.items() if k}
+            return
+        for n, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                yield {"__error__": f"บรรทัด {n} ไม่ใช่ JSON ที่ถูกต้อง"}
+                continue
+            yield row if isinstance(row, dict) else {"__error__": f"บรรทัด {n} ต้องเป็น object"}
+
+    # ---------- Import ----------
+    def import_rows(self, rows: Iterable[dict], actor_id: Optional[int], dry_run: bool = False) -> ImportReportDTO:
+        t0 = perf_counter()
+        report = ImportReportDTO(dry_run=dry_run)
+
+        valid = []      # (เลขแถว, ค่าที่แปลงแล้ว)
+        seen = {}       # code → เลขแถวแรกในไฟล์
+        for n, raw in enumerate(rows, start=1):
+            report.received = n
+            if n > self.max_rows:
+                report.errors.append({"row": n, "code": None, "error": f"เกินจำนวนสูงสุด {self.max_rows} แถวต่อไฟล์"})
+                break
+            values, error = self._clean(raw)
+            code = values.get("code") if values else (raw.get("code") if isinstance(raw, dict) else None)
+            if not error and code in seen:
+                error = f"รหัสซ้ำกับแถว {seen[code]} ในไฟล์"
+            if error:
+                report.errors.append({"row": n, "code": code, "error": error})
+                continue
+            seen[code] = n
+            valid.append((n, values))
+
+        taken = self.repo.existing_codes(v["code"] for _, v in valid)
+        if taken:
+            for n, v in valid:
+                if v["code"] in taken:
+                    report.errors.append({"row": n, "code": v["code"], "error": f"รหัสอุปกรณ์ '{v['code']}' ถูกใช้ไปแล้ว"})
+            valid = [(n, v) for n, v in valid if v["code"] not in taken]
+        report.errors.sort(key=lambda e: e["row"])
+
+        if valid and not dry_run:
+            try:
+                self._insert(valid, actor_id)
+                self.repo.commit()
+            except Exception:
+                self.repo.rollback()
+                raise
+        report.inserted = 0 if dry_run else len(valid)
+        report.elapsed_ms = round((perf_counter() - t0) * 1000, 2)
+        return report
+
+    def _insert(self, valid: List[tuple], actor_id: Optional[int]) -> None:
+        actor_name = "ไม่ทราบชื่อ"
+        if actor_id:
+            actor_name = self.repo.db.query(User.name).filter_by(user_id=actor_id).scalar() or actor_name
+        now = datetime.utcnow()
+
+        for i in range(0, len(valid), self.batch_size):
+            batch = [dict(v, created_at=now, updated_at=now) for _, v in valid[i:i + self.batch_size]]
+            ids = self.repo.bulk_insert_equipments(batch)
+            for row, eid in zip(batch, ids):
+                row["equipment_id"] = eid
+            if actor_id:
+                self.repo.bulk_add_movements([
+                    {
+                        "equipment_id": row["equipment_id"],
+                        "actor_id": actor_id,
+                        "history": f"[ADDED] เพิ่มอุปกรณ์ '{row['name']}' (รหัส: {row['code']}) โดย {actor_name} (นำเข้าไฟล์)",
+                        "event_type": MovementEvent.ADDED,
+                        "changes": EquipmentService._diff({}, self._snapshot(row)),
+                        "created_at": now,
+                    }
+                    for row in batch
+                ])
+            EquipmentSearchRepository(self.repo.db).index_rows(batch)
+
+        self.repo.refresh_groups(*{v["name"] for _, v in valid})
+
+    @staticmethod
+    def _snapshot(row: dict) -> dict:
+        snap = {f: row.get(f) for f in TRACKED_FIELDS}
+        if snap.get("buy_date") is not None:
+            snap["buy_date"] = snap["buy_date"].isoformat()
+        return snap
+
+    @staticmethod
+    def _clean(raw: dict):
+        """ตรวจ + แปลงค่า 1 แถว คืน (values, error)"""
+        if "__error__" in raw:
+            return None, raw["__error__"]
+
+        def s(key):
+            v = raw.get(key)
+            return str(v).strip() if v is not None else ""
+
+        name, code = s("name"), s("code")
+        if not name or not code:
+            return None, "กรุณากรอกชื่อและรหัสอุปกรณ์"
+        buy_date = None
+        if s("buy_date"):
+            try:
+                buy_date = date.fromisoformat(s("buy_date")[:10])
+            except ValueError:
+                return None, "รูปแบบวันที่ไม่ถูกต้อง (ต้องเป็น YYYY-MM-DD)"
+        confirm = raw.get("confirm")
+        return {
+            "name": name,
+            "code": code,
+            "category": s("category") or None,
+            "brand": s("brand") or None,
+            "detail": s("detail") or None,
+            "buy_date": buy_date,
+            "status": s("status") or "available",
+            "confirm": confirm if isinstance(confirm, bool) else s("confirm").lower() in TRUE_VALUES,
+        }, None
+
+    # ---------- Export ----------
+    @staticmethod
+    def export(fmt: str, status: str = "", category: str = "") -> Iterator[str]:
+        """สตรีมไฟล์ส่งออกทีละแถว (server-side cursor ผ่าน EquipmentService.api_stream)"""
+        if fmt not in EquipmentBulkService.FORMATS:
+            raise ValueError(f"รองรับเฉพาะ {' / '.join(EquipmentBulkService.FORMATS)} (ได้ {fmt!r})")
+        rows = EquipmentService.api_stream(list(COLUMNS), status, category)
+        if fmt == "jsonl":
+            return (json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+        return EquipmentBulkService._csv_lines(rows)
+
+    @staticmethod
+    def _csv_lines(rows: Iterable[dict]) -> Iterator[str]:
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+        yield "\ufeff"  # BOM → Excel เปิดภาษาไทยถูก
+        writer.writeheader()
+        for r in rows:
+            writer.writerow(r)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
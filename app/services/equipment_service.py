@@ -1,12 +1,25 @@
 # app/services/equipment_service.py
-import os
-import uuid
-from typing import Optional, List
-from datetime import datetime
-from werkzeug.utils import secure_filename
-from flask import current_app
-from app.db.models import Equipment, EquipmentImage, User
+import hashlib
+from typing import Iterator, Optional, List
+from datetime import date, datetime
+from app.db.db import SessionLocal
+from app.db.models import Equipment, EquipmentImage, MovementEvent, User
 from app.repositories.equipment_repository import EquipmentRepository
+from app.services.image_pipeline import image_pipeline
+from app.services.image_store import image_store
+from app.config import Config
+from app.services.schemas import EquipmentPageDTO, StockMovementDTO
+
+# ฟิลด์ที่บันทึกเป็น diff ใน stock_movements.changes
+TRACKED_FIELDS = ("name", "code", "category", "brand", "detail", "buy_date", "status", "confirm")
+
+# ฟิลด์ที่เลือกได้ใน /api/equipments?fields=... (ชื่อใน API → คอลัมน์)
+API_FIELDS = {
+    "id": "equipment_id", "name": "name", "code": "code", "category": "category", "brand": "brand",
+    "detail": "detail", "buy_date": "buy_date", "status": "status", "confirm": "confirm",
+    "created_at": "created_at", "updated_at": "updated_at",
+}
+DEFAULT_API_FIELDS = ("id", "name", "status")
 
 class EquipmentService:
     def __init__(self, repo: Optional[EquipmentRepository] = None):
@@ -18,6 +31,110 @@ class EquipmentService:
     def list(self, q: str = "", category: str = ""):
         return self.repo.list(q, category)
 
+    def list_page(self, q: str = "", category: str = "", cursor: Optional[str] = None,
+                  direction: str = "next", limit: Optional[int] = None) -> EquipmentPageDTO:
+        """
+        หน้าของรายการอุปกรณ์ (admin) แบบ keyset
+        - direction="next": หน้าที่เก่ากว่า cursor / "prev": หน้าที่ใหม่กว่า cursor
+        """
+        limit = max(1, min(int(limit or Config.EQUIPMENT_PAGE_SIZE), 100))
+        key = self._parse_cursor(cursor)
+        q = (q or "").strip()
+        going_back = direction == "prev" and key is not None
+
+        rows = self.repo.list_page(
+            q, category, limit=limit + 1,
+            after=None if going_back else key,
+            before=key if going_back else None,
+        )
+        has_more = len(rows) > limit
+        if going_back:
+            items = rows[-limit:] if has_more else rows  # ตัดแถวเกินฝั่งที่ใหม่กว่าออก
+            newer, older = has_more, True
+        else:
+            items = rows[:limit]
+            newer, older = key is not None, has_more
+
+        total, capped = self.repo.count_capped(q, category, cap=Config.EQUIPMENT_COUNT_CAP)
+        return EquipmentPageDTO(
+            items=items,
+            next_cursor=self._cursor_of(items[-1]) if items and older else None,
+            prev_cursor=self._cursor_of(items[0]) if items and newer else None,
+            total=total,
+            total_is_capped=capped,
+        )
+
+    @staticmethod
+    def _cursor_of(eq) -> str:
+        return f"{eq.created_at.isoformat()}|{eq.equipment_id}"
+
+    # ---------- Collection API ----------
+    @staticmethod
+    def parse_api_fields(raw: Optional[str]) -> List[str]:
+        """"id,name,code" → รายชื่อฟิลด์ (ไม่ระบุ → ชุดเดิม id/name/status)"""
+        if not raw:
+            return list(DEFAULT_API_FIELDS)
+        fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+        unknown = [f for f in fields if f not in API_FIELDS]
+        if unknown:
+            raise ValueError(f"ไม่รู้จักฟิลด์: {', '.join(unknown)}")
+        return fields or list(DEFAULT_API_FIELDS)
+
+    def api_page(self, fields: List[str], status: str = "", category: str = "",
+                 cursor: Optional[str] = None, limit: int = 100):
+        """คืน (รายการ dict, cursor ถัดไป | None) — cursor = equipment_id สุดท้ายของหน้าก่อน"""
+        limit = max(1, min(int(limit or 100), 1000))
+        try:
+            after_id = int(cursor) if cursor else None
+        except ValueError:
+            raise ValueError("cursor ไม่ถูกต้อง")
+        columns = self._api_columns(fields)
+        rows = list(self.repo.api_rows(columns, status, category, after_id=after_id, limit=limit + 1))
+        items = [self._api_row(r, fields) for r in rows[:limit]]
+        next_cursor = str(rows[limit - 1]["equipment_id"]) if len(rows) > limit else None
+        return items, next_cursor
+
+    @classmethod
+    def api_stream(cls, fields: List[str], status: str = "", category: str = "") -> Iterator[dict]:
+        """
+        ทุกแถวที่ตรงเงื่อนไข (สำหรับ NDJSON export) ทีละแถวจาก server-side cursor
+        - เปิด session ของตัวเอง เพราะ generator ทำงานต่อหลัง view คืนค่าไปแล้ว
+        """
+        repo = EquipmentRepository(SessionLocal.session_factory())
+        try:
+            for r in repo.api_rows(cls._api_columns(fields), status, category, stream=True):
+                yield cls._api_row(r, fields)
+        finally:
+            repo.close()
+
+    def catalog_etag(self, fields: List[str], status: str = "", category: str = "",
+                     cursor: Optional[str] = None, limit: Optional[int] = None, fmt: str = "json") -> str:
+        """ETag จากเวอร์ชันของชุดข้อมูลที่กรอง + พารามิเตอร์ของ request (ไม่ต้องอ่านทุกแถว)"""
+        version = self.repo.catalog_version(status, category)
+        key = (version, tuple(fields), status, category, cursor, limit, fmt)
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _api_columns(fields: List[str]) -> List[str]:
+        cols = [API_FIELDS[f] for f in fields]
+        return cols if "equipment_id" in cols else cols + ["equipment_id"]  # ต้องมีไว้ทำ cursor
+
+    @staticmethod
+    def _api_row(row, fields: List[str]) -> dict:
+        out = {}
+        for f in fields:
+            v = row[API_FIELDS[f]]
+            out[f] = v.isoformat() if isinstance(v, (date, datetime)) else v
+        return out
+
+    def search(self, q: str, category: str = "", page: int = 1, per_page: int = 20):
+        """คืน (รายการอุปกรณ์ของหน้านี้ตามอันดับ, จำนวนที่พบทั้งหมด)"""
+        per_page = max(1, min(int(per_page or 20), 100))
+        return self.repo.search((q or "").strip(), category=category, page=max(int(page or 1), 1), per_page=per_page)
+
+    def suggest(self, prefix: str, limit: int = 10):
+        return self.repo.suggest(prefix, limit=max(1, min(int(limit or 10), 20)))
+
     def get(self, equipment_id: int):
         return self.repo.get(equipment_id)
 
@@ -59,6 +176,7 @@ class EquipmentService:
         if image_file and image_file.filename:
             image_rel_path = self._save_image(image_file)
             self.repo.add_image(equipment.equipment_id, image_rel_path)
+            self.repo.refresh_cover(equipment)
 
         # ✅ ดึงชื่อผู้ใช้งานจาก user_id
         actor_name = "ไม่ทราบชื่อ"
@@ -73,8 +191,12 @@ class EquipmentService:
                 equipment_id=equipment.equipment_id,
                 actor_id=actor_id,
                 history=f"[ADDED] เพิ่มอุปกรณ์ '{name}' (รหัส: {code}) โดย {actor_name}",
+                event_type=MovementEvent.ADDED,
+                changes=self._diff({}, self._snapshot(equipment)),
             )
 
+        self.repo.refresh_groups(equipment.name)
+        self.repo.reindex(equipment)
         self.repo.commit()
         return True, None, equipment
 
@@ -98,6 +220,7 @@ class EquipmentService:
         if not eq:
             return False, "ไม่พบอุปกรณ์", None
 
+        before = self._snapshot(eq)
         eq.name = (name or "").strip()
         eq.code = (code or "").strip()
         eq.category = (category or "").strip()
@@ -107,19 +230,18 @@ class EquipmentService:
         if buy_date:
             eq.buy_date = buy_date
         eq.confirm = confirm
+        changes = self._diff(before, self._snapshot(eq))
         # ✅ อัปเดตรูป: ลบเก่า เพิ่มใหม่
         if image_file and image_file.filename:
+            old_images = [im.image_path for im in self._images_of(eq)]
+            # ลบเฉพาะแถว — ไฟล์อาจถูกแถวอื่นอ้างอยู่ (content-addressed) → images-gc เก็บกวาดเอง
             for im in list(self._images_of(eq)):
-                try:
-                    old_path = self._abs_image_path(im.image_path)
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                except Exception as e:
-                    current_app.logger.warning("remove old image failed: %s", e)
                 self.repo.delete_image_row(im)
 
             rel_path = self._save_image(image_file)
             self.repo.add_image(eq.equipment_id, rel_path)
+            self.repo.refresh_cover(eq)
+            changes["images"] = [old_images, [rel_path]]
 
         # ✅ ดึงชื่อผู้ใช้งานจาก user_id
         actor_name = "ไม่ทราบชื่อ"
@@ -134,26 +256,26 @@ class EquipmentService:
                 equipment_id=eq.equipment_id,
                 actor_id=actor_id,
                 history=f"[UPDATED] แก้ไขข้อมูลอุปกรณ์ '{eq.name}' (รหัส: {eq.code}) โดย {actor_name}",
+                event_type=MovementEvent.UPDATED,
+                changes=changes,
             )
 
+        # ✅ เปลี่ยนชื่อ → กระทบทั้งกลุ่มเดิมและกลุ่มใหม่
+        self.repo.refresh_groups(before["name"], eq.name)
+        self.repo.reindex(eq)
         self.repo.commit()
         return True, None, eq
 
-    # ---------- Soft Delete (ไม่แตะตาราง/ไม่มี is_active) ----------
+    # ---------- Soft Delete (ตั้ง deleted_at แทนการลบแถว) ----------
     def soft_delete(self, equipment_id: int, actor_id: Optional[int]):
         eq = self.repo.get(equipment_id)
         if not eq:
             return False, "ไม่พบอุปกรณ์", None
 
-        # ✅ ลบไฟล์รูปจริง + ลบ row image
+        # ✅ ลบ row image (ไฟล์ที่ไม่มีแถวไหนอ้างแล้วถูกลบโดย images-gc)
         for im in list(self._images_of(eq)):
-            try:
-                abs_path = self._abs_image_path(im.image_path)
-                if os.path.exists(abs_path):
-                    os.remove(abs_path)
-            except Exception as e:
-                current_app.logger.warning("delete file failed: %s", e)
             self.repo.delete_image_row(im)
+        self.repo.refresh_cover(eq)
 
         # ✅ ดึงชื่อผู้ใช้งานจาก user_id
         actor_name = "ไม่ทราบชื่อ"
@@ -162,33 +284,85 @@ class EquipmentService:
             if actor:
                 actor_name = actor.name
 
+        # ✅ ทำเครื่องหมาย soft-delete บนตัวอุปกรณ์
+        self.repo.soft_delete_equipment(eq)
+
         # ✅ บันทึก movement พร้อมชื่อผู้ลบ
         if actor_id:
             self.repo.add_movement(
                 equipment_id=eq.equipment_id,
                 actor_id=actor_id,
                 history=f"[DELETED] อุปกรณ์ '{eq.name}' (รหัส: {eq.code}) ถูกลบออกจากระบบ โดย {actor_name}",
+                event_type=MovementEvent.DELETED,
             )
 
+        self.repo.refresh_groups(eq.name)
+        self.repo.reindex(eq)  # deleted_at ถูกตั้งแล้ว → ถูกเอาออกจากดัชนี
         self.repo.commit()
         return True, None, eq
 
+    # ---------- Movement timeline ----------
+    def movement_timeline(self, equipment_id: int, limit: int = 20, cursor: Optional[str] = None,
+                          event_type: Optional[str] = None):
+        """
+        คืน (รายการ StockMovementDTO, cursor ของหน้าถัดไป | None)
+        - cursor = "<created_at ISO>|<movement_id>" ของแถวสุดท้ายในหน้าก่อน
+        """
+        limit = max(1, min(int(limit or 20), 100))
+        before = self._parse_cursor(cursor)
+        event = MovementEvent(event_type) if event_type else None
+        rows = self.repo.list_movements(equipment_id, limit=limit + 1, before=before, event_type=event)
+
+        items = [
+            StockMovementDTO(
+                movement_id=mv.movement_id,
+                event_type=mv.event_type.value,
+                actor_id=mv.actor_id,
+                actor_name=actor_name,
+                history=mv.history,
+                changes=mv.changes or {},
+                created_at=mv.created_at,
+            )
+            for mv, actor_name in rows[:limit]
+        ]
+        next_cursor = None
+        if len(rows) > limit and items:
+            last = items[-1]
+            next_cursor = f"{last.created_at.isoformat()}|{last.movement_id}"
+        return items, next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]):
+        if not cursor:
+            return None
+        try:
+            created_at, movement_id = cursor.rsplit("|", 1)
+            return datetime.fromisoformat(created_at), int(movement_id)
+        except ValueError:
+            raise ValueError("cursor ไม่ถูกต้อง")
+
     # ---------- Helpers ----------
+    @staticmethod
+    def _snapshot(eq) -> dict:
+        snap = {f: getattr(eq, f, None) for f in TRACKED_FIELDS}
+        if snap.get("buy_date") is not None:
+            snap["buy_date"] = snap["buy_date"].isoformat()
+        return snap
+
+    @staticmethod
+    def _diff(before: dict, after: dict) -> dict:
+        """{"field": [ค่าเดิม, ค่าใหม่]} เฉพาะฟิลด์ที่เปลี่ยน"""
+        return {
+            k: [before.get(k), v]
+            for k, v in after.items()
+            if before.get(k) != v and not (k not in before and v in (None, ""))
+        }
+
     def _images_of(self, eq) -> List[EquipmentImage]:
         return getattr(eq, self._img_rel, []) or []
 
     def _save_image(self, image_file) -> str:
-        """เซฟไฟล์ลง /static/uploads/equipment/<uuid>.<ext>"""
-        upload_dir = current_app.config["UPLOAD_FOLDER"]
-        os.makedirs(upload_dir, exist_ok=True)
-        ext = secure_filename(image_file.filename).rsplit(".", 1)[-1].lower()
-        fname = f"{uuid.uuid4().hex}.{ext}"
-        abs_path = os.path.join(upload_dir, fname)
-        image_file.save(abs_path)
-        return f"uploads/equipment/{fname}"
-
-    def _abs_image_path(self, rel_path: str) -> str:
-        """รับ 'uploads/equipment/xxx.png' -> คืน absolute path ใต้ static/"""
-        if rel_path.startswith("uploads/"):
-            return os.path.join(current_app.static_folder, rel_path.replace("/", os.sep))
-        return os.path.join(current_app.config["UPLOAD_FOLDER"], os.path.basename(rel_path))
\ No newline at end of file
+        """เซฟต้นฉบับแบบ content-addressed (uploads/equipment/<sha256>.<ext>) แล้วส่งไปสร้างรูปย่อเบื้องหลัง"""
+        rel_path = image_store.save(image_file, folder="uploads/equipment")
+        image_pipeline.submit(rel_path)  # ไม่รอ: ระหว่างนี้หน้าเว็บใช้ต้นฉบับไปก่อน
+        return rel_path
@@ -0,0 +1,88 @@
+# app/services/history_export_service.py
+import csv
+import io
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional
+from app.config import Config
+from app.db.db import SessionLocal
+from app.repositories.history_repository import RentHistoryRepository
+from app.utils.xlsx_stream import xlsx_chunks
+
+# (คีย์จาก RentHistoryRepository.admin_stmt, หัวคอลัมน์) — เรียงเหมือนตารางในหน้า admin
+COLUMNS = (
+    ("rent_id", "เลขที่การยืม"),
+    ("user_name", "ชื่อผู้ใช้"),
+    ("identity", "รหัส"),
+    ("equipment_code", "รหัสอุปกรณ์"),
+    ("equipment_name", "อุปกรณ์"),
+    ("start_date", "วันที่ยืม"),
+    ("due_date", "กำหนดคืน"),
+    ("return_date", "วันที่คืน"),
+    ("receiver_name", "ผู้รับคืน"),
+    ("instructor_name", "อาจารย์ที่รับรอง"),
+    ("status_name", "สถานะ"),
+)
+
+
+class HistoryExportService:
+    """
+    📤 ส่งออกประวัติยืม-คืนของทุกคน (CSV หรือ XLSX) แบบสตรีม
+    - ตัวกรองเดียวกับหน้า admin (ช่วง start_date + รหัสขึ้นต้นด้วย) → admin_stmt ชุดเดียวกัน
+    - อ่านจาก server-side cursor ทีละ chunk แล้วส่งออกทีละก้อน → หน่วยความจำคงที่ไม่ว่าช่วงจะยาวแค่ไหน
+    """
+
+    FORMATS = ("csv", "xlsx")
+    MIMETYPES = {
+        "csv": "text/csv",  # Flask เติม charset=utf-8 ให้เอง
+        "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    }
+
+    def __init__(self, repo_factory: Optional[Callable[[], RentHistoryRepository]] = None,
+                 chunk_size: int = Config.HISTORY_EXPORT_CHUNK):
+        # เปิด session ของตัวเอง เพราะ generator ทำงานต่อหลัง view คืนค่าไปแล้ว
+        self.repo_factory = repo_factory or (lambda: RentHistoryRepository(SessionLocal.session_factory()))
+        self.chunk_size = max(1, chunk_size)
+
+    def export(self, fmt: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               identity: str = "") -> Iterator:
+        """คืน iterator ของก้อนข้อมูล (str สำหรับ csv / bytes สำหรับ xlsx) — รูปแบบไม่รองรับ → ValueError ทันที"""
+        if fmt not in self.FORMATS:
+            raise ValueError(f"รองรับเฉพาะ {' / '.join(self.FORMATS)} (ได้ {fmt!r})")
+        rows = self._rows(start, end, (identity or "").strip())
+        if fmt == "xlsx":
+            return xlsx_chunks([h for _, h in COLUMNS], rows, sheet_name="history", chunk_rows=self.chunk_size)
+        return self._csv_chunks(rows)
+
+    @staticmethod
+    def filename(fmt: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> str:
+        span = "_".join(d.strftime("%Y%m%d") for d in (start, end) if d) or "all"
+        return f"borrow_history_{span}.{fmt}"
+
+    # ---------- internals ----------
+    def _rows(self, start, end, identity) -> Iterator[list]:
+        repo = self.repo_factory()
+        try:
+            user_ids = repo.match_identity(identity) if identity else None
+            for r in repo.admin_iter(start, end, identity, limit=None, chunk_size=self.chunk_size,
+                                     user_ids=user_ids):
+                r["identity"] = r.get("student_id") or r.get("employee_id")
+                yield [r.get(key) for key, _ in COLUMNS]
+        finally:
+            repo.close()
+
+    def _csv_chunks(self, rows: Iterable[list]) -> Iterator[str]:
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow([h for _, h in COLUMNS])
+        yield "\ufeff" + buf.getvalue()  # BOM → Excel เปิดภาษาไทยถูก / ส่งหัวตารางออกไปก่อนเริ่ม query
+        buf.seek(0)
+        buf.truncate()
+        n = 0
+        for row in rows:
+            writer.writerow([v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v for v in row])
+            n += 1
+            if n % self.chunk_size == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
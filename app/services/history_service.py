@@ -5,6 +5,8 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Literal, Optional, List, Dict, TYPE_CHECKING
+from app.config import Config
+from app.services.schemas import HistoryPageDTO
 
 if TYPE_CHECKING:
     from app.repositories.history_repository import RentHistoryRepository
@@ -39,3 +41,79 @@ class BorrowHistoryService:
         """
         f = HistoryFilter(returned_only=returned_only)
         return self.repo.fetch_for_user(user_id, f)
+
+    def page_for_user(self, user_id: int, f: Optional[HistoryFilter] = None,
+                      cursor: Optional[str] = None, limit: Optional[int] = None) -> HistoryPageDTO:
+        """
+        ✅ ประวัติของผู้ใช้คนเดียว 1 หน้า — กรอง / เรียง / แบ่งหน้าใน SQL (cursor ไม่ถูกต้อง → ValueError)
+        """
+        f = f or HistoryFilter()
+        limit = self._limit(limit)
+        rows = self.repo.fetch_for_user(user_id, f, after=self._parse_cursor(cursor), limit=limit + 1)
+        return self._to_page(rows, limit, f.date_field)
+
+    def admin_page(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   identity: str = "", cursor: Optional[str] = None,
+                   limit: Optional[int] = None) -> HistoryPageDTO:
+        """
+        ✅ ประวัติของผู้ใช้ทุกคน 1 หน้า (query เดียว ไม่วนทีละ user) — cursor ไม่ถูกต้อง → ValueError
+        """
+        limit, after = self._limit(limit), self._parse_cursor(cursor)
+        identity = (identity or "").strip()
+        rows = self.repo.admin_page(start, end, identity, after=after, limit=limit + 1,
+                                    user_ids=self._identity_scope(identity))
+        return self._to_page(rows, limit)
+
+    def admin_stream(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     identity: str = "", cursor: Optional[str] = None,
+                     limit: Optional[int] = None) -> HistoryPageDTO:
+        """
+        เหมือน admin_page แต่ items เป็น generator (ใช้กับ stream_template)
+        - cursor ตรวจก่อนเริ่ม stream (ไม่ถูกต้อง → ValueError ทันที)
+        - next_cursor ถูกเติมเมื่อวน items จนจบ → template ต้องอ่านหลัง loop (pager อยู่ท้ายตาราง)
+        """
+        limit, after = self._limit(limit), self._parse_cursor(cursor)
+        identity = (identity or "").strip()
+        rows = self.repo.admin_iter(start, end, identity, after=after, limit=limit + 1,
+                                    user_ids=self._identity_scope(identity))
+        page = HistoryPageDTO(items=[], next_cursor=None)
+
+        def items():
+            last = None
+            for i, row in enumerate(rows):
+                if i == limit:  # แถวที่ limit+1 → มีหน้าถัดไป
+                    page.next_cursor = f"{last['start_date'].isoformat()}|{last['rent_id']}"
+                    break
+                last = row
+                yield row
+
+        page.items = items()
+        return page
+
+    def _identity_scope(self, identity: str):
+        """prefix แคบ → รายชื่อ user_id (seek ราย user) / กว้างหรือไม่กรอง → None (statement ใช้ subquery เอง)"""
+        return self.repo.match_identity(identity) if identity else None
+
+    @staticmethod
+    def _limit(limit: Optional[int]) -> int:
+        return max(1, min(int(limit or Config.HISTORY_PAGE_SIZE), 500))
+
+    @staticmethod
+    def _to_page(rows: List[Dict], limit: int, date_field: str = "start_date") -> HistoryPageDTO:
+        """ดึงมา limit+1 แถว: มีแถวเกิน → มีหน้าถัดไป, cursor = (ค่าที่ใช้เรียง, rent_id) ของแถวสุดท้าย"""
+        items = rows[:limit]
+        last = items[-1] if items and len(rows) > limit else None
+        if not last:
+            return HistoryPageDTO(items=items, next_cursor=None)
+        key = last.get(date_field) or last["start_date"]  # return_date ว่าง → repo เรียงด้วย start_date
+        return HistoryPageDTO(items=items, next_cursor=f"{key.isoformat()}|{last['rent_id']}")
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]):
+        if not cursor:
+            return None
+        try:
+            start_date, rent_id = cursor.rsplit("|", 1)
+            return datetime.fromisoformat(start_date), int(rent_id)
+        except ValueError:
+            raise ValueError("cursor ไม่ถูกต้อง")
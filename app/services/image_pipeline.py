@@ -0,0 +1,174 @@
+# app/services/image_pipeline.py
+"""
+🖼 ประมวลผลรูปอุปกรณ์ที่อัปโหลดในเบื้องหลัง
+- เก็บไฟล์ต้นฉบับไว้เหมือนเดิม แล้วสร้างรูปย่อ WebP หลายขนาด (thumb / card / large) ด้วย thread pool
+- ตั้งชื่อ variant ตามต้นฉบับ: uploads/equipment/abc.jpg → uploads/equipment/variants/abc_card.webp
+  → ImageResolver หา variant จาก path ต้นฉบับได้เลย ไม่ต้องเก็บเพิ่มใน DB
+- อ่านต้นฉบับ / เขียน variant ผ่าน storage (local หรือ S3) — ไม่แตะไฟล์ในเครื่องตรง ๆ
+- ไม่มี Pillow → ไม่สร้าง variant (หน้าเว็บใช้ต้นฉบับตามเดิม)
+"""
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from app.config import Config
+from app.services.storage import IMMUTABLE_CACHE_CONTROL, BaseStorage, storage as default_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow เป็น optional
+    Image = ImageOps = None
+
+log = logging.getLogger(__name__)
+
+VARIANT_DIR = "variants"
+PROCESSABLE_PREFIX = "uploads/"   # รูปที่อัปโหลด (รูปประกอบธีมใน images/ ไม่ต้องทำ)
+HASHED_NAME = re.compile(r"^[0-9a-f]{64}(_[a-z]+)?\.[a-z0-9]+$")  # ชื่อตาม SHA-256 (ImageStore) → เนื้อหาไม่เปลี่ยน
+
+
+class ImagePipeline:
+    def __init__(self, sizes: Optional[Dict[str, int]] = None, workers: int = 2, quality: int = 80,
+                 storage: BaseStorage = default_storage):
+        self.sizes = dict(sizes or Config.IMAGE_VARIANTS)
+        self.workers = workers
+        self.quality = quality
+        self.storage = storage
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._warned = False
+
+    # ---------- path ----------
+    @staticmethod
+    def normalize(rel_path: Optional[str]) -> str:
+        p = str(rel_path or "").replace("\\", "/").lstrip("/")
+        return p[len("static/"):] if p.startswith("static/") else p
+
+    @classmethod
+    def variant_path(cls, rel_path: str, size: str) -> Optional[str]:
+        """path (ใต้ static/) ของ variant ขนาด size — None ถ้ารูปนี้ไม่ใช่รูปที่อัปโหลด"""
+        p = cls.normalize(rel_path)
+        if not p.startswith(PROCESSABLE_PREFIX):
+            return None
+        folder, name = os.path.split(p)
+        stem = os.path.splitext(name)[0]
+        return f"{folder}/{VARIANT_DIR}/{stem}_{size}.webp"
+
+    # ---------- process ----------
+    @property
+    def available(self) -> bool:
+        if Image is None and not self._warned:
+            log.warning("Pillow ไม่ได้ติดตั้ง → ไม่สร้างรูปย่อ (ใช้รูปต้นฉบับ)")
+            self._warned = True
+        return Image is not None
+
+    def process(self, rel_path: str, force: bool = False) -> List[str]:
+        """สร้าง variant ทุกขนาดของรูปนี้ (ข้ามที่มีอยู่และใหม่กว่าต้นฉบับ) คืน path ที่สร้าง"""
+        if not self.available or self.variant_path(rel_path, "x") is None:
+            return []
+        src = self.normalize(rel_path)
+        src_mtime = self.storage.stat(src)
+        if src_mtime is None:
+            return []
+        immutable = bool(HASHED_NAME.match(os.path.basename(src)))  # ต้นฉบับชื่อตาม hash ไม่มีวันถูกเขียนทับ
+        todo = {}
+        for size in self.sizes:
+            rel = self.variant_path(rel_path, size)
+            out_mtime = None if force else self.storage.stat(rel)
+            if out_mtime is None or (not immutable and out_mtime < src_mtime):
+                todo[size] = rel
+        if not todo:
+            return []
+
+        created = []
+        with Image.open(io.BytesIO(self.storage.read(src))) as im:
+            im = ImageOps.exif_transpose(im)  # รูปจากมือถือ: หมุนตาม EXIF ก่อนย่อ
+            if im.mode not in ("RGB", "RGBA"):
+                im = im.convert("RGBA" if "A" in im.getbands() else "RGB")
+            for size, rel in todo.items():
+                copy = im.copy()
+                copy.thumbnail((self.sizes[size], self.sizes[size]), Image.LANCZOS)
+                buf = io.BytesIO()
+                copy.save(buf, "WEBP", quality=self.quality, method=4)
+                self.storage.write(rel, buf.getvalue(), cache_control=IMMUTABLE_CACHE_CONTROL if immutable else None)
+                created.append(rel)
+
+        from app.services.image_resolver import ImageResolver
+        ImageResolver.forget(rel_path)
+        return created
+
+    def remove_variants(self, rel_path: str) -> None:
+        for size in self.sizes:
+            rel = self.variant_path(rel_path, size)
+            if rel:
+                try:
+                    self.storage.delete(rel)
+                except Exception as e:
+                    log.warning("remove variant failed: %s", e)
+        from app.services.image_resolver import ImageResolver
+        ImageResolver.forget(rel_path)
+
+    # ---------- background ----------
+    def submit(self, rel_path: str, force: bool = False) -> Optional[Future]:
+        """ส่งเข้าคิวประมวลผลเบื้องหลัง (ไม่รอผล)"""
+        if not self.available or self.variant_path(rel_path, "x") is None:
+            return None
+        future = self._executor().submit(self.process, rel_path, force)
+        future.add_done_callback(self._log_failure(rel_path))
+        return future
+
+    def backfill(self, rel_paths: Iterable[str], force: bool = False) -> Dict[str, int]:
+        """ประมวลผลรูปเดิมทั้งหมดด้วย pool แล้วรอจนเสร็จ"""
+        futures = [f for f in (self.submit(p, force) for p in rel_paths) if f is not None]
+        stats = {"images": len(futures), "variants": 0, "failed": 0}
+        for f in futures:
+            try:
+                stats["variants"] += len(f.result())
+            except Exception:
+                stats["failed"] += 1
+        return stats
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=wait)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-pipeline")
+            return self._pool
+
+    @staticmethod
+    def _log_failure(rel_path: str):
+        def _cb(f: Future):
+            if f.exception() is not None:
+                log.warning("image processing failed for %s: %s", rel_path, f.exception())
+        return _cb
+
+
+# ✅ instance เดียวต่อ process
+image_pipeline = ImagePipeline(workers=Config.IMAGE_WORKERS, quality=Config.IMAGE_WEBP_QUALITY)
+
+
+def register_image_commands(app) -> None:
+    """flask images-backfill [--force] : สร้าง variant ให้รูปที่อัปโหลดไว้ก่อนมี pipeline"""
+    import click
+
+    @app.cli.command("images-backfill")
+    @click.option("--force", is_flag=True, help="สร้างใหม่แม้มี variant อยู่แล้ว")
+    def images_backfill(force: bool):
+        from sqlalchemy import select
+        from app.db.db import SessionLocal
+        from app.db.models import EquipmentImage
+
+        db = SessionLocal()
+        try:
+            paths = list(db.execute(select(EquipmentImage.image_path).distinct()).scalars())
+        finally:
+            db.close()
+        stats = image_pipeline.backfill(paths, force=force)
+        click.echo(f"images={stats['images']} variants={stats['variants']} failed={stats['failed']}")
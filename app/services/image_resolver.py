@@ -2,6 +2,10 @@
 from flask import url_for
 from typing import Optional
 from sqlalchemy import select
+from app.config import Config
+from app.repositories.equipment_repository import cover_image_cache
+from app.services.image_pipeline import PROCESSABLE_PREFIX, image_pipeline
+from app.utils.ttl_cache import TTLCache
 # ถ้าคอมไพล์ type hints แล้วหา Equipment ไม่เจอ ให้ลบ import นี้ออกได้ ไม่บังคับ
 try:
     from app.db.models import Equipment, EquipmentImage
@@ -10,18 +14,45 @@ except Exception:
     EquipmentImage = object  # type: ignore
 
 
+# ✅ จำว่าไฟล์ variant มีแล้วหรือยัง (ไม่ต้อง stat ไฟล์ทุกการ์ดทุก request)
+_variant_exists = TTLCache(max_entries=20_000, ttl_seconds=Config.IMAGE_EXISTS_CACHE_TTL)
+
+
 class ImageResolver:
     DEFAULT_PATH = "images/device/default.png"
+    SIZES = tuple(Config.IMAGE_VARIANTS)
+
+    @staticmethod
+    def variant_url(path: Optional[str], size: str = "card") -> str:
+        """
+        URL รูปขนาดที่เหมาะกับบริบท: thumb (รายการ/ประวัติ) / card (การ์ด catalog) / large (หน้ารายละเอียด)
+        - variant ยังไม่ถูกสร้าง (หรือไม่ใช่รูปอัปโหลด) → ใช้ต้นฉบับ
+        """
+        if not path:
+            return ImageResolver.to_static_url(path)
+        rel = image_pipeline.variant_path(path, size)
+        if rel and _variant_exists.get(rel, image_pipeline.storage.exists):
+            return image_pipeline.storage.url(rel)
+        return ImageResolver.to_static_url(path)
+
+    @staticmethod
+    def forget(path: Optional[str]) -> None:
+        """ล้างผลเช็คไฟล์ของรูปนี้ (เรียกหลังสร้าง/ลบ variant)"""
+        _variant_exists.invalidate(filter(None, (image_pipeline.variant_path(path, s) for s in ImageResolver.SIZES)))
 
     @staticmethod
     def to_static_url(path: Optional[str]) -> str:
         """
         แปลง path จาก DB ให้เป็น URL ใต้ /static แบบ robust
+        - ไฟล์อัปโหลด (uploads/...) → URL จาก storage (local: /static/..., S3: presigned / CDN)
         """
         if not path:
             return url_for("static", filename=ImageResolver.DEFAULT_PATH)
 
         p = str(path).replace("\\", "/").lstrip("/")
+        key = image_pipeline.normalize(p)
+        if key.startswith(PROCESSABLE_PREFIX):
+            return image_pipeline.storage.url(key)
         if p.startswith("static/"):
             # กรณี DB เก็บเริ่มต้นด้วย static/ อยู่แล้ว
             return "/" + p
@@ -39,8 +70,8 @@ class ImageResolver:
         if not eq:
             return url_for("static", filename=ImageResolver.DEFAULT_PATH)
 
-        # 1) ลองจากฟิลด์หลักบน Equipment ก่อน
-        image_attr = getattr(eq, "image", None)
+        # 1) ลองจากฟิลด์หลักบน Equipment ก่อน (cover_image = รูปแรกที่ denormalize ไว้)
+        image_attr = getattr(eq, "image", None) or getattr(eq, "cover_image", None)
         if image_attr:
             return ImageResolver.to_static_url(image_attr)
 
@@ -59,10 +90,8 @@ class ImageResolver:
     
     @staticmethod
     def first_image_for_equipment(session, equipment_id: int) -> str:
-        """ดึงรูปแรกของอุปกรณ์จากตาราง equipment_images แล้วแปลงเป็น static URL"""
-        img_path = session.execute(
-            select(EquipmentImage.image_path)
-            .where(EquipmentImage.equipment_id == equipment_id)
-            .order_by(EquipmentImage.created_at.asc())
-        ).scalar_one_or_none()
-        return ImageResolver.to_static_url(img_path)
\ No newline at end of file
+        """รูปปกของอุปกรณ์ (Equipment.cover_image ผ่าน cache ต่อ equipment_id) แปลงเป็น static URL"""
+        img_path = cover_image_cache.get(equipment_id, lambda eid: session.execute(
+            select(Equipment.cover_image).where(Equipment.equipment_id == eid)
+        ).scalar())
+        return ImageResolver.to_static_url(img_path)
@@ -0,0 +1,139 @@
+# app/services/image_store.py
+"""
+🗂 เก็บรูปที่อัปโหลดแบบ content-addressed: ชื่อไฟล์ = SHA-256 ของเนื้อไฟล์
+- อัปโหลดรูปเดิมซ้ำ → ได้ path เดิม ไม่เพิ่มไฟล์ (หลายแถวใน equipment_images / item_broke_images ใช้ไฟล์เดียวกันได้)
+- เนื้อไฟล์ของ URL หนึ่งไม่มีวันเปลี่ยน → ส่ง Cache-Control: immutable ได้
+- ลบแถวรูป ≠ ลบไฟล์ทันที (ไฟล์อาจมีแถวอื่นอ้างอยู่) → gc() ลบไฟล์ที่ไม่มีแถวไหนอ้างแล้ว
+  และเก่ากว่า grace period (กันลบไฟล์ของ upload ที่ยังไม่ commit)
+- ไฟล์อยู่ใน storage (local / S3) — ที่นี่ไม่รู้ว่าอยู่ที่ไหน
+"""
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func, select, union_all
+from werkzeug.utils import secure_filename
+from app.config import Config
+from app.db.models import EquipmentImage, ItemBrokeImage
+from app.services.image_pipeline import HASHED_NAME, image_pipeline
+from app.services.storage import IMMUTABLE_CACHE_CONTROL, BaseStorage, storage as default_storage
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK = 64 * 1024
+SPOOL_MAX = 8 * 1024 * 1024  # ไฟล์เล็กกว่านี้พักในหน่วยความจำระหว่าง hash
+
+
+class ImageStore:
+    # ตารางที่อ้างอิงไฟล์รูป (นับ reference จากทุกตาราง)
+    REFERENCE_COLUMNS = (EquipmentImage.image_path, ItemBrokeImage.image_path)
+
+    def __init__(self, storage: Optional[BaseStorage] = None,
+                 folders: Iterable[str] = ("uploads/equipment", "uploads/item_broke")):
+        self.storage = storage or default_storage
+        self.folders = tuple(folders)
+
+    # ---------- write ----------
+    def save(self, file_storage, folder: str = "uploads/equipment") -> str:
+        """บันทึกไฟล์อัปโหลด คืน key (<folder>/<sha256>.<ext>) ที่เก็บลง image_path"""
+        ext = secure_filename(file_storage.filename or "").rsplit(".", 1)[-1].lower() or "bin"
+        digest = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX) as tmp:
+            stream = file_storage.stream
+            while True:
+                chunk = stream.read(CHUNK)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+            rel_path = f"{folder}/{digest.hexdigest()}.{ext}"
+            if self.storage.exists(rel_path):
+                self.storage.touch(rel_path)  # มีอยู่แล้ว (dedup) → ต่ออายุให้พ้น grace period ของ gc
+            else:
+                tmp.seek(0)
+                self.storage.write(rel_path, tmp, cache_control=IMMUTABLE_CACHE_CONTROL)
+        return rel_path
+
+    # ---------- reference counting ----------
+    def refcount(self, db, rel_path: str) -> int:
+        """จำนวนแถว (ทุกตาราง) ที่อ้างไฟล์นี้"""
+        return sum(
+            db.execute(select(func.count()).where(col == rel_path)).scalar() or 0
+            for col in self.REFERENCE_COLUMNS
+        )
+
+    def referenced_paths(self, db) -> set:
+        """key ของทุกไฟล์ที่มีแถวอ้าง — แถวเก่าที่เก็บแค่ชื่อไฟล์ (foo.jpg) นับว่าอ้างไฟล์ชื่อนั้นในทุก folder"""
+        q = union_all(*[select(col.label("p")).where(col.is_not(None)) for col in self.REFERENCE_COLUMNS])
+        referenced = set()
+        for p in db.execute(q).scalars():
+            key = image_pipeline.normalize(p)
+            referenced.add(key)
+            if "/" not in key:  # โค้ดเดิมหาไฟล์ชื่อเปล่า ๆ ใต้ UPLOAD_FOLDER
+                referenced.update(f"{folder}/{key}" for folder in self.folders)
+        return referenced
+
+    # ---------- garbage collection ----------
+    def gc(self, db, grace_seconds: int = 3600, dry_run: bool = False) -> Dict[str, int]:
+        """
+        ลบไฟล์ใน folders ที่ไม่มีแถวไหนอ้าง (พร้อม variant) คืนสถิติ
+        - ลบเฉพาะไฟล์ที่ตั้งชื่อตาม hash (ImageStore.save) — ไฟล์อัปโหลดก่อนย้ายมา content-addressed ไม่แตะ
+        """
+        referenced = self.referenced_paths(db)
+        cutoff = time.time() - grace_seconds
+        stats = {"scanned": 0, "removed": 0, "bytes": 0}
+        for folder in self.folders:
+            for rel, mtime, size in list(self.storage.list(folder)):  # variants/ อยู่ชั้นล่าง → ลบตามต้นฉบับ
+                stats["scanned"] += 1
+                if not self.is_immutable(rel) or rel in referenced or mtime >= cutoff:
+                    continue  # ไฟล์ชื่อแบบเก่า / ยังมีแถวอ้าง / เพิ่งอัปโหลด (อาจยังไม่ commit)
+                stats["removed"] += 1
+                stats["bytes"] += size
+                if not dry_run:
+                    self.storage.delete(rel)
+                    image_pipeline.remove_variants(rel)
+        return stats
+
+    @staticmethod
+    def is_immutable(rel_path: str) -> bool:
+        """URL ชี้ไฟล์ที่ตั้งชื่อตาม hash (ต้นฉบับหรือ variant) → เนื้อหาไม่เปลี่ยน"""
+        return bool(HASHED_NAME.match(os.path.basename(rel_path or "")))
+
+
+# ✅ instance เดียวต่อ process
+image_store = ImageStore()
+
+
+def init_image_store(app) -> None:
+    """
+    - ไฟล์อัปโหลดที่ชื่อตาม hash → Cache-Control: public, max-age=1 ปี, immutable
+    - flask images-gc [--dry-run] [--grace SECONDS] : ลบไฟล์รูปที่ไม่มีแถวไหนอ้างแล้ว
+    """
+    import click
+    from flask import request
+
+    uploads_prefix = f"{app.static_url_path}/uploads/"
+
+    @app.after_request
+    def immutable_uploads(resp):
+        if request.path.startswith(uploads_prefix) and resp.status_code in (200, 304) \
+                and ImageStore.is_immutable(request.path):
+            resp.cache_control.no_cache = None
+            resp.cache_control.public = True
+            resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+            resp.cache_control.immutable = True
+        return resp
+
+    @app.cli.command("images-gc")
+    @click.option("--dry-run", is_flag=True, help="แสดงผลอย่างเดียว ไม่ลบ")
+    @click.option("--grace", default=Config.IMAGE_GC_GRACE_SECONDS, show_default=True, help="ไม่ลบไฟล์ที่ใหม่กว่า (วินาที)")
+    def images_gc(dry_run: bool, grace: int):
+        from app.db.db import SessionLocal
+
+        db = SessionLocal()
+        try:
+            stats = image_store.gc(db, grace_seconds=grace, dry_run=dry_run)
+        finally:
+            db.close()
+        click.echo(f"scanned={stats['scanned']} removed={stats['removed']} bytes={stats['bytes']}"
+                   + (" (dry-run)" if dry_run else ""))
@@ -1,51 +1,36 @@
 from app.repositories.lend_device_repository import LendDeviceRepository
 
 def get_grouped_equipments_separated():
+    """
+    ✅ การ์ดอุปกรณ์ในหน้า lend_device แยกเป็นพร้อมยืม / ไม่พร้อม
+    - อ่านจากตารางสรุป equipment_groups (อัปเดตทุกครั้งที่เพิ่ม/แก้/ลบ/ยืม/คืน) → O(จำนวนกลุ่ม)
+    """
     repo = LendDeviceRepository()
-    equipments = repo.get_all_equipments_with_images()
-
-    grouped = {}
-
-    for e in equipments:
-        name = e["name"]
-        code = e.get("code")
-        status = str(e.get("status", "")).lower()
-
-        # ✅ ถ้ายังไม่มี key นี้ให้สร้างก่อน
-        if name not in grouped:
-            grouped[name] = {
-                "equipment_id": e.get("equipment_id"),
-                "name": name,
-                "amount": 0,                 # จำนวน "พร้อมใช้งาน"
-                "total": 0,                  # ✅ เพิ่มจำนวนรวมทั้งหมด
-                "image": e["image_path"],
-                "category": e.get("category", ""),
-                "brand": e.get("brand", ""),
-                "detail": e.get("detail", ""),
-                "buy_date": e.get("buy_date", ""),
-                "confirm": e.get("confirm", False),
-                "status": status,
-                "codes": []
-            }
-
-        # ✅ นับทุกสถานะ (รวม)
-        grouped[name]["total"] += 1
-
-        # ✅ นับเฉพาะที่พร้อมใช้งาน
-        if status in ["available", "พร้อมใช้งาน"]:
-            grouped[name]["amount"] += 1
-            if code:
-                grouped[name]["codes"].append(code)
+    try:
+        groups = repo.get_equipment_groups()
+    finally:
+        repo.close()
 
     available_items = []
     unavailable_items = []
 
-    for item in grouped.values():
+    for item in groups:
         item["status_color"] = "transparent" if item["amount"] > 0 else "yellow"
         if item["amount"] > 0:
             available_items.append(item)
         else:
             unavailable_items.append(item)
 
-    repo.close()
     return {"available": available_items, "unavailable": unavailable_items}
+
+
+def get_equipment_group_detail(equipment_id: int):
+    """✅ รายละเอียดกลุ่มของอุปกรณ์ชิ้นเดียว (ไม่ต้องสร้าง catalog ทั้งหมด) — ไม่พบ → None"""
+    repo = LendDeviceRepository()
+    try:
+        item = repo.get_equipment_group(equipment_id)
+    finally:
+        repo.close()
+    if item:
+        item["status_color"] = "transparent" if item["amount"] > 0 else "yellow"
+    return item
@@ -0,0 +1,216 @@
+# app/services/notification_channels.py
+"""
+📤 ช่องทางส่งแจ้งเตือนออกนอกระบบ (pluggable)
+- ทุกช่องทางมี connection pool, ส่งพร้อมกันได้หลาย thread และจำกัดอัตราส่งของตัวเอง
+- เพิ่มช่องทางใหม่: สืบทอด BaseChannel แล้ว implement _send_one() (abstract — ลืม implement จะสร้าง instance ไม่ได้)
+"""
+import json
+import queue
+import smtplib
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from http.client import HTTPConnection, HTTPSConnection
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+
+class RateLimiter:
+    """token bucket แบบ thread-safe: เฉลี่ยไม่เกิน rate ครั้ง/วินาที (burst ได้ไม่เกิน capacity)"""
+
+    def __init__(self, rate_per_sec: float, capacity: Optional[float] = None):
+        self.rate = max(float(rate_per_sec), 0.001)
+        self.capacity = capacity or max(self.rate, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _ConnectionPool:
+    """pool ของ connection ที่ใช้ซ้ำได้ (เปิดใหม่เมื่อไม่มีว่าง, ทิ้งตัวที่พัง)"""
+
+    def __init__(self, factory, size: int):
+        self._factory = factory
+        self._idle: "queue.LifoQueue" = queue.LifoQueue(maxsize=size)
+
+    def get(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._factory()
+
+    def put(self, conn, close) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            close(conn)
+
+    def drain(self, close) -> None:
+        while True:
+            try:
+                close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class BaseChannel(ABC):
+    """ช่องทางส่ง 1 แบบ: ส่งเป็นชุดพร้อมกัน (concurrency) ภายใต้ rate limit ของช่องทาง"""
+    name = ""
+
+    def __init__(self, rate_per_sec: float = 10, concurrency: int = 4):
+        self.concurrency = max(int(concurrency), 1)
+        self.limiter = RateLimiter(rate_per_sec)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"notify-{self.name}")
+
+    def send_many(self, messages: List[Dict]) -> List[Optional[str]]:
+        """ส่งทุกข้อความ คืน list ของ error (None = สำเร็จ) ตามลำดับเดิม"""
+        return list(self._executor.map(self._send_safe, messages))
+
+    def _send_safe(self, msg: Dict) -> Optional[str]:
+        self.limiter.acquire()
+        try:
+            self._send_one(msg)
+            return None
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"[:500]
+
+    @abstractmethod
+    def _send_one(self, msg: Dict) -> None:
+        """ส่งข้อความ 1 ฉบับ — ไม่สำเร็จให้ raise (ข้อความ error ถูกเก็บใน last_error)"""
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class EmailChannel(BaseChannel):
+    """📧 ส่งอีเมลผ่าน SMTP (ใช้ connection ซ้ำ ไม่ต้อง handshake ทุกฉบับ)"""
+    name = "email"
+
+    SUBJECTS = {
+        "overdue": "แจ้งเตือน: เกินกำหนดคืนอุปกรณ์",
+        "due_now": "แจ้งเตือน: ใกล้ครบกำหนดคืนอุปกรณ์",
+        "due_tomorrow": "แจ้งเตือน: ครบกำหนดคืนอุปกรณ์วันพรุ่งนี้",
+    }
+
+    def __init__(self, host: str, port: int, sender: str, username: str = "", password: str = "",
+                 starttls: bool = False, timeout: float = 10, **kwargs):
+        self.host, self.port, self.sender = host, port, sender
+        self.username, self.password, self.starttls, self.timeout = username, password, starttls, timeout
+        super().__init__(**kwargs)
+        self._pool = _ConnectionPool(self._connect, self.concurrency)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    @staticmethod
+    def _quit(conn) -> None:
+        try:
+            conn.quit()
+        except Exception:
+            pass
+
+    def _send_one(self, msg: Dict) -> None:
+        if not msg.get("email"):
+            raise ValueError("user has no email address")
+        payload = msg.get("payload") or {}
+        em = EmailMessage()
+        em["From"] = self.sender
+        em["To"] = msg["email"]
+        em["Subject"] = self.SUBJECTS.get(msg.get("template"), "แจ้งเตือนจากระบบยืม-คืนอุปกรณ์")
+        em.set_content(payload.get("message") if isinstance(payload, dict) else str(payload))
+
+        conn = self._pool.get()
+        try:
+            conn.send_message(em)
+        except Exception:
+            self._quit(conn)  # connection อาจพัง → ไม่คืนเข้า pool
+            raise
+        self._pool.put(conn, self._quit)
+
+    def close(self) -> None:
+        super().close()
+        self._pool.drain(self._quit)
+
+
+class WebhookChannel(BaseChannel):
+    """🌐 POST JSON ไปยัง webhook (HTTP keep-alive ผ่าน connection pool)"""
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 10, **kwargs):
+        parts = urlsplit(url)
+        self.scheme, self.netloc = parts.scheme, parts.netloc
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.timeout = timeout
+        super().__init__(**kwargs)
+        self._pool = _ConnectionPool(self._connect, self.concurrency)
+
+    def _connect(self):
+        cls = HTTPSConnection if self.scheme == "https" else HTTPConnection
+        return cls(self.netloc, timeout=self.timeout)
+
+    @staticmethod
+    def _close(conn) -> None:
+        conn.close()
+
+    def _send_one(self, msg: Dict) -> None:
+        body = json.dumps({
+            "notification_id": msg["notification_id"],
+            "user_id": msg["user_id"],
+            "template": msg.get("template"),
+            "payload": msg.get("payload"),
+        }, ensure_ascii=False, default=str).encode("utf-8")
+
+        conn = self._pool.get()
+        try:
+            conn.request("POST", self.path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+        except Exception:
+            conn.close()
+            raise
+        self._pool.put(conn, self._close)
+        if resp.status >= 300:
+            raise RuntimeError(f"webhook responded {resp.status}")
+
+    def close(self) -> None:
+        super().close()
+        self._pool.drain(self._close)
+
+
+def build_channels(config) -> Dict[str, BaseChannel]:
+    """สร้างช่องทางตาม NOTIFY_CHANNELS ใน config (dict หรือ object ก็ได้)"""
+    get = config.get if isinstance(config, dict) else (lambda k, d=None: getattr(config, k, d))
+    channels: Dict[str, BaseChannel] = {}
+    for name in get("NOTIFY_CHANNELS", []) or []:
+        if name == "email":
+            channels[name] = EmailChannel(
+                host=get("SMTP_HOST"), port=get("SMTP_PORT"), sender=get("SMTP_SENDER"),
+                username=get("SMTP_USER", ""), password=get("SMTP_PASSWORD", ""),
+                starttls=get("SMTP_STARTTLS", False),
+                rate_per_sec=get("SMTP_RATE_PER_SEC", 20), concurrency=get("SMTP_CONCURRENCY", 4),
+            )
+        elif name == "webhook" and get("WEBHOOK_URL"):
+            channels[name] = WebhookChannel(
+                url=get("WEBHOOK_URL"),
+                rate_per_sec=get("WEBHOOK_RATE_PER_SEC", 50), concurrency=get("WEBHOOK_CONCURRENCY", 8),
+            )
+    return channels
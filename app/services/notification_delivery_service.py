@@ -0,0 +1,116 @@
+# app/services/notification_delivery_service.py
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Dict, Optional
+from app.db.db import SessionLocal
+from app.repositories.notification_repository import NotificationRepository
+from app.services.notification_channels import BaseChannel, build_channels
+from app.services.schemas import DeliveryReportDTO
+
+
+class NotificationDeliveryService:
+    """
+    📤 worker ส่งแจ้งเตือนออกนอกระบบ (email / webhook)
+    1) claim แถว 'scheduled' ที่ถึงเวลาเป็นชุด (SKIP LOCKED / claim token)
+    2) แยกตามช่องทาง แล้วส่งพร้อมกันภายใต้ rate limit ของแต่ละช่องทาง
+    3) เขียนผลกลับทีเดียว: sent / กลับเข้าคิวพร้อม backoff / failed เมื่อครบจำนวนครั้ง
+    """
+
+    CLAIM_TIMEOUT = timedelta(minutes=5)   # แถว 'sending' ค้างนานกว่านี้ถือว่า worker ตาย
+    BACKOFF_BASE = timedelta(seconds=30)   # ส่งไม่ผ่าน → รอ 30s, 60s, 120s, ...
+
+    def __init__(self, channels: Dict[str, BaseChannel], batch_size: int = 200,
+                 max_attempts: int = 5, session_factory=SessionLocal):
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._session_factory = session_factory
+
+    @classmethod
+    def from_config(cls, config) -> Optional["NotificationDeliveryService"]:
+        """สร้างจาก app.config — ไม่มีช่องทางที่เปิดไว้ → None"""
+        channels = build_channels(config)
+        if not channels:
+            return None
+        get = config.get if isinstance(config, dict) else (lambda k, d=None: getattr(config, k, d))
+        return cls(channels, batch_size=get("NOTIFY_BATCH_SIZE", 200), max_attempts=get("NOTIFY_MAX_ATTEMPTS", 5))
+
+    @staticmethod
+    def _now() -> datetime:
+        # send_at ของแจ้งเตือนเก็บเป็นเวลาไทยแบบ naive
+        return datetime.now(timezone(timedelta(hours=7))).replace(tzinfo=None)
+
+    def deliver_once(self) -> DeliveryReportDTO:
+        """✅ ส่ง 1 ชุด (ไม่เกิน batch_size แถว)"""
+        t0 = perf_counter()
+        report = DeliveryReportDTO()
+        now = self._now()
+        token = uuid.uuid4().hex
+
+        db = self._session_factory()
+        try:
+            repo = NotificationRepository(db)
+            claimed = repo.claim_due(
+                self.channels.keys(), now, self.batch_size, token, stale_before=now - self.CLAIM_TIMEOUT
+            )
+            db.commit()  # ปล่อย lock ก่อนส่งจริง (การส่งอาจใช้เวลานาน)
+            report.claimed = len(claimed)
+            if not claimed:
+                return report
+
+            by_channel = defaultdict(list)
+            for row in claimed:
+                by_channel[row.channel].append(row)
+
+            results = []
+            for name, rows in by_channel.items():
+                messages = [dict(r._mapping) for r in rows]
+                errors = self.channels[name].send_many(messages)
+                done_at = self._now()
+                for r, err in zip(rows, errors):
+                    results.append(self._result_for(r, err, done_at, report))
+
+            repo.record_deliveries(results)
+            db.commit()
+            return report
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            report.elapsed_ms = round((perf_counter() - t0) * 1000, 2)
+
+    def deliver_pending(self, max_batches: int = 50) -> DeliveryReportDTO:
+        """ส่งวนไปจนคิวว่าง (หรือครบ max_batches) แล้วรวมสรุป"""
+        total = DeliveryReportDTO()
+        t0 = perf_counter()
+        for _ in range(max_batches):
+            r = self.deliver_once()
+            total.claimed += r.claimed
+            total.sent += r.sent
+            total.retried += r.retried
+            total.failed += r.failed
+            if r.claimed < self.batch_size:
+                break
+        total.elapsed_ms = round((perf_counter() - t0) * 1000, 2)
+        return total
+
+    def _result_for(self, row, err: Optional[str], done_at: datetime, report: DeliveryReportDTO) -> dict:
+        if err is None:
+            report.sent += 1
+            return {"notification_id": row.notification_id, "status": "sent",
+                    "send_at": row.send_at, "delivered_at": done_at}
+        if row.attempts >= self.max_attempts:
+            report.failed += 1
+            return {"notification_id": row.notification_id, "status": "failed",
+                    "send_at": row.send_at, "last_error": err}
+        report.retried += 1
+        retry_at = done_at + self.BACKOFF_BASE * (2 ** (row.attempts - 1))
+        return {"notification_id": row.notification_id, "status": "scheduled",
+                "send_at": retry_at, "last_error": err}
+
+    def close(self) -> None:
+        for ch in self.channels.values():
+            ch.close()
@@ -0,0 +1,152 @@
+# app/services/notification_hub.py
+"""
+🔔 fan-out แจ้งเตือนใหม่ไปยัง SSE ของผู้ใช้ที่เปิดหน้าเว็บอยู่ (in-process pub/sub)
+- แต่ละ stream subscribe ด้วย user_id แล้วรอ event จาก queue ของตัวเอง
+- thread เดียวต่อ process คอย tail ตาราง notifications (id > high-water) แล้วกระจายให้ผู้ใช้ที่ subscribe
+  → แทนที่ทุกแท็บ poll /unread เอง เหลือ query เดียวต่อรอบต่อ process
+- แจ้งเตือนที่สร้างใน process นี้ (scheduler) เรียก poke() → tail ทันที ไม่ต้องรอรอบ poll
+- แจ้งเตือนจาก process อื่น (fallback) → เห็นภายใน poll_seconds
+- stream หนึ่งอันถือ worker thread ไว้ตลอด → จำกัดจำนวน subscriber ต่อ process (max_subscribers)
+  เต็มแล้ว subscribe() คืน None ให้ client ถอยไปใช้ /unread แบบ poll
+"""
+import queue
+import threading
+from typing import Dict, List, Optional, Set
+
+from app.config import Config
+from app.db.db import SessionLocal
+from app.repositories.notification_repository import NotificationRepository
+from app.services.unread_count_cache import unread_counts
+
+
+def notification_to_event(n) -> dict:
+    """แปลงแถว Notification เป็น JSON ที่หน้าเว็บใช้ (รูปแบบเดียวกับ /unread)"""
+    payload = n.payload if isinstance(n.payload, dict) else {}
+    return {
+        "id": n.notification_id,
+        "template": n.template,
+        "message": payload.get("message") if payload else n.payload,
+        "created_at": n.created_at.strftime("%Y-%m-%d %H:%M") if n.created_at else None,
+    }
+
+
+class NotificationHub:
+    QUEUE_SIZE = 100  # client ที่ช้าเกินไป → ทิ้ง event เก่า (client resume ด้วย Last-Event-ID ได้)
+
+    def __init__(self, session_factory=SessionLocal, poll_seconds: float = 5,
+                 max_subscribers: Optional[int] = None):
+        self._session_factory = session_factory
+        self.poll_seconds = poll_seconds
+        self.max_subscribers = max_subscribers  # None = ไม่จำกัด
+        self._subs: Dict[int, Set[queue.Queue]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._high_water: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- subscribe ----------
+    def subscribe(self, user_id: int) -> Optional[queue.Queue]:
+        """คืน queue ของ stream นี้ — ครบ max_subscribers แล้ว → None"""
+        q: queue.Queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self._lock:
+            if self.max_subscribers is not None and \
+                    sum(len(s) for s in self._subs.values()) >= self.max_subscribers:
+                return None
+            if self._high_water is None:
+                self._high_water = self._max_id()
+            self._subs.setdefault(user_id, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="notification-hub", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, user_id: int, q: queue.Queue) -> None:
+        with self._lock:
+            subs = self._subs.get(user_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subs[user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._subs.values())
+
+    # ---------- publish ----------
+    def publish(self, user_id: int, event: dict) -> None:
+        """ส่ง event ให้ทุก stream ของผู้ใช้คนนี้ใน process นี้"""
+        with self._lock:
+            targets = list(self._subs.get(user_id, ()))
+        for q in targets:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def poke(self) -> None:
+        """มีแจ้งเตือนใหม่ถูก commit ใน process นี้ → ให้ tail ทันที"""
+        self._wake.set()
+
+    def backlog(self, user_id: int, after_id: Optional[int] = None, limit: int = 10) -> List[dict]:
+        """
+        event ที่ต้องส่งตอนเชื่อมต่อ (เรียงจากเก่า → ใหม่)
+        - after_id (Last-Event-ID) → เฉพาะที่ใหม่กว่า id นั้น (reconnect ไม่ต้องโหลดทั้งชุด)
+        - ไม่มี → แจ้งเตือนที่ยังไม่อ่านล่าสุด limit รายการ
+        """
+        db = self._session_factory()
+        try:
+            rows = NotificationRepository(db).unread_for_user(user_id, limit=limit, after_id=after_id)
+            return [notification_to_event(n) for n in reversed(rows)]
+        finally:
+            db.close()
+
+    # ---------- tail loop ----------
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            with self._lock:
+                user_ids = list(self._subs)
+            if not user_ids:
+                with self._lock:
+                    if not self._subs:
+                        self._thread = None
+                        return
+                continue
+            try:
+                self._tail(user_ids)
+            except Exception as e:
+                print(f"[WARN] notification hub tail failed: {e}")
+
+    def _tail(self, user_ids) -> None:
+        db = self._session_factory()
+        try:
+            repo = NotificationRepository(db)
+            # ✅ อ่าน max id ก่อน แล้วดึงเฉพาะช่วง (high-water, upto] → แถวที่ commit ระหว่างนี้ไม่หลุด
+            upto = repo.max_id()
+            rows = repo.unread_after(self._high_water or 0, user_ids, upto=upto) if upto > (self._high_water or 0) else []
+        finally:
+            db.close()
+            if hasattr(self._session_factory, "remove"):
+                self._session_factory.remove()
+        unread_counts.invalidate({n.user_id for n in rows})
+        for n in rows:
+            self.publish(n.user_id, notification_to_event(n))
+        # เลื่อน high-water ไปถึง upto (รวมแถวของผู้ใช้ที่ไม่ได้เปิดหน้าเว็บอยู่)
+        self._high_water = max(self._high_water or 0, upto)
+
+    def _max_id(self) -> int:
+        db = self._session_factory()
+        try:
+            return NotificationRepository(db).max_id()
+        finally:
+            db.close()
+
+
+# ✅ instance เดียวต่อ process
+notification_hub = NotificationHub(poll_seconds=Config.NOTIFY_STREAM_POLL_SECONDS,
+                                   max_subscribers=Config.NOTIFY_STREAM_MAX_SUBSCRIBERS)
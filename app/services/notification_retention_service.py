@@ -0,0 +1,79 @@
+# app/services/notification_retention_service.py
+import time
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+from typing import Optional
+from app.db.db import SessionLocal
+from app.repositories.notification_retention_repository import NotificationRetentionRepository
+from app.services.schemas import RetentionReportDTO
+
+
+class NotificationRetentionService:
+    """
+    🧹 ย่อแจ้งเตือนเก่าที่จบแล้ว (อ่าน/ส่งแล้ว) เป็นสรุปรายวัน แล้วลบหรือย้ายแถวเดิมออก
+    - ทำทีละชุด (batch_size แถว) และ commit ทุกชุด → ไม่ถือ lock นาน
+    - จำกัดจำนวนชุดต่อรอบ (max_batches) → งานที่เหลือทำต่อรอบถัดไป
+    """
+
+    MODES = ("delete", "archive")
+    PAUSE_SECONDS = 0.05  # เว้นช่วงระหว่างชุดให้ writer อื่นได้คิว (สำคัญบน SQLite)
+
+    def __init__(self, retention_days: int = 30, mode: str = "delete", batch_size: int = 1000,
+                 max_batches: int = 200, session_factory=SessionLocal):
+        if mode not in self.MODES:
+            raise ValueError(f"NOTIFY_RETENTION_MODE ต้องเป็น {' / '.join(self.MODES)} (ได้ {mode!r})")
+        self.retention_days = retention_days
+        self.mode = mode
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self._session_factory = session_factory
+
+    @classmethod
+    def from_config(cls, config) -> "NotificationRetentionService":
+        get = config.get if isinstance(config, dict) else (lambda k, d=None: getattr(config, k, d))
+        return cls(
+            retention_days=get("NOTIFY_RETENTION_DAYS", 30),
+            mode=get("NOTIFY_RETENTION_MODE", "delete"),
+            batch_size=get("NOTIFY_RETENTION_BATCH", 1000),
+            max_batches=get("NOTIFY_RETENTION_MAX_BATCHES", 200),
+        )
+
+    @staticmethod
+    def _now() -> datetime:
+        # created_at ของแจ้งเตือนเก็บเป็นเวลาไทยแบบ naive
+        return datetime.now(timezone(timedelta(hours=7))).replace(tzinfo=None)
+
+    def run(self, now: Optional[datetime] = None) -> RetentionReportDTO:
+        """✅ ทำจนไม่เหลือแถวเข้าเกณฑ์ (หรือครบ max_batches) แล้วคืนสรุป"""
+        t0 = perf_counter()
+        report = RetentionReportDTO()
+        cutoff = (now or self._now()) - timedelta(days=self.retention_days)
+
+        for _ in range(self.max_batches):
+            moved = self._run_batch(cutoff, report)
+            if moved < self.batch_size:
+                break
+            time.sleep(self.PAUSE_SECONDS)
+
+        report.elapsed_ms = round((perf_counter() - t0) * 1000, 2)
+        return report
+
+    def _run_batch(self, cutoff: datetime, report: RetentionReportDTO) -> int:
+        db = self._session_factory()
+        try:
+            repo = NotificationRetentionRepository(db)
+            ids = repo.pick_batch(cutoff, self.batch_size)
+            if not ids:
+                return 0
+            report.summarized += repo.summarize(ids)
+            if self.mode == "archive":
+                report.archived += repo.archive(ids)
+            report.deleted += repo.delete(ids)
+            db.commit()
+            report.batches += 1
+            return len(ids)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
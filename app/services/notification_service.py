@@ -1,8 +1,13 @@
 from datetime import datetime, timedelta, timezone
-from sqlalchemy import text
+from time import perf_counter
+from app.config import Config
 from app.db.db import SessionLocal
 from app.repositories.home_repository import HomeRepository
 from app.repositories.notification_repository import NotificationRepository
+from app.repositories.notification_timer_repository import NotificationTimerRepository
+from app.services.notification_hub import notification_hub
+from app.services.unread_count_cache import unread_counts
+from app.services.schemas import NotificationTickDTO
 
 
 class NotificationService:
@@ -10,131 +15,143 @@ class NotificationService:
     DEBUG = False  # 👈 ตั้ง True/False เพื่อเปิด–ปิด log
     SHOW_SUMMARY = False # 👈 ตั้ง True/False เพื่อแสดงสรุปท้าย
 
-    def __init__(self):
+    # ✅ ข้อความของแต่ละ template (คงข้อความเดิม)
+    MESSAGES = {
+        "overdue": "รายการยืม #{rent_id} ({equipment_name}) เกินกำหนดคืนแล้ว!",
+        "due_now": "รายการยืม #{rent_id} ({equipment_name}) จะครบกำหนดภายใน 1 ชั่วโมง!",
+        "due_tomorrow": "รายการยืม #{rent_id} ({equipment_name}) ต้องคืนภายในวันพรุ่งนี้!",
+    }
+
+    def __init__(self, outbound_channels=None):
         self.db = SessionLocal()
+        # ✅ ช่องทางส่งออก (email/webhook) — สร้างแถว 'scheduled' คู่กับแจ้งเตือนในระบบ
+        self.outbound_channels = list(Config.NOTIFY_CHANNELS if outbound_channels is None else outbound_channels)
         self.home_repo = HomeRepository(SessionLocal)
         self.notif_repo = NotificationRepository(self.db)
+        self._notified_users = set()  # ผู้ใช้ที่ได้แจ้งเตือนใหม่รอบนี้ (ล้าง cache unread หลัง commit)
 
-    def process_due_notifications(self):
+    def process_due_notifications(self) -> NotificationTickDTO:
+        """
+        ✅ ตรวจสอบของที่ยังไม่คืนจาก rent_returns ทั้งหมดแบบ set-based (sweep รายวัน/ตอนเริ่ม)
+        - จัดประเภท 3 ระดับ (เกินกำหนด / เหลือ 1 ชม. / พรุ่งนี้ถึงกำหนด) ด้วย query เดียว
+        - ตัดรายการที่แจ้งไปแล้ววันนี้ด้วย anti-join แล้ว insert ทีเดียว
+        - คืนสรุปจำนวนที่สแกน/สร้างของรอบนี้
+        """
+        now = self._now()
+        t0 = perf_counter()
+        try:
+            report = self._notify(now)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self.db.close()
+        return self._finish(report, t0)
+
+    def process_due_timers(self, limit: int = 500) -> NotificationTickDTO:
         """
-        ✅ ตรวจสอบของที่ยังไม่คืนจาก rent_returns
-        - แจ้งเตือน 3 ระดับ (เกินกำหนด / พรุ่งนี้ถึงกำหนด / เหลือ 1 ชม.)
+        ✅ ดึง timer ที่ถึงเวลาแล้ว (due-24h / due-1h / due) แล้วแจ้งเตือนเฉพาะ rent เหล่านั้น
+        - ลบ timer ที่ใช้แล้วใน transaction เดียวกับการสร้างแจ้งเตือน
         """
+        now = self._now()
+        t0 = perf_counter()
+        timer_repo = NotificationTimerRepository(self.db)
+        try:
+            timers = timer_repo.due(now, limit=limit)
+            report = self._notify(now, rent_ids={t.rent_id for t in timers}) if timers else NotificationTickDTO()
+            timer_repo.delete_ids(t.timer_id for t in timers)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self.db.close()
+        return self._finish(report, t0)
+
+    def backfill_timers(self) -> int:
+        """ตั้ง timer ให้รายการยืมที่ค้างอยู่ก่อนมีคิว (รันเมื่อได้เป็น leader)"""
+        try:
+            count = NotificationTimerRepository(self.db).backfill_open_rents(self._now())
+            self.db.commit()
+            return count
+        except Exception:
+            self.db.rollback()
+            raise
+        finally:
+            self.db.close()
+
+    def next_timer_at(self):
+        """เวลาปลุกถัดไปของคิว (None = ไม่มีงานค้าง)"""
+        try:
+            return NotificationTimerRepository(self.db).next_fire_at()
+        finally:
+            self.db.close()
+
+    # ---------- internals ----------
+    @staticmethod
+    def _now() -> datetime:
         THAI_TZ = timezone(timedelta(hours=7))
-        now = datetime.now(THAI_TZ).replace(tzinfo=None)
-        created_count = 0
-
-        # ✅ ดึงข้อมูลการยืมที่ยังไม่คืน
-        with self.db as session:
-            all_rents = session.execute(text("""
-                SELECT 
-                    r.rent_id, 
-                    r.user_id, 
-                    r.due_date, 
-                    r.start_date,
-                    e.name AS equipment_name
-                FROM rent_returns r
-                JOIN equipments e ON e.equipment_id = r.equipment_id
-                WHERE r.return_date IS NULL
-            """)).fetchall()
-
-        # ✅ วนลูปตรวจสอบแต่ละรายการ
-        for r in all_rents:
-            rent_id = r.rent_id
-            user_id = r.user_id
-            equipment_name = r.equipment_name or "ไม่ทราบชื่ออุปกรณ์"
-            due_raw = r.due_date
-
-            # 🧠 แปลงเป็น datetime เสมอ
-            try:
-                due_str = str(due_raw).split('.')[0]
-                due = datetime.strptime(due_str, "%Y-%m-%d %H:%M:%S")
-                # --- แปลง start_date เผื่อใช้ตรวจยืม–คืนวันเดียวกัน ---
-                start_str = str(r.start_date).split('.')[0]
-                start = datetime.strptime(start_str, "%Y-%m-%d %H:%M:%S")
-            except Exception as e:
-                print(f"[WARN] ❌ แปลง due_date ไม่ได้ rent_id={rent_id}, raw={due_raw} ({e})")
+        return datetime.now(THAI_TZ).replace(tzinfo=None)
+
+    def _notify(self, now: datetime, rent_ids=None) -> NotificationTickDTO:
+        """จัดประเภท + dedup + bulk insert (ไม่ commit)"""
+        report = NotificationTickDTO()
+        candidates = self.notif_repo.find_due_candidates(now, rent_ids=rent_ids)
+        report.scanned = len(candidates)
+
+        rows, reachable = [], []
+        for r in candidates:
+            if r.already_sent:
+                if self.DEBUG:
+                    print(f"[SKIP] ⚠️ ข้าม {r.template} (rent_id={r.rent_id}) ของ user_id={r.user_id} (มีอยู่แล้ววันนี้)")
                 continue
-
-            # --- คำนวณเวลาห่าง ---
-            diff_seconds = (due - now).total_seconds()
-            diff_hours = diff_seconds / 3600
-            diff_minutes = int(diff_seconds // 60)
-            h, m = divmod(diff_minutes, 60)
-
-            if self.DEBUG:
-                print(f"[DEBUG] rent_id={rent_id}, user_id={user_id}, due={due}, diff={h:02d}:{m:02d} (≈{diff_hours:.2f}h)")
-
-            # ✅ 1. เกินกำหนดแล้ว (diff < 0)
-            if diff_hours < 0:
-                if self._create_notification(
-                    user_id,
-                    rent_id,
-                    "overdue",
-                    f"รายการยืม #{rent_id} ({equipment_name}) เกินกำหนดคืนแล้ว!"
-                ):
-                    created_count += 1
-
-            # ✅ 2. เหลือเวลาไม่เกิน 1 ชั่วโมง
-            elif 0 <= diff_hours <= 1:
-                if self._create_notification(
-                    user_id,
-                    rent_id,
-                    "due_now",
-                    f"รายการยืม #{rent_id} ({equipment_name}) จะครบกำหนดภายใน 1 ชั่วโมง!"
-                ):
-                    created_count += 1
-
-            # ✅ 3. เหลือเวลาไม่เกิน 24 ชั่วโมง (เฉพาะกรณียืมหลายวันเท่านั้น)
-            elif 1 < diff_hours <= 24:
-                # 🧩 ถ้ายืมและคืนภายในวันเดียวกัน → ไม่แจ้ง "พรุ่งนี้คืน"
-                if start.date() == due.date():
-                    if self.DEBUG:
-                        print(f"[SKIP] 🔕 ยืมภายในวันเดียวกัน (rent_id={rent_id}) — ไม่แจ้งพรุ่งนี้คืน")
-                    continue
-
-                # ✅ แจ้งพรุ่งนี้คืนเฉพาะกรณีต่างวัน
-                if self._create_notification(
-                    user_id,
-                    rent_id,
-                    "due_tomorrow",
-                    f"รายการยืม #{rent_id} ({equipment_name}) ต้องคืนภายในวันพรุ่งนี้!"
-                ):
-                    created_count += 1
-
-        # ✅ หลังจาก loop จบ
-        self.db.commit()
+            rows.append(self._build_row(r, now))
+            reachable.append(bool(r.has_email))
+
+        # ✅ แถวที่ชนคีย์ dedup (เช่น อีก process insert ไปก่อน) ถูก DB ข้ามเอง
+        report.created = self.notif_repo.bulk_create(rows)
+        self._notified_users = {row["user_id"] for row in rows}
+        report.skipped = report.scanned - report.created
+
+        # 📤 คิวส่งออกต่อช่องทาง (worker ส่งจริงภายหลัง) — ผู้ใช้ไม่มีอีเมล → ไม่สร้างแถว email ที่ส่งไม่ได้แน่ ๆ
+        outbound = [
+            dict(row, channel=channel, status="scheduled")
+            for row, has_email in zip(rows, reachable)
+            for channel in self.outbound_channels
+            if channel != "email" or has_email
+        ]
+        report.queued = self.notif_repo.bulk_create(outbound)
+        return report
+
+    def _finish(self, report: NotificationTickDTO, t0: float) -> NotificationTickDTO:
+        report.elapsed_ms = round((perf_counter() - t0) * 1000, 2)
+        # 🔔 มีแจ้งเตือนใหม่ (commit แล้ว) → ให้ SSE ใน process นี้ push ทันที + นับ unread ใหม่
+        if report.created:
+            unread_counts.invalidate(self._notified_users)
+            notification_hub.poke()
         # ✅ แสดงสรุปท้าย (ควบคุมแยกได้)
         if self.SHOW_SUMMARY:
-            print(f"\n✅ สร้างแจ้งเตือนใหม่ {created_count} รายการ\n")
-        self.db.close()
-
-
-    def _create_notification(self, user_id, rent_id, template, message):
-        """✅ สร้างแจ้งเตือนใหม่ (ถ้ายังไม่มีในวันนี้)"""
-        THAI_TZ = timezone(timedelta(hours=7))
-        now = datetime.now(THAI_TZ).replace(tzinfo=None)
-
-        # ตรวจว่ามีแจ้งเตือน rent_id เดิมในวันนี้ไหม
-        if self.notif_repo.exists_today(user_id, rent_id, template):
-            if self.DEBUG:            
-                print(f"[SKIP] ⚠️ ข้าม {template} (rent_id={rent_id}) ของ user_id={user_id} (มีอยู่แล้ววันนี้)")
-            return False
+            print(f"\n✅ สแกน {report.scanned} รายการ, สร้างแจ้งเตือนใหม่ {report.created} รายการ\n")
+        return report
 
-        # ✅ บันทึก rent_id ลงใน payload JSON
-        self.notif_repo.create({
-            "user_id": user_id,
+    def _build_row(self, r, now) -> dict:
+        """✅ เตรียมแถวแจ้งเตือนใหม่ (บันทึก rent_id ลงใน payload JSON)"""
+        equipment_name = r.equipment_name or "ไม่ทราบชื่ออุปกรณ์"
+        message = self.MESSAGES[r.template].format(rent_id=r.rent_id, equipment_name=equipment_name)
+        if self.DEBUG:
+            print(f"[NEW] 🔔 เพิ่มแจ้งเตือน {r.template} (rent_id={r.rent_id}) ให้ user_id={r.user_id}")
+        return {
+            "user_id": r.user_id,
+            "rent_id": r.rent_id,
+            "dedup_day": now.date(),
             "channel": "system",
-            "template": template,
+            "template": r.template,
             "payload": {
-                "rent_id": rent_id,   # ✅ ใส่ rent_id ลง payload
+                "rent_id": r.rent_id,   # ✅ ใส่ rent_id ลง payload
                 "message": message
             },
             "send_at": now,
             "status": "unread",
             "created_at": now,
-        })
-
-        if self.DEBUG:
-            print(f"[NEW] 🔔 เพิ่มแจ้งเตือน {template} (rent_id={rent_id}) ให้ user_id={user_id}")
-        return True
+        }
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Dict
 from datetime import datetime
 
@@ -36,3 +36,76 @@ class TopBorrowedDTO:
     code: str
     borrow_count: int
     image_path: str | None = None   # 👈 เพิ่มตรงนี้
+
+
+@dataclass
+class NotificationTickDTO:
+    """สรุปผลการตรวจแจ้งเตือน 1 รอบของ scheduler"""
+    scanned: int = 0       # จำนวน rent ที่อยู่ในหน้าต่างเวลา (≤ 24 ชม. / เกินกำหนด)
+    created: int = 0       # จำนวนแจ้งเตือนที่สร้างใหม่
+    skipped: int = 0       # จำนวนที่มีแจ้งเตือนวันนี้อยู่แล้ว (dedup)
+    queued: int = 0        # จำนวนแถวที่เข้าคิวส่งออก (email/webhook)
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class DeliveryReportDTO:
+    """สรุปผลการส่งแจ้งเตือนออกนอกระบบ 1 รอบของ worker"""
+    claimed: int = 0
+    sent: int = 0
+    retried: int = 0       # ส่งไม่สำเร็จ แต่ยังไม่ครบจำนวนครั้ง → กลับเข้าคิว
+    failed: int = 0        # ครบจำนวนครั้งแล้ว → status = failed
+    elapsed_ms: float = 0.0
+
+    @property
+    def per_second(self) -> float:
+        return round(self.sent / (self.elapsed_ms / 1000), 1) if self.elapsed_ms else 0.0
+
+
+@dataclass
+class RetentionReportDTO:
+    """สรุปผลการย่อ/ลบแจ้งเตือนเก่า 1 รอบ"""
+    batches: int = 0
+    summarized: int = 0    # แถวที่ถูกนับรวมเข้าตารางสรุปรายวัน
+    archived: int = 0      # แถวที่คัดลอกไป notifications_archive
+    deleted: int = 0       # แถวที่ลบออกจาก notifications (= rows reclaimed)
+    elapsed_ms: float = 0.0
+
+
+@dataclass
+class StockMovementDTO:
+    """1 เหตุการณ์ใน timeline ของอุปกรณ์"""
+    movement_id: int
+    event_type: str
+    actor_id: int | None
+    actor_name: str | None
+    history: str
+    changes: dict
+    created_at: datetime
+
+
+@dataclass
+class EquipmentPageDTO:
+    """1 หน้าของรายการอุปกรณ์ (keyset) — cursor = "<created_at ISO>|<equipment_id>" """
+    items: list
+    next_cursor: str | None      # ไปหน้าที่เก่ากว่า
+    prev_cursor: str | None      # ย้อนกลับหน้าที่ใหม่กว่า
+    total: int
+    total_is_capped: bool        # True = มีมากกว่า total (นับถึงเพดาน EQUIPMENT_COUNT_CAP)
+
+
+@dataclass
+class HistoryPageDTO:
+    """1 หน้าของประวัติยืม-คืน (keyset ใหม่ → เก่า) — cursor = "<start_date ISO>|<rent_id>" """
+    items: list
+    next_cursor: str | None      # ไปหน้าที่เก่ากว่า
+
+
+@dataclass
+class ImportReportDTO:
+    """ผลการนำเข้าอุปกรณ์แบบกลุ่ม 1 ไฟล์"""
+    received: int = 0
+    inserted: int = 0
+    dry_run: bool = False
+    errors: list = field(default_factory=list)   # [{"row": เลขแถว, "code": ..., "error": ข้อความ}]
+    elapsed_ms: float = 0.0
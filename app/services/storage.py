@@ -0,0 +1,361 @@
+# app/services/storage.py
+"""
+🗄 ที่เก็บไฟล์อัปโหลด (pluggable) — key = path เดียวกับที่เก็บใน DB เช่น uploads/equipment/<sha256>.jpg
+- FileSystemStorage : เขียนลง static/ ของแอป (ค่าเดิม / เครื่องเดียว)
+- S3Storage         : bucket แบบ S3 (AWS S3 / MinIO / R2 ...) ผ่าน HTTP + AWS Signature V4 ล้วน ไม่ต้องมี boto3
+  → หลาย instance ใช้ไฟล์ชุดเดียวกัน และเบราว์เซอร์โหลดรูปจาก bucket/CDN ตรง ๆ ไม่ผ่าน worker ของ Flask
+- url(key): STORAGE_PUBLIC_URL (CDN / bucket สาธารณะ) → URL ตรง; ไม่มี → local: /static/..., s3: presigned URL
+- เลือก backend ด้วย STORAGE_BACKEND=local|s3
+"""
+import hashlib
+import hmac
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from http.client import HTTPConnection, HTTPSConnection
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple, Union
+from urllib.parse import quote, urlsplit
+from app.config import Config
+
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+Body = Union[bytes, BinaryIO]
+
+
+def content_type_of(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+class BaseStorage(ABC):
+    """อินเทอร์เฟซกลาง — ทุก method รับ key แบบ 'uploads/...' (ไม่มี / นำหน้า)"""
+    name = ""
+
+    def __init__(self, public_url: str = ""):
+        self.public_url = public_url.rstrip("/")
+
+    @abstractmethod
+    def write(self, key: str, body: Body, cache_control: Optional[str] = None) -> None:
+        """เขียนไฟล์ (bytes หรือ file object) ไปที่ key"""
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        """อ่านไฟล์ทั้งไฟล์"""
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[float]:
+        """mtime (epoch) ของไฟล์ — None ถ้าไม่มี"""
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def touch(self, key: str) -> None:
+        """ต่ออายุ mtime (dedup hit ระหว่าง grace period ของ gc)"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """ลบไฟล์ (ไม่มีอยู่แล้วก็ไม่ error)"""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[Tuple[str, float, int]]:
+        """(key, mtime, size) ของไฟล์ที่อยู่ตรงใต้ prefix/ (ไม่ลงโฟลเดอร์ย่อย)"""
+
+    def url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{quote(key)}"
+        return self._private_url(key)
+
+    @abstractmethod
+    def _private_url(self, key: str) -> str:
+        """URL ของไฟล์เมื่อไม่มี public_url (static ของแอป / presigned URL)"""
+
+
+class FileSystemStorage(BaseStorage):
+    """📁 ไฟล์ใต้ static/ — Flask (หรือ web server หน้าแอปผ่าน STORAGE_PUBLIC_URL) เป็นผู้เสิร์ฟ"""
+    name = "local"
+
+    def __init__(self, root: str = STATIC_ROOT, public_url: str = ""):
+        super().__init__(public_url)
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key.replace("/", os.sep))
+
+    def write(self, key: str, body: Body, cache_control: Optional[str] = None) -> None:
+        out = self.path(key)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(body, (bytes, bytearray)):
+                    f.write(body)
+                else:
+                    shutil.copyfileobj(body, f)
+            os.replace(tmp, out)  # ผู้อ่านไม่เห็นไฟล์ครึ่ง ๆ
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def read(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def stat(self, key: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.path(key))
+        except OSError:
+            return None
+
+    def touch(self, key: str) -> None:
+        os.utime(self.path(key))
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, float, int]]:
+        base = self.path(prefix)
+        if not os.path.isdir(base):
+            return
+        for entry in os.scandir(base):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                st = entry.stat()
+                yield f"{prefix.rstrip('/')}/{entry.name}", st.st_mtime, st.st_size
+
+    def _private_url(self, key: str) -> str:
+        from flask import url_for
+        return url_for("static", filename=key)
+
+
+class _SigV4:
+    """✍️ AWS Signature Version 4 สำหรับ service s3 (header และ presigned query)"""
+    ALGORITHM = "AWS4-HMAC-SHA256"
+    UNSIGNED = "UNSIGNED-PAYLOAD"
+
+    def __init__(self, access_key: str, secret_key: str, region: str):
+        self.access_key, self.secret_key, self.region = access_key, secret_key, region
+        self._keys: Dict[str, bytes] = {}
+
+    @staticmethod
+    def _hmac(key: bytes, msg: str) -> bytes:
+        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+    def _signing_key(self, day: str) -> bytes:
+        key = self._keys.get(day)
+        if key is None:
+            key = self._hmac(("AWS4" + self.secret_key).encode("utf-8"), day)
+            for part in (self.region, "s3", "aws4_request"):
+                key = self._hmac(key, part)
+            self._keys = {day: key}  # เก็บแค่วันล่าสุด
+        return key
+
+    @staticmethod
+    def _query(params: Dict[str, str]) -> str:
+        return "&".join(f"{quote(k, safe='-_.~')}={quote(str(v), safe='-_.~')}" for k, v in sorted(params.items()))
+
+    def _signature(self, method, path, query, headers, payload_hash, amz_date) -> str:
+        names = sorted(h.lower() for h in headers)
+        canonical_headers = "".join(f"{n}:{str(headers[n]).strip()}\n" for n in names)
+        canonical = "\n".join([method, quote(path, safe="/-_.~"), query, canonical_headers,
+                               ";".join(names), payload_hash])
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        to_sign = "\n".join([self.ALGORITHM, amz_date, scope, hashlib.sha256(canonical.encode()).hexdigest()])
+        return hmac.new(self._signing_key(amz_date[:8]), to_sign.encode(), hashlib.sha256).hexdigest()
+
+    def sign_headers(self, method: str, host: str, path: str, params: Dict[str, str],
+                     headers: Dict[str, str], payload_hash: str, now: datetime) -> Dict[str, str]:
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        signed = {k.lower(): v for k, v in headers.items()}
+        signed.update({"host": host, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+        sig = self._signature(method, path, self._query(params), signed, payload_hash, amz_date)
+        scope = f"{amz_date[:8]}/{self.region}/s3/aws4_request"
+        signed["authorization"] = (f"{self.ALGORITHM} Credential={self.access_key}/{scope}, "
+                                   f"SignedHeaders={';'.join(sorted(signed))}, Signature={sig}")
+        del signed["host"]  # http.client ใส่ Host เอง
+        return signed
+
+    def presign(self, method: str, host: str, path: str, expires: int, now: datetime) -> str:
+        """query string ของ presigned URL (ลงนามเฉพาะ host)"""
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        params = {
+            "X-Amz-Algorithm": self.ALGORITHM,
+            "X-Amz-Credential": f"{self.access_key}/{amz_date[:8]}/{self.region}/s3/aws4_request",
+            "X-Amz-Date": amz_date,
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        query = self._query(params)
+        sig = self._signature(method, path, query, {"host": host}, self.UNSIGNED, amz_date)
+        return f"{query}&X-Amz-Signature={sig}"
+
+
+class S3Storage(BaseStorage):
+    """
+    ☁️ bucket แบบ S3 (path-style: <endpoint>/<bucket>/<key> — ใช้ได้กับ MinIO)
+    - presigned URL ลงนามด้วยเวลาที่ปัดลงเป็นช่วง ๆ → URL ของรูปเดิมคงที่ครึ่งหนึ่งของอายุ เบราว์เซอร์ cache ได้
+    - connection แยกต่อ thread (keep-alive) — thread pool ของ image pipeline ใช้พร้อมกันได้
+    """
+    name = "s3"
+
+    def __init__(self, endpoint: str, bucket: str, access_key: str, secret_key: str,
+                 region: str = "us-east-1", public_url: str = "", url_ttl: int = 3600, timeout: float = 10):
+        super().__init__(public_url)
+        parts = urlsplit(endpoint)
+        self.scheme, self.host = parts.scheme or "https", parts.netloc
+        self.bucket = bucket
+        self.url_ttl = max(int(url_ttl), 60)
+        self.timeout = timeout
+        self._signer = _SigV4(access_key, secret_key, region)
+        self._local = threading.local()
+
+    # ---------- HTTP ----------
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = HTTPSConnection if self.scheme == "https" else HTTPConnection
+            conn = self._local.conn = cls(self.host, timeout=self.timeout)
+        return conn
+
+    def _path(self, key: str = "") -> str:
+        return f"/{self.bucket}/{key}" if key else f"/{self.bucket}"
+
+    def _request(self, method: str, key: str = "", params: Optional[Dict[str, str]] = None,
+                 body: Optional[Body] = None, headers: Optional[Dict[str, str]] = None):
+        params = params or {}
+        headers = dict(headers or {})
+        if body is None or isinstance(body, (bytes, bytearray)):
+            payload_hash = hashlib.sha256(body or b"").hexdigest()
+        else:  # file object: ส่งแบบ stream ไม่อ่านทั้งไฟล์เข้าหน่วยความจำ
+            payload_hash = _SigV4.UNSIGNED
+            pos = body.tell()
+            headers["Content-Length"] = str(body.seek(0, os.SEEK_END) - pos)
+            body.seek(pos)
+        path = self._path(key)
+        signed = self._signer.sign_headers(method, self.host, path, params, headers, payload_hash,
+                                           datetime.now(timezone.utc))
+        url = quote(path, safe="/-_.~") + (f"?{_SigV4._query(params)}" if params else "")
+
+        for attempt in (1, 2):  # keep-alive อาจถูกปิดฝั่ง server → ลองใหม่ครั้งเดียว
+            conn = self._conn()
+            try:
+                conn.request(method, url, body=body, headers=signed)
+                resp = conn.getresponse()
+                data = resp.read()
+                return resp, data
+            except (ConnectionError, OSError) as e:
+                conn.close()
+                self._local.conn = None
+                if attempt == 2 or (body is not None and not isinstance(body, (bytes, bytearray))):
+                    raise StorageError(f"s3 {method} {key}: {e}") from e
+
+    @staticmethod
+    def _check(resp, data, method, key):
+        if resp.status >= 300:
+            raise StorageError(f"s3 {method} {key} → {resp.status}: {data[:200]!r}")
+
+    # ---------- operations ----------
+    def write(self, key: str, body: Body, cache_control: Optional[str] = None) -> None:
+        headers = {"Content-Type": content_type_of(key)}
+        if cache_control:
+            headers["Cache-Control"] = cache_control
+        resp, data = self._request("PUT", key, body=body, headers=headers)
+        self._check(resp, data, "PUT", key)
+
+    def read(self, key: str) -> bytes:
+        resp, data = self._request("GET", key)
+        self._check(resp, data, "GET", key)
+        return data
+
+    def stat(self, key: str) -> Optional[float]:
+        resp, data = self._request("HEAD", key)
+        if resp.status == 404:
+            return None
+        self._check(resp, data, "HEAD", key)
+        modified = resp.getheader("Last-Modified")
+        return _parse_http_date(modified) if modified else time.time()
+
+    def touch(self, key: str) -> None:
+        # copy ทับตัวเอง (REPLACE metadata) → LastModified ใหม่ โดยไม่ต้องส่งเนื้อไฟล์อีก
+        resp, data = self._request("PUT", key, headers={
+            "x-amz-copy-source": quote(self._path(key)),
+            "x-amz-metadata-directive": "REPLACE",
+            "Content-Type": content_type_of(key),
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        })
+        self._check(resp, data, "COPY", key)
+
+    def delete(self, key: str) -> None:
+        resp, data = self._request("DELETE", key)
+        if resp.status != 404:
+            self._check(resp, data, "DELETE", key)
+
+    def list(self, prefix: str) -> Iterator[Tuple[str, float, int]]:
+        prefix = prefix.rstrip("/") + "/"
+        token = None
+        while True:
+            params = {"list-type": "2", "prefix": prefix, "delimiter": "/"}
+            if token:
+                params["continuation-token"] = token
+            resp, data = self._request("GET", params=params)
+            self._check(resp, data, "LIST", prefix)
+            root = ET.fromstring(data)
+            ns = root.tag[: root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+            for item in root.iter(f"{ns}Contents"):
+                yield (item.findtext(f"{ns}Key"),
+                       _parse_iso(item.findtext(f"{ns}LastModified")),
+                       int(item.findtext(f"{ns}Size") or 0))
+            token = root.findtext(f"{ns}NextContinuationToken")
+            if root.findtext(f"{ns}IsTruncated") != "true" or not token:
+                return
+
+    def _private_url(self, key: str) -> str:
+        now = int(time.time())
+        window = self.url_ttl // 2
+        signed_at = datetime.fromtimestamp(now - now % window, timezone.utc)
+        path = self._path(key)
+        query = self._signer.presign("GET", self.host, path, self.url_ttl, signed_at)
+        return f"{self.scheme}://{self.host}{quote(path, safe='/-_.~')}?{query}"
+
+
+def _parse_iso(value: Optional[str]) -> float:
+    if not value:
+        return 0.0
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def _parse_http_date(value: str) -> float:
+    from email.utils import parsedate_to_datetime
+    return parsedate_to_datetime(value).timestamp()
+
+
+def build_storage(config) -> BaseStorage:
+    """สร้าง backend ตาม STORAGE_BACKEND ใน config (dict หรือ object ก็ได้)"""
+    get = config.get if isinstance(config, dict) else (lambda k, d=None: getattr(config, k, d))
+    backend = (get("STORAGE_BACKEND", "local") or "local").lower()
+    if backend == "s3":
+        return S3Storage(
+            endpoint=get("S3_ENDPOINT"), bucket=get("S3_BUCKET"),
+            access_key=get("S3_ACCESS_KEY", ""), secret_key=get("S3_SECRET_KEY", ""),
+            region=get("S3_REGION", "us-east-1"), public_url=get("STORAGE_PUBLIC_URL", ""),
+            url_ttl=get("STORAGE_URL_TTL", 3600),
+        )
+    if backend != "local":
+        raise ValueError(f"unknown STORAGE_BACKEND: {backend}")
+    return FileSystemStorage(public_url=get("STORAGE_PUBLIC_URL", ""))
+
+
+# ✅ instance เดียวต่อ process (image_store / image_pipeline / ImageResolver ใช้ร่วมกัน)
+storage = build_storage(Config)
@@ -0,0 +1,28 @@
+# app/services/unread_count_cache.py
+"""
+🔢 cache จำนวนแจ้งเตือนที่ยังไม่อ่านต่อผู้ใช้ (ในหน่วยความจำของ process)
+- LRU จำกัดจำนวนผู้ใช้ (max_entries) + หมดอายุตาม ttl_seconds
+- ปรับค่าตรง ๆ เมื่อรู้ผลแน่นอน (dismiss ใน process นี้) / invalidate เมื่อมีแถวใหม่
+- process อื่นเขียนแทรก → อย่างช้าค่าตรงกันเมื่อครบ ttl
+"""
+from app.config import Config
+from app.utils.ttl_cache import TTLCache
+
+
+class UnreadCountCache(TTLCache):
+    def set(self, user_id: int, count: int) -> None:
+        super().set(user_id, max(int(count), 0))
+
+    def adjust(self, user_id: int, delta: int) -> None:
+        """บวก/ลบจำนวน ถ้ามีใน cache (ไม่มี → ครั้งหน้าค่อยนับใหม่)"""
+        with self._lock:
+            hit = self._data.get(user_id)
+            if hit is not None:
+                self._data[user_id] = (max(hit[0] + delta, 0), hit[1])
+
+
+# ✅ instance เดียวต่อ process
+unread_counts = UnreadCountCache(
+    max_entries=Config.NOTIFY_UNREAD_CACHE_SIZE,
+    ttl_seconds=Config.NOTIFY_UNREAD_CACHE_TTL,
+)
@@ -13,24 +13,18 @@ function translateTemplate(template) {
 }
 
 
-// 🔄 โหลดรายการแจ้งเตือน
-async function loadNotifications() {
-  const res = await fetch("/api/notifications/unread");
-  const data = await res.json();
+// 🗂 แจ้งเตือนที่แสดงอยู่ (id → notification) — ใหม่สุดอยู่บน
+const notifState = new Map();
 
+// 🔄 วาดรายการแจ้งเตือนจาก notifState
+function renderNotifications() {
   const bell = document.getElementById("notifBell");
   const count = document.getElementById("notifCount");
   const list = document.getElementById("notifList");
 
   if (!bell || !count || !list) return;
 
-  // 🧮 badge จำนวนแจ้งเตือน
-  if (data.length > 0) {
-    count.textContent = data.length;
-    count.classList.remove("d-none");
-  } else {
-    count.classList.add("d-none");
-  }
+  const data = [...notifState.values()].sort((a, b) => b.id - a.id).slice(0, 10);
 
   // 🧾 สร้างรายการแจ้งเตือน
   list.innerHTML = "";
@@ -60,13 +54,74 @@ async function loadNotifications() {
   });
 }
 
+// 🧮 badge จำนวนแจ้งเตือน (นับจริงจาก server — ไม่จำกัดแค่ 10 รายการที่แสดง)
+async function refreshUnreadCount() {
+  const count = document.getElementById("notifCount");
+  if (!count) return;
+
+  const res = await fetch("/api/notifications/unread/count");
+  const { count: unread } = await res.json();
+  count.textContent = unread;
+  count.classList.toggle("d-none", unread === 0);
+}
+
+// ❌ ปิดแจ้งเตือนทั้งหมดที่เห็นอยู่ (request เดียว)
+async function dismissAllNotifications() {
+  if (notifState.size === 0) return;
+  const upToId = Math.max(...notifState.keys());
+
+  await fetch("/api/notifications/dismiss-all", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ up_to_id: upToId }),
+  });
+  [...notifState.keys()].filter((id) => id <= upToId).forEach((id) => notifState.delete(id));
+  renderNotifications();
+  refreshUnreadCount();
+}
+
+// 🔄 โหลดรายการแจ้งเตือนทั้งชุด (ใช้เมื่อ browser ไม่รองรับ SSE)
+async function loadNotifications() {
+  const res = await fetch("/api/notifications/unread");
+  const data = await res.json();
+  notifState.clear();
+  data.forEach((n) => notifState.set(n.id, n));
+  renderNotifications();
+  refreshUnreadCount();
+}
+
+// 🔄 poll /unread ทุก 60 วินาที (browser ไม่รองรับ SSE หรือ server ปฏิเสธ stream)
+let notifPollTimer = null;
+function pollNotifications() {
+  if (notifPollTimer) return;
+  loadNotifications();
+  notifPollTimer = setInterval(loadNotifications, 60000);
+}
+
+// 📡 รับแจ้งเตือนใหม่แบบ push (SSE) — browser ส่ง Last-Event-ID ให้เองตอน reconnect
+// server ปิด stream ตามอายุ → browser reconnect เอง / ตอบ 204 (stream เต็ม) → ปิดถาวร แล้วถอยไป poll
+function subscribeNotifications() {
+  if (!window.EventSource) return false;
+
+  const source = new EventSource("/api/notifications/stream");
+  source.addEventListener("notification", (e) => {
+    const n = JSON.parse(e.data);
+    notifState.set(n.id, n);
+    renderNotifications();
+    refreshUnreadCount();
+  });
+  source.addEventListener("error", () => {
+    if (source.readyState === EventSource.CLOSED) pollNotifications();
+  });
+  return true;
+}
+
 // ❌ ปิดแจ้งเตือน (mark as read)
 async function dismissNotification(id) {
   const card = document.querySelector(
     `.notification-card button[onclick="dismissNotification(${id})"]`
   )?.closest(".notification-card"); // หา card ที่ปุ่มนี้อยู่   
 
-  const count = document.getElementById("notifCount"); // วงกลมแสดงจำนวนแจ้งเตือน
   const list = document.getElementById("notifList"); // รายการแจ้งเตือนทั้งหมด
 
   if (card) {
@@ -77,17 +132,9 @@ async function dismissNotification(id) {
     // รอให้ fade จบก่อนลบ
     setTimeout(() => {
       card.remove();        
+      notifState.delete(id);
 
-      const remaining = list.querySelectorAll(".notification-card").length;
-
-      if (remaining > 0) {
-        count.textContent = remaining;   // ✅ อัพเดตเลขใหม่
-        count.classList.remove("d-none");      // ✅ ไม่ซ่อนวงกลม
-        count.style.display = "inline-block"; // ให้โชว์อยู่ตลอด
-      } else {
-        count.textContent = "0";         // ✅ แสดงเลข 0
-        count.classList.remove("d-none"); // ✅ ไม่ซ่อนวงกลม
-        count.style.display = "inline-block"; // ให้โชว์อยู่ตลอด
+      if (list.querySelectorAll(".notification-card").length === 0) {
         list.innerHTML = `<div class="empty-msg">ไม่มีการแจ้งเตือนใหม่</div>`;
       }
     }, 300);
@@ -95,6 +142,7 @@ async function dismissNotification(id) {
 
   // เรียก API เปลี่ยนสถานะ
   await fetch(`/api/notifications/dismiss/${id}`, { method: "POST" });
+  refreshUnreadCount();
 
 } 
 
@@ -119,7 +167,6 @@ document.addEventListener("DOMContentLoaded", () => {
 
   bell.addEventListener("click", () => {
     dropdown.style.display = (dropdown.style.display === "none" ? "block" : "none");
-    loadNotifications();
   });
 
   // ปิดเมื่อคลิกนอกกรอบ
@@ -129,7 +176,9 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
-  // โหลดทุก 60 วินาที
-  loadNotifications();
-  setInterval(loadNotifications, 60000);
+  document.getElementById("notifDismissAll")?.addEventListener("click", dismissAllNotifications);
+
+  // 📡 ใช้ SSE ถ้าได้ ไม่งั้นโหลดทุก 60 วินาทีแบบเดิม
+  refreshUnreadCount();
+  if (!subscribeNotifications()) pollNotifications();
 });
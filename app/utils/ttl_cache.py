@@ -0,0 +1,72 @@
+# app/utils/ttl_cache.py
+"""
+🗃 cache ในหน่วยความจำของ process: LRU จำกัดจำนวน key + หมดอายุตาม ttl_seconds (thread-safe)
+- get(key, loader) → ไม่มี/หมดอายุ ค่อยเรียก loader(key) แล้วเก็บไว้
+- invalidate(keys) เมื่อข้อมูลต้นทางเปลี่ยน (process อื่นเขียน → อย่างช้าตรงกันเมื่อครบ ttl)
+- invalidate_after_commit(session, keys) ล้างตอนนี้ + อีกครั้งหลัง commit ของ session นั้น
+  (key ที่รอไว้อยู่ใน session.info — listener ระดับ module ตัวเดียว, rollback → ทิ้ง ไม่ค้างไปโดน commit อื่น)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_PENDING = "ttl_cache_pending_invalidations"
+
+
+class TTLCache:
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: float = 30):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Callable[[Hashable], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[1] > now:
+                self._data.move_to_end(key)
+                return hit[0]
+        value = loader(key)
+        self.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def invalidate_after_commit(self, session, keys: Iterable[Hashable]) -> None:
+        """
+        ล้างทันที (กันอ่านค่าเก่าระหว่างรอ commit) แล้วล้างซ้ำหลัง commit
+        (กันผู้อ่านที่โหลดค่าเดิมเข้า cache ระหว่างรอ commit)
+        """
+        keys = list(keys)
+        self.invalidate(keys)
+        session.info.setdefault(_PENDING, {}).setdefault(self, set()).update(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_pending(session) -> None:
+    for cache, keys in session.info.pop(_PENDING, {}).items():
+        cache.invalidate(keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session) -> None:
+    # ข้อมูลไม่เปลี่ยน → ค่าใน cache ยังถูก ไม่ต้องรอ commit ครั้งถัดไป
+    session.info.pop(_PENDING, None)
@@ -0,0 +1,181 @@
+# app/utils/xlsx_stream.py
+"""
+เขียนไฟล์ .xlsx แบบสตรีม (ไม่ต้องมี openpyxl และไม่ถือทั้งไฟล์ไว้ในหน่วยความจำ)
+- zipfile เขียนลงปลายทางที่ seek ไม่ได้ได้ (ใช้ data descriptor) → ดึง bytes ออกเป็นช่วง ๆ ระหว่างเขียน
+- ข้อความเป็น inline string (ไม่มี sharedStrings ที่ต้องรู้ทั้งไฟล์ก่อน), วันที่เป็นเลข serial + รูปแบบวันที่
+"""
+from __future__ import annotations
+
+import re
+import zipfile
+from datetime import date, datetime
+from typing import Iterable, Iterator, Sequence
+from xml.sax.saxutils import escape
+
+# จำนวนแถวสูงสุดต่อชีตที่ Excel เปิดได้ (รวมหัวตาราง) — เกินนี้ขึ้นชีตถัดไป
+MAX_ROWS = 1_048_576
+
+_EPOCH = datetime(1899, 12, 30)
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_SHEET_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+_SHEET_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+# style 0 = ปกติ, 1 = วันที่+เวลา (yyyy-mm-dd hh:mm), 2 = หัวตารางตัวหนา
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+class _Sink:
+    """ปลายทางของ zipfile ที่ seek ไม่ได้ — สะสม bytes ไว้ให้ drain() ดึงออกไปส่ง"""
+
+    def __init__(self):
+        self._parts: list = []
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _col(i: int) -> str:
+    name = ""
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def _cell(ref: str, value, header: bool = False) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        return f'<c r="{ref}" s="1"><v>{(value.replace(tzinfo=None) - _EPOCH).total_seconds() / 86400:.6f}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{ref}" s="1"><v>{(datetime(value.year, value.month, value.day) - _EPOCH).days}</v></c>'
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    style = ' s="2"' if header else ""
+    return f'<c r="{ref}" t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _sheet_title(sheet_name: str, index: int) -> str:
+    """ชื่อชีตที่ index (1 = ชื่อเดิม, ถัดไป "ชื่อ (2)" ...) ไม่เกิน 31 ตัวอักษรตามข้อจำกัดของ Excel"""
+    suffix = f" ({index})" if index > 1 else ""
+    return sheet_name[:31 - len(suffix)] + suffix
+
+
+def _workbook_parts(sheet_name: str, sheets: int) -> dict:
+    """workbook.xml / rels / content types — เขียนท้ายไฟล์เมื่อรู้จำนวนชีตแล้ว"""
+    ids = range(1, sheets + 1)
+    return {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" ContentType="{_SHEET_TYPE}"/>'
+                      for i in ids)
+            + '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            '</Types>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(f'<Relationship Id="rId{i}" Type="{_SHEET_REL}" Target="worksheets/sheet{i}.xml"/>'
+                      for i in ids)
+            + f'<Relationship Id="rId{sheets + 1}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ),
+        "xl/workbook.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(f'<sheet name="{escape(_sheet_title(sheet_name, i))}" sheetId="{i}" r:id="rId{i}"/>'
+                      for i in ids)
+            + '</sheets></workbook>'
+        ),
+    }
+
+
+def xlsx_chunks(header: Sequence[str], rows: Iterable[Sequence], sheet_name: str = "Sheet1",
+                chunk_rows: int = 1000) -> Iterator[bytes]:
+    """
+    สตรีมไฟล์ xlsx: ส่วนหัวของไฟล์ออกไปก่อนทันที แล้วตามด้วยข้อมูลทุก ๆ chunk_rows แถว
+    - rows: ลำดับค่าตามคอลัมน์ของ header (str / ตัวเลข / date / datetime / None)
+    - ชีตเต็ม MAX_ROWS แถว (ข้อจำกัดของ Excel) → ขึ้นชีตใหม่พร้อมหัวตาราง ไม่ตัดแถวทิ้ง
+    """
+    refs = [_col(i) for i in range(len(header))]
+    header_xml = "".join(_cell(f"{c}1", h, header=True) for c, h in zip(refs, header))
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/styles.xml", _STYLES)
+        yield sink.drain()  # ✅ first byte ออกไปก่อนเริ่ม query
+
+        def open_sheet(index: int):
+            sheet = zf.open(f"xl/worksheets/sheet{index}.xml", "w")
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/>'
+                f'</sheetView></sheetViews><sheetData><row r="1">{header_xml}</row>'
+            ).encode("utf-8"))
+            return sheet
+
+        sheets = 1
+        sheet = open_sheet(sheets)
+        buf, n = [], 1
+        for row in rows:
+            if n >= MAX_ROWS:
+                sheet.write(("".join(buf) + "</sheetData></worksheet>").encode("utf-8"))
+                sheet.close()
+                sheets += 1
+                sheet = open_sheet(sheets)
+                buf, n = [], 1
+            n += 1
+            buf.append(f'<row r="{n}">' + "".join(_cell(f"{c}{n}", v) for c, v in zip(refs, row)) + "</row>")
+            if len(buf) >= chunk_rows:
+                sheet.write("".join(buf).encode("utf-8"))
+                buf = []
+                yield sink.drain()
+        sheet.write(("".join(buf) + "</sheetData></worksheet>").encode("utf-8"))
+        sheet.close()
+
+        for name, xml in _workbook_parts(sheet_name, sheets).items():
+            zf.writestr(name, xml)
+    yield sink.drain()
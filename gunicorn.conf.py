@@ -0,0 +1,11 @@
+# gunicorn.conf.py — gunicorn อ่านไฟล์นี้เองเมื่อรันจากโฟลเดอร์โปรเจกต์ (gunicorn main:app)
+import os
+
+# ✅ SSE (/api/notifications/stream) ถือ connection ไว้จนครบ NOTIFY_STREAM_MAX_SECONDS
+#    → ต้องใช้ worker แบบ thread; sync worker จะถูกแท็บที่เปิดค้างกินจนไม่เหลือรับ request อื่น
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# thread ต่อ worker ต้องมากกว่า NOTIFY_STREAM_MAX_SUBSCRIBERS (stream เต็มแล้วยังเหลือ thread ให้หน้าเว็บ)
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
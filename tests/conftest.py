@@ -1,6 +1,36 @@
 # tests/conftest.py
 import os
 import sys
+import tempfile
+
+import pytest
+
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
-    sys.path.insert(0, ROOT)
\ No newline at end of file
+    sys.path.insert(0, ROOT)
+
+# ใช้ฐานข้อมูลชั่วคราวระหว่างเทส (ไม่แตะ app.db ของโปรเจกต์)
+_TMP_DB = os.path.join(tempfile.mkdtemp(prefix="siet-tests-"), "test.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_TMP_DB}")
+
+
+@pytest.fixture
+def db_session():
+    """สร้าง schema ใหม่ทุกเทส แล้วคืน session ที่ผูกกับฐานข้อมูลชั่วคราว"""
+    from sqlalchemy import text
+    from app.db.db import Base, engine, SessionLocal
+    from app.db.migrations import run_migrations
+    import app.db.models  # noqa: F401
+
+    Base.metadata.drop_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS equipment_search"))  # ตาราง FTS ไม่อยู่ใน metadata
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        run_migrations(conn)  # ให้ schema ตรงกับ create_app (ดัชนีค้นหา ฯลฯ)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        SessionLocal.remove()
@@ -0,0 +1,613 @@
+# tests/test_equipment.py
+from app.db import models as M
+from app.repositories.equipment_repository import EquipmentRepository
+from app.repositories.lend_device_repository import LendDeviceRepository
+
+
+def _seed_catalog(db, n=3):
+    """สร้างผู้ใช้ 1 คน + อุปกรณ์ n ชิ้น คืน (user, [equipment])"""
+    user = M.User(name="admin", email="a@example.com", password_hash="x", role="admin")
+    db.add(user)
+    db.flush()
+    items = []
+    for i in range(n):
+        eq = M.Equipment(name=f"Item {i}", code=f"EQ-{i}", category="tool", status="available")
+        db.add(eq)
+        items.append(eq)
+    db.flush()
+    db.commit()
+    return user, items
+
+
+def test_soft_deleted_equipment_is_hidden_from_catalog(db_session):
+    _, items = _seed_catalog(db_session)
+    repo = EquipmentRepository(db_session)
+    repo.soft_delete_equipment(items[1])
+    repo.commit()
+
+    assert {e.equipment_id for e in repo.list()} == {items[0].equipment_id, items[2].equipment_id}
+    assert repo.get(items[1].equipment_id) is None
+    assert repo.get(items[0].equipment_id) is not None
+    assert {e["equipment_id"] for e in LendDeviceRepository().get_all_equipments_with_images()} == {
+        items[0].equipment_id, items[2].equipment_id,
+    }
+
+
+def test_deleted_at_migration_backfills_from_movement_history():
+    from sqlalchemy import create_engine, text
+    from app.db.migrations import ensure_equipment_deleted_at
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE equipments (equipment_id INTEGER PRIMARY KEY, name VARCHAR, code VARCHAR)"))
+        conn.execute(text(
+            "CREATE TABLE stock_movements (movement_id INTEGER PRIMARY KEY, equipment_id INTEGER, "
+            "history TEXT, actor_id INTEGER, created_at DATETIME)"
+        ))
+        conn.execute(text("INSERT INTO equipments VALUES (1, 'a', 'A'), (2, 'b', 'B')"))
+        conn.execute(text(
+            "INSERT INTO stock_movements (equipment_id, history, actor_id, created_at) VALUES "
+            "(1, 'แก้ไขอุปกรณ์', 1, '2025-01-01 08:00:00'), "
+            "(2, '[deleted] legacy', 1, '2025-01-02 08:00:00'), "
+            "(2, '[DELETED] อุปกรณ์ ''b'' ถูกลบ', 1, '2025-01-03 08:00:00')"
+        ))
+
+        assert ensure_equipment_deleted_at(conn) is True
+        rows = conn.execute(text("SELECT equipment_id, deleted_at FROM equipments ORDER BY 1")).all()
+        assert rows == [(1, None), (2, "2025-01-02 08:00:00")]
+        assert ensure_equipment_deleted_at(conn) is False
+
+
+def test_service_writes_typed_movements_and_pages_timeline(db_session):
+    from app.services.equipment_service import EquipmentService
+
+    user, _ = _seed_catalog(db_session, n=0)
+    svc = EquipmentService(EquipmentRepository(db_session))
+    fields = dict(category="tool", brand="B", detail="", buy_date=None, status="available", confirm=False)
+    ok, _, eq = svc.create(name="Drill", code="DR-1", actor_id=user.user_id, **fields)
+    assert ok
+    svc.update(eq.equipment_id, name="Drill Pro", code="DR-1", actor_id=user.user_id, **fields)
+    svc.soft_delete(eq.equipment_id, actor_id=user.user_id)
+
+    page1, cursor = svc.movement_timeline(eq.equipment_id, limit=2)
+    assert [m.event_type for m in page1] == ["deleted", "updated"]
+    assert page1[1].changes == {"name": ["Drill", "Drill Pro"]}
+    assert page1[1].actor_name == "admin"
+
+    page2, cursor2 = svc.movement_timeline(eq.equipment_id, limit=2, cursor=cursor)
+    assert [m.event_type for m in page2] == ["added"]
+    assert page2[0].changes["code"] == [None, "DR-1"]
+    assert cursor2 is None
+
+    only_updates, _ = svc.movement_timeline(eq.equipment_id, event_type="updated")
+    assert [m.movement_id for m in only_updates] == [page1[1].movement_id]
+
+
+def test_movement_event_migration_backfills_from_history_prefix():
+    from sqlalchemy import create_engine, text
+    from app.db.migrations import ensure_stock_movement_events
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE stock_movements (movement_id INTEGER PRIMARY KEY, equipment_id INTEGER, "
+            "history TEXT, actor_id INTEGER, created_at DATETIME)"
+        ))
+        conn.execute(text(
+            "INSERT INTO stock_movements (equipment_id, history, actor_id) VALUES "
+            "(1, '[ADDED] เพิ่ม', 1), (1, '[UPDATED] แก้ไข', 1), (1, '[DELETED] ลบ', 1), (1, 'ย้ายชั้นวาง', 1)"
+        ))
+        assert ensure_stock_movement_events(conn) is True
+        events = conn.execute(text("SELECT event_type FROM stock_movements ORDER BY movement_id")).scalars().all()
+        assert events == ["added", "updated", "deleted", "other"]
+        assert ensure_stock_movement_events(conn) is False
+
+
+def _groups_by_name():
+    from app.services.lend_device_service import get_grouped_equipments_separated
+
+    grouped = get_grouped_equipments_separated()
+    return {g["name"]: g for g in grouped["available"] + grouped["unavailable"]}
+
+
+def test_equipment_groups_follow_create_lend_return_and_delete(db_session):
+    from datetime import datetime, timedelta
+    from flask import Flask
+    from app.repositories.lend_repository import insert_rent_record
+    from app.services.admin_return_service import AdminReturnService
+    from app.services.equipment_service import EquipmentService
+
+    user, _ = _seed_catalog(db_session, n=0)
+    db_session.add(M.StatusRent(status_id=2, name="approved"))
+    db_session.commit()
+    svc = EquipmentService(EquipmentRepository(db_session))
+    fields = dict(category="tool", brand="B", detail="", buy_date=None, status="available", confirm=False)
+    ids = [svc.create(name="Drill", code=f"DR-{i}", actor_id=user.user_id, **fields)[2].equipment_id
+           for i in range(3)]
+    svc.create(name="Saw", code="SW-1", actor_id=user.user_id, **fields)
+
+    g = _groups_by_name()
+    assert (g["Drill"]["amount"], g["Drill"]["total"], g["Drill"]["codes"]) == (3, 3, ["DR-0", "DR-1", "DR-2"])
+    assert g["Drill"]["equipment_id"] == ids[0]
+    assert g["Drill"]["image"] == "images/placeholder.png"
+
+    # ยืม 1 ชิ้น → ว่างลด
+    now = datetime.now()
+    assert insert_rent_record({
+        "equipment_id": ids[1], "user_id": user.user_id, "start_date": now,
+        "due_date": now + timedelta(days=2), "status_id": 2, "created_at": now,
+    })["status"] == "success"
+    g = _groups_by_name()
+    assert (g["Drill"]["amount"], g["Drill"]["codes"]) == (2, ["DR-0", "DR-2"])
+
+    # คืน (admin ยืนยัน) → กลับมาว่าง
+    rent_id = db_session.query(M.RentReturn.rent_id).scalar()
+    with Flask(__name__).test_request_context():
+        assert AdminReturnService().confirm_return(rent_id)["status"] == "success"
+    assert _groups_by_name()["Drill"]["amount"] == 3
+
+    # ลบ → กลุ่มลดจำนวน / กลุ่มที่ไม่เหลือชิ้นใดหายไป
+    with Flask(__name__).app_context():
+        svc.soft_delete(ids[0], actor_id=user.user_id)
+        saw = db_session.query(M.Equipment).filter_by(name="Saw").one()
+        svc.soft_delete(saw.equipment_id, actor_id=user.user_id)
+    g = _groups_by_name()
+    assert set(g) == {"Drill"}
+    assert (g["Drill"]["total"], g["Drill"]["equipment_id"]) == (2, ids[1])
+
+
+def test_equipment_groups_migration_builds_from_existing_rows(db_session):
+    from app.db.db import engine
+    from app.db.migrations import ensure_equipment_groups
+
+    _seed_catalog(db_session, n=2)
+    db_session.query(M.EquipmentGroup).delete()
+    db_session.commit()
+    with engine.begin() as conn:
+        assert ensure_equipment_groups(conn) is True
+        assert ensure_equipment_groups(conn) is False
+    assert {g.name: g.total for g in db_session.query(M.EquipmentGroup)} == {"Item 0": 1, "Item 1": 1}
+
+
+def test_group_detail_resolves_any_member_and_is_invalidated_on_write(db_session):
+    from app.services.equipment_service import EquipmentService
+    from app.services.lend_device_service import get_equipment_group_detail
+
+    user, _ = _seed_catalog(db_session, n=0)
+    svc = EquipmentService(EquipmentRepository(db_session))
+    fields = dict(category="tool", brand="B", detail="", buy_date=None, status="available", confirm=False)
+    first = svc.create(name="Drill", code="DR-0", actor_id=user.user_id, **fields)[2].equipment_id
+    second = svc.create(name="Drill", code="DR-1", actor_id=user.user_id, **fields)[2].equipment_id
+
+    item = get_equipment_group_detail(second)  # ชิ้นไหนในกลุ่มก็ได้
+    assert (item["equipment_id"], item["amount"], item["codes"]) == (first, 2, ["DR-0", "DR-1"])
+    assert get_equipment_group_detail(999) is None
+
+    svc.update(second, name="Drill", code="DR-1", actor_id=user.user_id,
+               **dict(fields, status="unavailable"))
+    assert get_equipment_group_detail(first)["amount"] == 1  # cache ถูกล้างตอนแก้ไข
+
+
+def test_search_is_ranked_matches_thai_substrings_and_follows_writes(db_session):
+    from sqlalchemy import event, text
+    from app.services.equipment_service import EquipmentService
+
+    user, _ = _seed_catalog(db_session, n=0)
+    svc = EquipmentService(EquipmentRepository(db_session))
+    fields = dict(category="tool", buy_date=None, status="available", confirm=False)
+    drill = svc.create(name="สว่านไฟฟ้า", code="DR-1", brand="Bosch", detail="", actor_id=user.user_id, **fields)[2]
+    svc.create(name="ดอกสว่าน", code="BT-1", brand="Makita", detail="", actor_id=user.user_id, **fields)
+    svc.create(name="ค้อน", code="HM-1", brand="Stanley", detail="ใช้คู่กับสว่าน", actor_id=user.user_id, **fields)
+
+    # ค้นกลางคำภาษาไทยได้ + ชื่อที่ขึ้นต้นด้วยคำค้นมาก่อน + detail ได้อันดับท้าย
+    items, total = svc.search("สว่าน")
+    assert total == 3
+    assert [e.name for e in items] == ["สว่านไฟฟ้า", "ดอกสว่าน", "ค้อน"]
+    assert [e.name for e in svc.search("สว่าน", per_page=1, page=2)[0]] == ["ดอกสว่าน"]
+    assert [e.code for e in svc.search("bosch dr")[0]] == ["DR-1"]  # หลายคำ + คำสั้น
+
+    # แก้ไข / ลบ → ดัชนีตาม
+    svc.update(drill.equipment_id, name="เลื่อย", code="DR-1", brand="Bosch", detail="", actor_id=user.user_id,
+               **fields)
+    assert svc.search("ไฟฟ้า") == ([], 0)
+    assert [e.equipment_id for e in svc.search("เลื่อย")[0]] == [drill.equipment_id]
+    svc.soft_delete(drill.equipment_id, actor_id=user.user_id)
+    assert svc.search("bosch") == ([], 0)
+
+    # autocomplete บนแคตตาล็อกใหญ่
+    db_session.execute(M.Equipment.__table__.insert(), [
+        {"name": f"อุปกรณ์ {i:05d}", "code": f"AC-{i:05d}", "category": "bulk", "status": "available"}
+        for i in range(20000)
+    ])
+    db_session.execute(text(
+        "INSERT INTO equipment_search (rowid, name, code, brand, category, detail) "
+        "SELECT equipment_id, name, code, brand, category, detail FROM equipments WHERE category = 'bulk'"
+    ))
+    db_session.commit()
+    executed = []
+    capture = lambda conn, cursor, statement, params, *_: executed.append((statement, params))  # noqa: E731
+    event.listen(db_session.bind, "before_cursor_execute", capture)
+    try:
+        rows = svc.suggest("AC-1234")
+    finally:
+        event.remove(db_session.bind, "before_cursor_execute", capture)
+    # ตัดผู้สมัครด้วย FTS (MATCH บน virtual table) ไม่ใช่ไล่ทั้งตาราง
+    (statement, params), = executed
+    plan = " ".join(r[3] for r in db_session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params))
+    assert "VIRTUAL TABLE INDEX" in plan and ":M" in plan, plan
+    assert [r["code"] for r in rows] == [f"AC-1234{d}" for d in range(10)]
+    assert [r["name"] for r in svc.suggest("ดอ")] == ["ดอกสว่าน"]
+
+    # ชื่อที่ตรงที่สุดถูกเพิ่มทีหลัง (rowid สูง) ก็ยังได้อันดับแรก — เรียงก่อน LIMIT ใน DB
+    exact = M.Equipment(name="อุปกรณ์", code="AC-X", category="bulk", status="available")
+    db_session.add(exact)
+    db_session.flush()
+    db_session.execute(text("INSERT INTO equipment_search (rowid, name, code) VALUES (:id, 'อุปกรณ์', 'AC-X')"),
+                       {"id": exact.equipment_id})
+    db_session.commit()
+    top = svc.suggest("อุปกรณ์", limit=3)
+    assert [r["name"] for r in top] == ["อุปกรณ์", "อุปกรณ์ 00000", "อุปกรณ์ 00001"]
+    assert svc.suggest("อุปกรณ์", limit=3) == top
+
+
+def test_admin_list_pages_by_keyset_in_both_directions(db_session, monkeypatch):
+    from datetime import datetime
+    from app.config import Config
+    from app.repositories.equipment_search_repository import EquipmentSearchRepository
+    from app.services.equipment_service import EquipmentService
+
+    same_time = datetime(2025, 1, 1, 8, 0)  # เวลาซ้ำกัน → ต้องใช้ equipment_id ตัดสิน
+    rows = [M.Equipment(name=f"สว่าน {i}" if i % 2 else f"ค้อน {i}", code=f"EQ-{i}",
+                        category="tool" if i < 5 else "power", status="available", created_at=same_time)
+            for i in range(7)]
+    db_session.add_all(rows)
+    db_session.flush()
+    EquipmentSearchRepository(db_session).index(rows)
+    db_session.commit()
+    svc = EquipmentService(EquipmentRepository(db_session))
+    ids = [e.equipment_id for e in sorted(rows, key=lambda e: -e.equipment_id)]  # ใหม่ → เก่า
+
+    p1 = svc.list_page(limit=3)
+    p2 = svc.list_page(cursor=p1.next_cursor, limit=3)
+    p3 = svc.list_page(cursor=p2.next_cursor, limit=3)
+    assert [[e.equipment_id for e in p.items] for p in (p1, p2, p3)] == [ids[:3], ids[3:6], ids[6:]]
+    assert (p1.prev_cursor, p3.next_cursor) == (None, None)
+    assert (p1.total, p1.total_is_capped) == (7, False)
+
+    back = svc.list_page(cursor=p3.prev_cursor, direction="prev", limit=3)
+    assert [e.equipment_id for e in back.items] == ids[3:6]
+    first = svc.list_page(cursor=back.prev_cursor, direction="prev", limit=3)
+    assert [e.equipment_id for e in first.items] == ids[:3] and first.prev_cursor is None
+
+    drills = svc.list_page(q="สว่าน", category="tool", limit=10)
+    assert sorted(e.name for e in drills.items) == ["สว่าน 1", "สว่าน 3"]
+
+    monkeypatch.setattr(Config, "EQUIPMENT_COUNT_CAP", 5)
+    assert (svc.list_page(limit=3).total, svc.list_page(limit=3).total_is_capped) == (5, True)
+
+
+def test_admin_list_pages_across_backfilled_created_at(db_session):
+    from sqlalchemy import text
+    from app.db.migrations import ensure_equipment_list_indexes
+    from app.services.equipment_service import EquipmentService
+
+    _, items = _seed_catalog(db_session, n=5)
+    ids = [e.equipment_id for e in items]
+    conn = db_session.connection()
+    # แถวเก่าที่เขียนด้วย SQL ตรง ๆ (CURRENT_TIMESTAMP ไม่มีเศษวินาที) + แถวที่ยังไม่มี created_at
+    conn.execute(text("UPDATE equipments SET created_at = CURRENT_TIMESTAMP WHERE equipment_id IN (:a, :b, :c)"),
+                 {"a": ids[0], "b": ids[1], "c": ids[2]})
+    conn.execute(text("UPDATE equipments SET created_at = NULL WHERE equipment_id = :d"), {"d": ids[3]})
+    assert ensure_equipment_list_indexes(conn) is True
+    assert ensure_equipment_list_indexes(conn) is False
+    db_session.commit()
+    db_session.expire_all()
+
+    svc = EquipmentService(EquipmentRepository(db_session))
+    seen, cursor = [], None
+    for _ in range(len(ids) + 1):
+        page = svc.list_page(cursor=cursor, limit=1)
+        seen += [e.equipment_id for e in page.items]
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert sorted(seen) == sorted(ids) and len(seen) == len(ids)  # ไม่ซ้ำ / ไม่วน
+
+
+def test_equipment_api_pages_filters_streams_and_revalidates(db_session):
+    import json
+    from flask import Flask
+    from app.blueprints.inventory.api_equipment import api_equipment_bp
+    from app.services.equipment_service import EquipmentService
+
+    user, items = _seed_catalog(db_session, n=5)
+    items[4].status = "unavailable"
+    db_session.commit()
+    app = Flask(__name__)
+    app.register_blueprint(api_equipment_bp)
+    c = app.test_client()
+
+    r1 = c.get("/api/equipments/?limit=2&fields=id,code")
+    body = r1.get_json()
+    assert body["items"] == [{"id": items[0].equipment_id, "code": "EQ-0"},
+                             {"id": items[1].equipment_id, "code": "EQ-1"}]
+    rest = c.get(f"/api/equipments/?limit=10&fields=code&status=available&cursor={body['next_cursor']}").get_json()
+    assert rest == {"items": [{"code": "EQ-2"}, {"code": "EQ-3"}], "next_cursor": None}
+    assert c.get("/api/equipments/?fields=id,password").status_code == 400
+
+    nd = c.get("/api/equipments/?format=ndjson&fields=code,buy_date")
+    assert nd.mimetype == "application/x-ndjson"
+    assert [json.loads(line) for line in nd.get_data(as_text=True).splitlines()] == [
+        {"code": f"EQ-{i}", "buy_date": None} for i in range(5)
+    ]
+
+    # ETag: ไม่เปลี่ยน → 304 / แก้ไขหรือลบ → ได้ข้อมูลใหม่
+    etag = r1.headers["ETag"]
+    assert c.get("/api/equipments/?limit=2&fields=id,code", headers={"If-None-Match": etag}).status_code == 304
+    svc = EquipmentService(EquipmentRepository(db_session))
+    svc.update(items[3].equipment_id, name="Item 3", code="EQ-3b", category="tool", brand="", detail="",
+               buy_date=None, status="available", confirm=False, actor_id=user.user_id)
+    r2 = c.get("/api/equipments/?limit=2&fields=id,code", headers={"If-None-Match": etag})
+    assert r2.status_code == 200 and r2.headers["ETag"] != etag
+    svc.soft_delete(items[0].equipment_id, actor_id=user.user_id)
+    assert c.get("/api/equipments/?limit=2&fields=id,code",
+                 headers={"If-None-Match": r2.headers["ETag"]}).status_code == 200
+
+
+def test_bulk_import_reports_bad_rows_and_round_trips_with_export(db_session):
+    import io
+    import time
+    from app.repositories.equipment_search_repository import EquipmentSearchRepository
+    from app.services.equipment_bulk_service import EquipmentBulkService
+
+    user, _ = _seed_catalog(db_session, n=1)  # มี EQ-0 อยู่แล้ว
+    svc = EquipmentBulkService(EquipmentRepository(db_session))
+    csv_text = (
+        "name,code,category,brand,buy_date,status,confirm\n"
+        "สว่าน,DR-1,tool,Bosch,2025-01-02,available,yes\n"
+        "สว่าน,DR-2,tool,Bosch,,available,\n"
+        ",NO-NAME,tool,,,,\n"
+        "ค้อน,DR-1,tool,,,,\n"
+        "ค้อน,EQ-0,tool,,,,\n"
+        "ค้อน,HM-1,tool,,2025-13-40,,\n"
+    )
+    dry = svc.import_rows(svc.parse(io.BytesIO(csv_text.encode()), "csv"), actor_id=user.user_id, dry_run=True)
+    assert (dry.received, dry.inserted, db_session.query(M.Equipment).count()) == (6, 0, 1)
+
+    report = svc.import_rows(svc.parse(io.BytesIO(csv_text.encode()), "csv"), actor_id=user.user_id)
+    assert report.inserted == 2
+    assert [(e["row"], e["code"]) for e in report.errors] == [(3, "NO-NAME"), (4, "DR-1"), (5, "EQ-0"), (6, "HM-1")]
+
+    dr1 = db_session.query(M.Equipment).filter_by(code="DR-1").one()
+    assert (str(dr1.buy_date), dr1.confirm, dr1.brand) == ("2025-01-02", True, "Bosch")
+    mv = db_session.query(M.StockMovement).filter_by(equipment_id=dr1.equipment_id).one()
+    assert mv.event_type == M.MovementEvent.ADDED and mv.changes["code"] == [None, "DR-1"]
+    assert db_session.get(M.EquipmentGroup, "สว่าน").total == 2
+    assert EquipmentSearchRepository(db_session).search("bosch")[1] == 2
+
+    # export → import กลับได้ (รหัสซ้ำทั้งหมด)
+    exported = "".join(EquipmentBulkService.export("jsonl"))
+    again = svc.import_rows(svc.parse(io.StringIO(exported), "jsonl"), actor_id=user.user_id)
+    assert (again.received, again.inserted, len(again.errors)) == (3, 0, 3)
+    assert "".join(EquipmentBulkService.export("csv")).startswith("\ufeffname,code,category")
+
+    # 5,000 แถวในครั้งเดียว
+    rows = ({"name": f"ชุดทดลอง {i % 50}", "code": f"LAB-{i}", "category": "lab"} for i in range(5000))
+    start = time.perf_counter()
+    big = svc.import_rows(rows, actor_id=user.user_id)
+    assert big.inserted == 5000 and not big.errors
+    assert time.perf_counter() - start < 10
+    assert db_session.get(M.EquipmentGroup, "ชุดทดลอง 7").total == 100
+
+
+def test_image_resolver_prefers_generated_variant_and_falls_back_to_original(tmp_path, monkeypatch):
+    from flask import Flask
+    from app.services.image_pipeline import image_pipeline
+    from app.services.image_resolver import ImageResolver
+    from app.services.storage import FileSystemStorage
+
+    monkeypatch.setattr(image_pipeline, "storage", FileSystemStorage(str(tmp_path)))
+    (tmp_path / "uploads" / "equipment").mkdir(parents=True)
+    (tmp_path / "uploads" / "equipment" / "abc.jpg").write_bytes(b"x")
+
+    with Flask(__name__).test_request_context():
+        assert ImageResolver.variant_url("uploads/equipment/abc.jpg", "card") == "/static/uploads/equipment/abc.jpg"
+        assert ImageResolver.variant_url("images/placeholder.png", "card") == "/static/images/placeholder.png"
+
+        variant = tmp_path / "uploads" / "equipment" / "variants" / "abc_card.webp"
+        variant.parent.mkdir()
+        variant.write_bytes(b"x")
+        ImageResolver.forget("uploads/equipment/abc.jpg")  # pipeline เรียกหลังสร้างเสร็จ
+        assert ImageResolver.variant_url("uploads/equipment/abc.jpg", "card") == \
+            "/static/uploads/equipment/variants/abc_card.webp"
+        assert ImageResolver.variant_url("uploads/equipment/abc.jpg", "large") == "/static/uploads/equipment/abc.jpg"
+
+
+def test_image_pipeline_builds_webp_variants(tmp_path, monkeypatch):
+    import pytest
+    Image = pytest.importorskip("PIL.Image")
+    from app.services.image_pipeline import ImagePipeline
+    from app.services.storage import FileSystemStorage
+
+    pipeline = ImagePipeline(sizes={"thumb": 64, "card": 256}, storage=FileSystemStorage(str(tmp_path)))
+    src = tmp_path / "uploads" / "equipment" / "phone.jpg"
+    src.parent.mkdir(parents=True)
+    Image.new("RGB", (2000, 1000), "red").save(src)
+
+    stats = pipeline.backfill(["uploads/equipment/phone.jpg", "images/theme.png"])
+    assert stats == {"images": 1, "variants": 2, "failed": 0}
+    with Image.open(tmp_path / "uploads/equipment/variants/phone_card.webp") as im:
+        assert (im.format, im.size) == ("WEBP", (256, 128))
+    assert pipeline.process("uploads/equipment/phone.jpg") == []  # ใหม่กว่าต้นฉบับแล้ว → ข้าม
+    pipeline.shutdown()
+
+
+def test_image_store_dedups_by_content_and_gc_keeps_referenced_files(db_session, tmp_path, monkeypatch):
+    import io
+    import os
+    from flask import Flask
+    from werkzeug.datastructures import FileStorage
+    from app.services.image_pipeline import image_pipeline
+    from app.services.image_store import IMMUTABLE_MAX_AGE, ImageStore, init_image_store
+    from app.services.storage import FileSystemStorage
+
+    fs = FileSystemStorage(str(tmp_path))
+    monkeypatch.setattr(image_pipeline, "storage", fs)
+    store = ImageStore(storage=fs)
+
+    def upload(data, name):
+        return FileStorage(io.BytesIO(data), filename=name)
+
+    a1 = store.save(upload(b"same-bytes", "front.JPG"))
+    a2 = store.save(upload(b"same-bytes", "copy.jpg"))
+    b = store.save(upload(b"other-bytes", "back.png"))
+    assert a1 == a2 and a1 != b and store.is_immutable(a1)
+    assert sorted(os.listdir(tmp_path / "uploads" / "equipment")) == sorted(
+        [os.path.basename(a1), os.path.basename(b)])
+
+    _, (eq,) = _seed_catalog(db_session, n=1)
+    db_session.add_all([
+        M.EquipmentImage(equipment_id=eq.equipment_id, image_path=a1),
+        M.ItemBrokeImage(item_broke_id=1, image_path=a1),
+    ])
+    db_session.commit()
+    assert (store.refcount(db_session, a1), store.refcount(db_session, b)) == (2, 0)
+
+    # ไฟล์ที่เพิ่งอัปโหลดยังอยู่ใน grace period → ไม่ลบ
+    assert store.gc(db_session, grace_seconds=3600)["removed"] == 0
+    assert store.gc(db_session, grace_seconds=0, dry_run=True)["removed"] == 1
+    assert store.gc(db_session, grace_seconds=0)["removed"] == 1
+    assert os.path.exists(tmp_path / a1) and not os.path.exists(tmp_path / b)
+
+    app = Flask(__name__)
+    init_image_store(app)
+    app.add_url_rule("/static/uploads/equipment/<name>", "upload", lambda name: "x")
+    client = app.test_client()
+    cc = client.get(f"/static/{a1}").cache_control
+    assert (cc.public, cc.max_age, cc.immutable) == (True, IMMUTABLE_MAX_AGE, True)
+    assert client.get("/static/uploads/equipment/legacy.jpg").cache_control.immutable is False
+
+
+def test_image_gc_keeps_bare_filename_references_and_legacy_uploads(db_session, tmp_path, monkeypatch):
+    import os
+    from app.services.image_pipeline import image_pipeline
+    from app.services.image_store import ImageStore
+    from app.services.storage import FileSystemStorage
+
+    fs = FileSystemStorage(str(tmp_path))
+    monkeypatch.setattr(image_pipeline, "storage", fs)
+    store = ImageStore(storage=fs)
+    hashed = f"{'a' * 64}.jpg"
+    for name in (hashed, "legacy.jpg", "orphan-legacy.jpg", f"{'b' * 64}.png"):
+        fs.write(f"uploads/equipment/{name}", b"x")
+
+    _, (eq,) = _seed_catalog(db_session, n=1)
+    db_session.add_all([  # แถวเก่าเก็บแค่ชื่อไฟล์
+        M.EquipmentImage(equipment_id=eq.equipment_id, image_path=hashed),
+        M.EquipmentImage(equipment_id=eq.equipment_id, image_path="legacy.jpg"),
+    ])
+    db_session.commit()
+
+    assert store.gc(db_session, grace_seconds=0)["removed"] == 1  # เฉพาะไฟล์ hash ที่ไม่มีใครอ้าง
+    assert sorted(os.listdir(tmp_path / "uploads" / "equipment")) == sorted(
+        [hashed, "legacy.jpg", "orphan-legacy.jpg"])
+
+
+def test_cover_image_follows_image_writes_and_feeds_history_and_home(db_session, tmp_path, monkeypatch):
+    import io
+    from datetime import datetime
+    from flask import Flask
+    from werkzeug.datastructures import FileStorage
+    from app.repositories.history_repository import RentHistoryRepository
+    from app.repositories.home_repository import HomeRepository
+    from app.services.equipment_service import EquipmentService
+    from app.services.image_pipeline import image_pipeline
+    from app.services.image_resolver import ImageResolver
+    from app.services.image_store import image_store
+    from app.services.storage import FileSystemStorage
+
+    monkeypatch.setattr(image_store, "storage", FileSystemStorage(str(tmp_path)))
+    monkeypatch.setattr(image_pipeline, "submit", lambda *a, **k: None)  # ไฟล์ทดสอบไม่ใช่รูปจริง
+    user, _ = _seed_catalog(db_session, n=0)
+    db_session.add(M.StatusRent(status_id=2, name="approved"))
+    svc = EquipmentService(EquipmentRepository(db_session))
+    fields = dict(category="tool", brand="B", detail="", buy_date=None, status="available", confirm=False)
+
+    _, _, eq = svc.create(name="Drill", code="DR-1", actor_id=user.user_id,
+                          image_file=FileStorage(io.BytesIO(b"first"), filename="a.jpg"), **fields)
+    first = eq.cover_image
+    assert first and first == eq.images[0].image_path
+    db_session.add(M.RentReturn(equipment_id=eq.equipment_id, user_id=user.user_id,
+                                start_date=datetime(2025, 1, 1), due_date=datetime(2025, 1, 2), status_id=2))
+    db_session.commit()
+
+    with Flask(__name__).test_request_context():
+        assert ImageResolver.first_image_for_equipment(db_session, eq.equipment_id) == f"/static/{first}"
+        svc.update(eq.equipment_id, name="Drill", code="DR-1", actor_id=user.user_id,
+                   image_file=FileStorage(io.BytesIO(b"second"), filename="b.jpg"), **fields)
+        assert eq.cover_image != first
+        assert ImageResolver.first_image_for_equipment(db_session, eq.equipment_id) == f"/static/{eq.cover_image}"
+
+    assert RentHistoryRepository(db_session).list_by_user(user.user_id, returned_only=False)[0]["cover_image"] \
+        == eq.cover_image
+    svc.soft_delete(eq.equipment_id, actor_id=user.user_id)
+    assert eq.cover_image is None
+    assert HomeRepository(lambda: db_session).get_top_borrowed()[0].image_path is None
+
+
+def test_cover_image_migration_backfills_first_image():
+    from sqlalchemy import create_engine, text
+    from app.db.migrations import ensure_equipment_cover_image
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE equipments (equipment_id INTEGER PRIMARY KEY, name VARCHAR)"))
+        conn.execute(text(
+            "CREATE TABLE equipment_images (equipment_image_id INTEGER PRIMARY KEY, equipment_id INTEGER, image_path VARCHAR)"
+        ))
+        conn.execute(text("INSERT INTO equipments VALUES (1, 'a'), (2, 'b')"))
+        conn.execute(text("INSERT INTO equipment_images VALUES (7, 1, 'late.jpg'), (3, 1, 'first.jpg')"))
+
+        assert ensure_equipment_cover_image(conn) is True
+        rows = conn.execute(text("SELECT equipment_id, cover_image FROM equipments ORDER BY 1")).all()
+        assert rows == [(1, "first.jpg"), (2, None)]
+        assert ensure_equipment_cover_image(conn) is False
+
+
+def test_cache_invalidation_waits_for_commit_and_is_dropped_on_rollback(db_session):
+    from app.repositories.equipment_group_repository import EquipmentGroupRepository, group_detail_cache
+
+    _seed_catalog(db_session, n=1)
+    repo = EquipmentGroupRepository(db_session)
+
+    repo.refresh(["Camera"])
+    group_detail_cache.set("Camera", "stale")  # ผู้อ่านโหลดค่าเดิมระหว่างรอ commit
+    db_session.rollback()
+    db_session.commit()  # commit อื่นภายหลังไม่ล้างของที่ rollback ไปแล้ว
+    assert group_detail_cache.get("Camera", lambda _k: "reloaded") == "stale"
+
+    repo.refresh(["Camera"])
+    group_detail_cache.set("Camera", "stale")
+    db_session.commit()
+    assert group_detail_cache.get("Camera", lambda _k: "reloaded") == "reloaded"
+    group_detail_cache.clear()
+
+
+def test_refresh_cover_does_not_leave_listeners_after_rollback(db_session):
+    from app.repositories.equipment_repository import cover_image_cache
+
+    _, (eq,) = _seed_catalog(db_session, n=1)
+    repo = EquipmentRepository(db_session)
+    for _ in range(3):
+        repo.refresh_cover(eq)
+        db_session.rollback()
+    assert not db_session.info.get("ttl_cache_pending_invalidations")
+
+    cover_image_cache.set(eq.equipment_id, "stale")
+    db_session.commit()
+    assert cover_image_cache.get(eq.equipment_id, lambda _k: "reloaded") == "stale"
+    repo.refresh_cover(eq)
+    cover_image_cache.set(eq.equipment_id, "stale")
+    db_session.commit()
+    assert cover_image_cache.get(eq.equipment_id, lambda _k: "reloaded") == "reloaded"
+    cover_image_cache.clear()
@@ -0,0 +1,204 @@
+# tests/test_history.py
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.db import models as M
+from app.repositories.history_repository import RentHistoryRepository
+from app.services.history_service import BorrowHistoryService, HistoryFilter
+
+
+def _seed_history(db, users=3, rents_per_user=4):
+    """ผู้ใช้ n คน (นักศึกษา S00x / อาจารย์ EMP) + การยืมคนละหลายรายการ คืน list ของ user"""
+    db.add(M.StatusRent(status_id=2, name="approved", color_code="#0a0"))
+    staff = M.User(name="staff", email="staff@example.com", password_hash="x", employee_id="EMP-9")
+    db.add(staff)
+    eq = M.Equipment(name="Camera", code="CAM-1", status="available")
+    db.add(eq)
+    db.flush()
+
+    people = []
+    base = datetime(2025, 1, 1, 9, 0)
+    for u in range(users):
+        user = M.User(name=f"student {u}", email=f"s{u}@example.com", password_hash="x", student_id=f"S00{u}")
+        db.add(user)
+        db.flush()
+        people.append(user)
+        for i in range(rents_per_user):
+            start = base + timedelta(days=u * rents_per_user + i)
+            db.add(M.RentReturn(
+                equipment_id=eq.equipment_id, user_id=user.user_id, status_id=2,
+                start_date=start, due_date=start + timedelta(days=2),
+                return_date=start + timedelta(days=1) if i % 2 else None,
+                check_by=staff.user_id if i % 2 else None,
+            ))
+    db.commit()
+    return people
+
+
+@contextmanager
+def _count_queries(db):
+    statements = []
+    listener = lambda *args: statements.append(args[2])  # noqa: E731 (conn, cursor, statement, ...)
+    event.listen(db.bind, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(db.bind, "before_cursor_execute", listener)
+
+
+def test_admin_history_pages_all_users_with_one_query_per_page(db_session):
+    _seed_history(db_session)
+    svc = BorrowHistoryService(RentHistoryRepository(db_session))
+
+    seen, cursor = [], None
+    while True:
+        with _count_queries(db_session) as statements:
+            page = svc.admin_page(cursor=cursor, limit=5)
+        assert len(statements) == 1
+        seen += page.items
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    assert len(seen) == 12
+    assert [r["start_date"] for r in seen] == sorted((r["start_date"] for r in seen), reverse=True)
+    assert len({r["rent_id"] for r in seen}) == 12
+    returned = next(r for r in seen if r["return_date"])
+    assert (returned["receiver_name"], returned["user_name"][:7]) == ("staff", "student")
+
+    only = svc.admin_page(identity="s001").items
+    assert {r["student_id"] for r in only} == {"S001"} and len(only) == 4
+    ranged = svc.admin_page(start=datetime(2025, 1, 2), end=datetime(2025, 1, 3, 23, 59)).items
+    assert [r["start_date"].day for r in ranged] == [3, 2]
+
+
+def test_user_history_filters_and_pages_in_sql(db_session):
+    people = _seed_history(db_session, users=2, rents_per_user=5)
+    me = people[1]
+    svc = BorrowHistoryService(RentHistoryRepository(db_session))
+
+    seen, cursor = [], None
+    while True:
+        with _count_queries(db_session) as statements:
+            page = svc.page_for_user(me.user_id, HistoryFilter(returned_only=False), cursor=cursor, limit=2)
+        assert len(statements) == 1
+        seen += page.items
+        cursor = page.next_cursor
+        if not cursor:
+            break
+    assert {r["user_id"] for r in seen} == {me.user_id} and len(seen) == 5
+    assert [r["start_date"].day for r in seen] == [10, 9, 8, 7, 6]
+
+    ranged = svc.page_for_user(me.user_id, HistoryFilter(
+        returned_only=False, order="asc", start_date=datetime(2025, 1, 7), end_date=datetime(2025, 1, 8, 23, 59),
+    )).items
+    assert [r["start_date"].day for r in ranged] == [7, 8]
+
+    # date_field=return_date: ยังไม่คืน → เรียงด้วย start_date, cursor ต่อได้ถูกต้อง
+    f = HistoryFilter(returned_only=False, date_field="return_date")
+    first = svc.page_for_user(me.user_id, f, limit=3)
+    rest = svc.page_for_user(me.user_id, f, cursor=first.next_cursor, limit=3)
+    assert len(first.items) + len(rest.items) == 5
+    assert not {r["rent_id"] for r in first.items} & {r["rent_id"] for r in rest.items}
+    assert [r["rent_id"] for r in svc.get_for_user(me.user_id)] == [r["rent_id"] for r in seen if r["return_date"]]
+
+
+def test_admin_history_identity_prefix_and_streamed_page(db_session, monkeypatch):
+    from app.repositories import history_repository
+
+    _seed_history(db_session, users=3, rents_per_user=4)
+    svc = BorrowHistoryService(RentHistoryRepository(db_session))
+
+    def ids(**kw):
+        return [r["rent_id"] for r in svc.admin_page(limit=100, **kw).items]
+
+    assert {r["student_id"] for r in svc.admin_page(identity="s00").items} == {"S000", "S001", "S002"}
+    assert ids(identity="001") == []  # ขึ้นต้นเท่านั้น (ไม่ใช่ substring)
+    narrow = ids(identity="S00", start=datetime(2025, 1, 3), end=datetime(2025, 1, 9, 23, 59))
+    with _count_queries(db_session) as statements:
+        svc.repo.admin_stmt(identity="S00")  # สร้าง statement อย่างเดียว ไม่มี query แฝง
+    assert statements == []
+    monkeypatch.setattr(history_repository, "_IDENTITY_SEEK_LIMIT", 1)  # บังคับทางไล่ index start_date
+    assert ids(identity="S00", start=datetime(2025, 1, 3), end=datetime(2025, 1, 9, 23, 59)) == narrow
+    assert len(narrow) == 7
+
+    page = svc.admin_stream(identity="s", limit=5)
+    assert page.next_cursor is None  # เติมหลังวนแถวครบ
+    streamed = list(page.items)
+    assert [r["rent_id"] for r in streamed] == ids(identity="s")[:5]
+    rest = svc.admin_stream(identity="s", cursor=page.next_cursor, limit=5)
+    assert len(list(rest.items)) == 5 and rest.next_cursor
+
+
+def test_history_export_streams_csv_and_xlsx_with_admin_filters(db_session):
+    import csv
+    import io
+    import zipfile
+    from xml.etree import ElementTree
+
+    from app.services.history_export_service import COLUMNS, HistoryExportService
+
+    _seed_history(db_session, users=3, rents_per_user=4)
+    svc = HistoryExportService(chunk_size=2)
+
+    chunks = list(svc.export("csv", identity="S001"))
+    assert chunks[0].startswith("\ufeffเลขที่การยืม,ชื่อผู้ใช้,รหัส")  # หัวตารางออกก่อนแถวแรก
+    assert len(chunks) == 4  # หัว + 2 ก้อน ๆ ละ 2 แถว + ท้าย
+    rows = list(csv.reader(io.StringIO("".join(chunks).lstrip("\ufeff"))))[1:]
+    assert [r[2] for r in rows] == ["S001"] * 4
+    assert [r[5] for r in rows] == sorted((r[5] for r in rows), reverse=True)
+
+    data = b"".join(svc.export("xlsx", start=datetime(2025, 1, 2), end=datetime(2025, 1, 3, 23, 59)))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        sheet = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    xml_rows = sheet.findall(".//x:sheetData/x:row", ns)
+    assert len(xml_rows) == 3 and "".join(xml_rows[0].itertext()).startswith(COLUMNS[0][1])
+    assert [c.get("s") for c in xml_rows[1] if c.get("r").startswith("F")] == ["1"]  # วันที่เป็น date cell
+
+    with pytest.raises(ValueError):
+        svc.export("pdf")
+
+
+def test_xlsx_export_continues_on_new_sheets_past_row_limit(monkeypatch):
+    import io
+    import zipfile
+    from xml.etree import ElementTree
+
+    from app.utils import xlsx_stream
+
+    monkeypatch.setattr(xlsx_stream, "MAX_ROWS", 3)  # หัวตาราง + 2 แถวต่อชีต
+    data = b"".join(xlsx_stream.xlsx_chunks(["n"], ([i] for i in range(5)), sheet_name="history", chunk_rows=1))
+
+    ns = {"x": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        names = [s.get("name") for s in ElementTree.fromstring(zf.read("xl/workbook.xml")).iter(f"{{{ns['x']}}}sheet")]
+        assert names == ["history", "history (2)", "history (3)"]
+        rels = zf.read("xl/_rels/workbook.xml.rels").decode()
+        types = zf.read("[Content_Types].xml").decode()
+        values = []
+        for i in (1, 2, 3):
+            assert f"worksheets/sheet{i}.xml" in rels and f"/xl/worksheets/sheet{i}.xml" in types
+            rows = ElementTree.fromstring(zf.read(f"xl/worksheets/sheet{i}.xml")).findall(".//x:row", ns)
+            assert "".join(rows[0].itertext()) == "n"  # ทุกชีตมีหัวตาราง
+            values += [int(r.find("x:c/x:v", ns).text) for r in rows[1:]]
+    assert values == [0, 1, 2, 3, 4]  # ไม่มีแถวหาย
+
+
+def test_identity_prefix_range_is_bytewise_on_postgres():
+    from sqlalchemy.dialects import postgresql, sqlite
+    from sqlalchemy.schema import CreateIndex
+
+    # range >= 's0' AND < 's1' = "ขึ้นต้นด้วย s0" เฉพาะเมื่อเทียบ byte-wise ('s-05' ต้องไม่อยู่ในช่วง)
+    stmt = RentHistoryRepository._identity_users("S0")
+    pg = str(stmt.compile(dialect=postgresql.dialect()))
+    assert pg.count('COLLATE "C"') == 4
+    assert 'COLLATE' not in str(stmt.compile(dialect=sqlite.dialect()))
+    for ix in M.User.__table__.indexes:
+        if ix.name.endswith("_lower"):
+            assert str(CreateIndex(ix).compile(dialect=postgresql.dialect())).endswith('COLLATE "C")')
+            assert "COLLATE" not in str(CreateIndex(ix).compile(dialect=sqlite.dialect()))
@@ -0,0 +1,161 @@
+# tests/test_notification_delivery.py
+import json
+import socketserver
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.db import models as M
+from app.services.notification_channels import EmailChannel, WebhookChannel
+from app.services.notification_delivery_service import NotificationDeliveryService
+
+from tests.test_notifications import _now_th
+
+
+# ---------- sink ภายในเครื่อง (ไม่ส่งออกจริง) ----------
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """SMTP server ขั้นต่ำ: รับ EHLO/MAIL/RCPT/DATA/RSET/NOOP/QUIT แล้วเก็บข้อความไว้"""
+
+    def _reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self._reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self._reply("250 sink")
+            elif cmd.startswith("DATA"):
+                self._reply("354 end with <CRLF>.<CRLF>")
+                body = []
+                while (chunk := self.rfile.readline()) not in (b".\r\n", b""):
+                    body.append(chunk)
+                self.server.messages.append(b"".join(body))
+                self._reply("250 queued")
+            elif cmd.startswith("QUIT"):
+                self._reply("221 bye")
+                return
+            else:  # MAIL / RCPT / RSET / NOOP
+                self._reply("250 ok")
+
+
+class _SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.messages = []
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive → ใช้ connection ซ้ำได้
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append(json.loads(body))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def sinks():
+    smtp = _serve(_SmtpSink())
+    http = ThreadingHTTPServer(("127.0.0.1", 0), _WebhookHandler)
+    http.daemon_threads = True
+    http.received, http.status = [], 200
+    _serve(http)
+    yield smtp, http
+    smtp.shutdown(), smtp.server_close()
+    http.shutdown(), http.server_close()
+
+
+def _seed_outbox(db, channel, count):
+    user = M.User(name="tester", email="t@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    now = _now_th()
+    db.add_all([
+        M.Notification(
+            user_id=user.user_id, channel=channel, template="overdue",
+            payload={"message": f"แจ้งเตือน #{i}"}, send_at=now - timedelta(seconds=1),
+            status="scheduled", created_at=now, dedup_day=now.date(),
+        )
+        for i in range(count)
+    ])
+    db.commit()
+
+
+def _service(smtp, http, **kw):
+    channels = {
+        "email": EmailChannel("127.0.0.1", smtp.server_address[1], "noreply@siet.test",
+                              rate_per_sec=10_000, concurrency=4),
+        "webhook": WebhookChannel(f"http://127.0.0.1:{http.server_address[1]}/hook",
+                                  rate_per_sec=10_000, concurrency=4),
+    }
+    return NotificationDeliveryService(channels, **kw)
+
+
+def test_deliver_pending_sends_email_and_webhook(db_session, sinks):
+    smtp, http = sinks
+    _seed_outbox(db_session, "email", 120)
+    user_id = db_session.query(M.User.user_id).scalar()
+    now = _now_th()
+    db_session.add_all([
+        M.Notification(user_id=user_id, channel="webhook", template="due_now", payload={"message": "hi"},
+                       send_at=now, status="scheduled", created_at=now)
+        for _ in range(80)
+    ])
+    db_session.commit()
+
+    service = _service(smtp, http, batch_size=50)
+    try:
+        report = service.deliver_pending()
+    finally:
+        service.close()
+
+    assert (report.claimed, report.sent, report.retried, report.failed) == (200, 200, 0, 0)
+    assert len(smtp.messages) == 120
+    assert len(http.received) == 80
+    statuses = {s for (s,) in db_session.query(M.Notification.status).distinct()}
+    assert statuses == {"sent"}
+    assert report.per_second > 0  # รายงาน throughput ถูกคำนวณ (ไม่ผูกกับความเร็วเครื่อง)
+
+
+def test_failed_webhook_is_retried_then_marked_failed(db_session, sinks):
+    smtp, http = sinks
+    http.status = 500
+    _seed_outbox(db_session, "webhook", 3)
+
+    service = _service(smtp, http, max_attempts=2)
+    try:
+        first = service.deliver_once()
+        assert (first.claimed, first.retried) == (3, 3)
+        # รอบแรกไม่ผ่าน → กลับเข้าคิวพร้อม backoff (ยังไม่ถึงเวลา จึงไม่ถูก claim ซ้ำทันที)
+        assert service.deliver_once().claimed == 0
+
+        db_session.query(M.Notification).update({"send_at": _now_th() - timedelta(seconds=1)})
+        db_session.commit()
+        second = service.deliver_once()
+        assert (second.claimed, second.failed) == (3, 3)
+    finally:
+        service.close()
+
+    db_session.expire_all()
+    rows = db_session.query(M.Notification).all()
+    assert {(r.status, r.attempts) for r in rows} == {("failed", 2)}
+    assert all("500" in r.last_error for r in rows)
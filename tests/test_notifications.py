@@ -0,0 +1,310 @@
+# tests/test_notifications.py
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.db import models as M
+from app.services.notification_service import NotificationService
+
+THAI_TZ = timezone(timedelta(hours=7))
+
+
+def _now_th():
+    return datetime.now(THAI_TZ).replace(tzinfo=None)
+
+
+def _seed(db):
+    """สร้างผู้ใช้ 1 คน + อุปกรณ์/การยืมหลายแบบ คืน dict ของ rent_id ตามกรณี"""
+    db.add(M.StatusRent(status_id=2, name="approved"))
+    user = M.User(name="tester", email="t@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+
+    now = _now_th()
+    due_soon = now + timedelta(hours=5)
+    cases = {
+        "overdue":      (now - timedelta(days=3), now - timedelta(hours=2), None),
+        "due_now":      (now - timedelta(days=1), now + timedelta(minutes=30), None),
+        "due_tomorrow": (now - timedelta(days=2), due_soon, None),
+        "same_day":     (due_soon.replace(hour=0, minute=0), due_soon, None),
+        "far_future":   (now, now + timedelta(days=5), None),
+        "returned":     (now - timedelta(days=3), now - timedelta(hours=2), now),
+    }
+    ids = {}
+    for i, (key, (start, due, returned)) in enumerate(cases.items()):
+        eq = M.Equipment(name=f"Item {key}", code=f"EQ-{i}", status="unavailable")
+        db.add(eq)
+        db.flush()
+        rent = M.RentReturn(
+            equipment_id=eq.equipment_id, user_id=user.user_id,
+            start_date=start, due_date=due, return_date=returned, status_id=2,
+        )
+        db.add(rent)
+        db.flush()
+        ids[key] = rent.rent_id
+    db.commit()
+    return ids
+
+
+def test_process_due_notifications_classifies_and_dedups(db_session):
+    ids = _seed(db_session)
+
+    report = NotificationService().process_due_notifications()
+    assert report.scanned == 3
+    assert report.created == 3
+
+    rows = db_session.query(M.Notification).all()
+    by_rent = {n.payload["rent_id"]: n.template for n in rows}
+    assert by_rent == {
+        ids["overdue"]: "overdue",
+        ids["due_now"]: "due_now",
+        ids["due_tomorrow"]: "due_tomorrow",
+    }
+    assert all(n.status == "unread" and n.channel == "system" for n in rows)
+
+    # รอบถัดไปในวันเดียวกัน → ไม่สร้างซ้ำ
+    again = NotificationService().process_due_notifications()
+    assert again.scanned == 3
+    assert again.created == 0
+    assert again.skipped == 3
+
+
+def test_bulk_create_relies_on_unique_dedup_key(db_session):
+    from app.repositories.notification_repository import NotificationRepository
+
+    ids = _seed(db_session)
+    now = _now_th()
+    row = {
+        "user_id": 1, "channel": "system", "template": "overdue",
+        "payload": {"rent_id": ids["overdue"], "message": "x"},
+        "send_at": now, "status": "unread", "created_at": now,
+    }
+    repo = NotificationRepository(db_session)
+    assert repo.bulk_create([row]) == 1
+    # process อื่น insert ซ้ำ → DB ข้ามให้เอง ไม่ error
+    assert repo.bulk_create([row, dict(row, template="due_now")]) == 1
+    db_session.commit()
+    assert repo.exists_today(1, ids["overdue"], "overdue")
+    assert not repo.exists_today(1, ids["overdue"], "due_tomorrow")
+
+
+def test_dedup_migration_backfills_legacy_rows():
+    from sqlalchemy import create_engine, text
+    from app.db.migrations import ensure_notification_dedup_key
+
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE notifications (notification_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, "
+            "channel VARCHAR NOT NULL, template VARCHAR, payload JSON, send_at DATETIME NOT NULL, "
+            "status VARCHAR NOT NULL, created_at DATETIME)"
+        ))
+        legacy = "INSERT INTO notifications (user_id, channel, template, payload, send_at, status, created_at) " \
+                 "VALUES (1, 'system', 'overdue', :p, :t, 'unread', :t)"
+        for t in ("2025-01-01 08:00:00", "2025-01-01 09:00:00", "2025-01-02 08:00:00"):
+            conn.execute(text(legacy), {"p": '{"rent_id": 7, "message": "m"}', "t": t})
+
+        assert ensure_notification_dedup_key(conn) is True
+        rows = conn.execute(text(
+            "SELECT rent_id, dedup_day FROM notifications ORDER BY notification_id"
+        )).all()
+        # แถวซ้ำวันเดียวกันถูกปลดออกจากคีย์ (dedup_day = NULL) แต่ไม่ถูกลบ
+        assert rows == [(7, "2025-01-01"), (7, None), (7, "2025-01-02")]
+        assert ensure_notification_dedup_key(conn) is False
+
+
+def test_timer_queue_fires_only_woken_rents(db_session):
+    from app.repositories.notification_timer_repository import NotificationTimerRepository
+
+    ids = _seed(db_session)
+    now = _now_th()
+    timers = NotificationTimerRepository(db_session)
+    rent = db_session.get(M.RentReturn, ids["due_now"])
+    # due อีก 30 นาที → due-24h / due-1h เลยมาแล้ว (ปลุกทันทีครั้งเดียว) + ปลุกอีกครั้งตอน due
+    first = timers.schedule_for_rent(rent.rent_id, rent.due_date, now=now)
+    db_session.commit()
+    assert first == now
+    assert db_session.query(M.NotificationTimer).count() == 2
+
+    report = NotificationService().process_due_timers()
+    assert (report.scanned, report.created) == (1, 1)
+    notif = db_session.query(M.Notification).one()
+    assert (notif.rent_id, notif.template) == (ids["due_now"], "due_now")
+
+    # timer ที่ใช้แล้วถูกลบ เหลือเฉพาะตอนครบกำหนด
+    assert NotificationService().next_timer_at() == rent.due_date + timedelta(seconds=1)
+
+    # คืนของแล้ว → ยกเลิก timer ที่ค้าง
+    timers.cancel_for_rent(rent.rent_id)
+    db_session.commit()
+    assert NotificationService().next_timer_at() is None
+
+
+def test_outbound_email_rows_skip_users_without_email(db_session):
+    from app.services.notification_channels import BaseChannel
+
+    ids = _seed(db_session)
+    rent = db_session.get(M.RentReturn, ids["overdue"])
+    no_mail = M.User(name="no mail", email=" ", password_hash="x")
+    db_session.add(no_mail)
+    db_session.flush()
+    db_session.add(M.RentReturn(equipment_id=rent.equipment_id, user_id=no_mail.user_id, status_id=2,
+                                start_date=rent.start_date, due_date=rent.due_date))
+    db_session.commit()
+
+    report = NotificationService(outbound_channels=["email", "webhook"]).process_due_notifications()
+    assert report.created == 4
+    queued = db_session.query(M.Notification.user_id, M.Notification.channel).filter(
+        M.Notification.channel != "system").all()
+    assert report.queued == len(queued) == 7  # webhook 4 + email 3 (ไม่มีของผู้ใช้ที่ไม่มีอีเมล)
+    assert (no_mail.user_id, "email") not in queued and (no_mail.user_id, "webhook") in queued
+
+    class Incomplete(BaseChannel):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_hub_pushes_new_rows_and_resumes_after_last_id(db_session):
+    from app.services.notification_hub import NotificationHub
+
+    _seed(db_session)
+    user_id = db_session.query(M.User.user_id).scalar()
+    hub = NotificationHub(poll_seconds=30)
+    q = hub.subscribe(user_id)
+    try:
+        report = NotificationService().process_due_notifications()
+        hub.poke()  # (instance ทดสอบแยกจาก notification_hub ของ process)
+        events = [q.get(timeout=5) for _ in range(report.created)]
+        assert {e["id"] for e in events} == {
+            n.notification_id for n in db_session.query(M.Notification).all()
+        }
+        assert q.empty()
+    finally:
+        hub.unsubscribe(user_id, q)
+    assert hub.subscriber_count() == 0
+
+    # reconnect ด้วย Last-Event-ID → ได้เฉพาะแถวที่ใหม่กว่า
+    first_id = min(e["id"] for e in events)
+    resumed = hub.backlog(user_id, after_id=first_id)
+    assert [e["id"] for e in resumed] == sorted(e["id"] for e in events if e["id"] > first_id)
+
+
+def test_stream_ends_after_max_lifetime_and_caps_subscribers(db_session, monkeypatch):
+    from flask import Flask
+    from app.blueprints.notifications import routes
+    from app.config import Config
+    from app.services.notification_hub import NotificationHub
+
+    _seed(db_session)
+    user_id = db_session.query(M.User.user_id).scalar()
+    hub = NotificationHub(poll_seconds=30, max_subscribers=1)
+    monkeypatch.setattr(routes, "notification_hub", hub)
+    monkeypatch.setattr(Config, "NOTIFY_STREAM_MAX_SECONDS", 0.2)
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.register_blueprint(routes.notifications_bp)
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = user_id
+
+    # stream จบเองเมื่อครบอายุ (ไม่ถือ worker ไว้ตลอด) แล้วคืน slot ของ subscriber
+    body = client.get("/api/notifications/stream").get_data(as_text=True)
+    assert body.startswith("retry: ")
+    assert hub.subscriber_count() == 0
+
+    # เต็มแล้ว → 204 ให้หน้าเว็บถอยไป poll
+    held = hub.subscribe(user_id)
+    try:
+        assert hub.subscribe(user_id) is None
+        assert client.get("/api/notifications/stream").status_code == 204
+    finally:
+        hub.unsubscribe(user_id, held)
+
+
+def test_unread_count_cache_and_bulk_mark_read(db_session):
+    from app.repositories.notification_repository import NotificationRepository
+    from app.services.unread_count_cache import UnreadCountCache
+
+    _seed(db_session)
+    NotificationService().process_due_notifications()
+    user_id = db_session.query(M.User.user_id).scalar()
+    repo = NotificationRepository(db_session)
+
+    cache = UnreadCountCache(max_entries=2, ttl_seconds=60)
+    loads = []
+
+    def loader(uid):
+        loads.append(uid)
+        return repo.count_unread(uid)
+
+    assert cache.get(user_id, loader) == 3
+    assert cache.get(user_id, loader) == 3
+    assert loads == [user_id]  # ครั้งที่สองมาจาก cache
+
+    # ปิดเฉพาะ id <= ตัวแรก → UPDATE เดียว แล้วปรับ cache ตามจำนวนที่เปลี่ยนจริง
+    ids = sorted(n.notification_id for n in db_session.query(M.Notification))
+    dismissed = repo.mark_read(user_id, up_to_id=ids[0])
+    db_session.commit()
+    cache.adjust(user_id, -dismissed)
+    assert dismissed == 1
+    assert cache.get(user_id, loader) == repo.count_unread(user_id) == 2
+
+    assert repo.mark_read(user_id) == 2
+    assert repo.count_unread(user_id) == 0
+
+    # LRU จำกัดจำนวนผู้ใช้
+    cache.set(998, 1)
+    cache.set(999, 1)
+    cache.get(user_id, loader)
+    assert loads == [user_id, user_id]
+
+
+def test_retention_compacts_old_finished_rows_in_batches(db_session):
+    from app.services.notification_retention_service import NotificationRetentionService
+
+    user = M.User(name="tester", email="t@example.com", password_hash="x")
+    db_session.add(user)
+    db_session.flush()
+    # เวลาคงที่ตอนเที่ยง: แถว old + 0..5 ชม. อยู่ในวันเดียวกันเสมอ (ไม่ขึ้นกับเวลาที่รันเทส)
+    now = datetime(2025, 6, 15, 12, 0)
+    old = now - timedelta(days=40)
+
+    def add(created_at, status, channel="system", template="overdue"):
+        db_session.add(M.Notification(
+            user_id=user.user_id, channel=channel, template=template, payload={"message": "m"},
+            send_at=created_at, status=status, created_at=created_at,
+        ))
+
+    for h in range(3):
+        add(old + timedelta(hours=h), "read")
+    add(old, "sent", channel="email")
+    add(old - timedelta(days=1), "read", template="due_now")
+    add(old, "unread")                   # ยังไม่อ่าน → เก็บไว้
+    add(now - timedelta(days=1), "read")  # ยังไม่เก่าพอ → เก็บไว้
+    db_session.commit()
+
+    service = NotificationRetentionService(retention_days=30, mode="archive", batch_size=2)
+    report = service.run(now=now)
+    assert (report.summarized, report.archived, report.deleted, report.batches) == (5, 5, 5, 3)
+    assert {n.status for n in db_session.query(M.Notification)} == {"unread", "read"}
+    assert db_session.query(M.Notification).count() == 2
+
+    summary = {
+        (s.day, s.channel, s.template): s.count
+        for s in db_session.query(M.NotificationDailySummary)
+    }
+    assert summary == {
+        (old.date(), "system", "overdue"): 3,
+        (old.date(), "email", "overdue"): 1,
+        ((old - timedelta(days=1)).date(), "system", "due_now"): 1,
+    }
+
+    # รอบถัดไป: แถวของวันเดิมบวกเข้า summary เดิม
+    add(old + timedelta(hours=5), "read")
+    db_session.commit()
+    assert NotificationRetentionService(retention_days=30).run(now=now).deleted == 1
+    db_session.expire_all()
+    row = db_session.get(M.NotificationDailySummary, (user.user_id, old.date(), "system", "overdue"))
+    assert (row.count, row.first_at, row.last_at) == (4, old, old + timedelta(hours=5))
@@ -0,0 +1,32 @@
+# tests/test_scheduler_lease.py
+from datetime import datetime, timedelta
+
+from app.repositories.scheduler_lease_repository import SchedulerLeaseRepository
+from app.scheduler.leader import LeaderLease
+
+
+def test_only_one_leader_and_takeover_after_expiry(db_session):
+    a = LeaderLease("job", ttl_seconds=60)
+    b = LeaderLease("job", ttl_seconds=60)
+
+    assert a.heartbeat() is True
+    assert b.heartbeat() is False
+    assert a.heartbeat() is True          # ต่ออายุของตัวเองได้
+    assert a.status()["leader"] == a.holder
+
+    # leader ตาย (ไม่ต่ออายุ) → หลังหมดอายุ process อื่นรับช่วง
+    later = datetime.utcnow() + timedelta(seconds=61)
+    repo = SchedulerLeaseRepository(db_session)
+    assert repo.try_acquire("job", b.holder, 60, now=later) is True
+    db_session.commit()
+    assert repo.try_acquire("job", a.holder, 60, now=later) is False
+
+
+def test_release_hands_over_immediately(db_session):
+    a = LeaderLease("job", ttl_seconds=60)
+    b = LeaderLease("job", ttl_seconds=60)
+    assert a.heartbeat()
+    a.release()
+    assert not a.is_leader
+    assert b.heartbeat() is True
+    assert b.status()["is_self"] is True
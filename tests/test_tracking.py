@@ -0,0 +1,48 @@
+# tests/test_tracking.py
+from datetime import datetime, timedelta
+
+from app.db import models as M
+from app.repositories.trackstatus_repository import TrackStatusRepository
+from app.services.trackstatus_service import ACTIVE_STATUSES
+
+
+def test_track_status_queries_are_scoped_to_one_user(db_session):
+    db_session.add_all([
+        M.StatusRent(status_id=1, name="Approved", color_code="#0a0"),
+        M.StatusRent(status_id=2, name="completed", color_code="#999"),
+    ])
+    teacher = M.User(name="teacher", email="t@example.com", password_hash="x", employee_id="EMP-1")
+    me = M.User(name="me", email="me@example.com", password_hash="x", student_id="S1", phone="0800000000")
+    other = M.User(name="other", email="o@example.com", password_hash="x", student_id="S2")
+    eq = M.Equipment(name="Camera", code="CAM-1", status="available", cover_image="uploads/equipment/cam.webp")
+    db_session.add_all([teacher, me, other, eq])
+    db_session.flush()
+
+    start = datetime(2025, 1, 1, 9, 0)
+
+    def rent(user, status_id, returned):
+        r = M.RentReturn(equipment_id=eq.equipment_id, user_id=user.user_id, status_id=status_id,
+                         start_date=start, due_date=start + timedelta(days=2), reason="lab",
+                         teacher_confirmed=teacher.user_id,
+                         return_date=start + timedelta(days=1) if returned else None)
+        db_session.add(r)
+        db_session.flush()
+        return r
+
+    borrowing = rent(me, 1, returned=False)
+    approved_returned = rent(me, 1, returned=True)
+    done = rent(me, 2, returned=True)           # คืนแล้ว + สถานะจบ → ไม่แสดง
+    theirs = rent(other, 1, returned=False)
+    db_session.commit()
+
+    repo = TrackStatusRepository(db_session)
+    active = repo.list_active_for_user(me.user_id, ACTIVE_STATUSES)
+    assert [r["rent_id"] for r in active] == [borrowing.rent_id, approved_returned.rent_id]
+    assert active[0]["status_name"] == "Approved" and active[0]["equipment_code"] == "CAM-1"
+
+    assert [r["rent_id"] for r in repo.list_details_for_user(me.user_id)] == \
+        [borrowing.rent_id, approved_returned.rent_id, done.rent_id]
+    detail = repo.get_detail_for_user(me.user_id, borrowing.rent_id)
+    assert (detail["image_path"], detail["teacher_name"], detail["full_name"], detail["phone_number"]) == \
+        ("uploads/equipment/cam.webp", "teacher", "me", "0800000000")
+    assert repo.get_detail_for_user(me.user_id, theirs.rent_id) is None  # รายการของคนอื่น